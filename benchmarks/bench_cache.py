@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_cache.py
+    Compares cold loads (parsing todo.lst) against warm loads (from the
+    parse cache) for TodoList.load_file(), and for the todo.py command
+    itself with $TODO_CACHE set.
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Helpers shared by the benchmarks, using the todo.py from this checkout.
+from bench_common import make_list, run_main, TODOSCRIPT
+import todo
+
+NAME = 'Todo Cache Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
+
+USAGESTR = """{versionstr}
+    Usage:
+        {script} -h | -v
+        {script} [-k num] [-r num] [SIZE...]
+
+    Options:
+        SIZE                : Number of items in the list.
+                              Default: 10000 100000 500000
+        -h,--help           : Show this help message.
+        -k num,--keys num   : Number of keys to spread items across.
+                              Default: 10
+        -r num,--repeat num : Number of loads to time for each size.
+                              Default: 5
+        -v,--version        : Show version.
+"""
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sizes = [int(s) for s in argd['SIZE']] or [10000, 100000, 500000]
+    keycnt = int(argd['--keys'] or 10)
+    repeat = int(argd['--repeat'] or 5)
+
+    tmpdir = tempfile.mkdtemp(prefix='todo-bench-')
+    # Keep the cache files in the temp dir too.
+    os.environ['XDG_CACHE_HOME'] = os.path.join(tmpdir, 'cache')
+    try:
+        print('{:>10} {:>12} {:>12} {:>12} {:>12}'.format(
+            'items',
+            'cold load',
+            'warm load',
+            'cold todo',
+            'warm todo',
+        ))
+        for size in sizes:
+            filename = os.path.join(tmpdir, 'todo-{}.lst'.format(size))
+            make_list(size, keycnt=keycnt).write_file(filename)
+            cachename = todo.TodoList().cache_file(filename)
+            results = []
+            for cached in (False, True):
+                results.append(statistics.median(
+                    time_load(filename, cachename, cached)
+                    for _ in range(repeat)
+                ))
+            for cached in (False, True):
+                results.append(statistics.median(
+                    time_command(filename, cachename, cached)
+                    for _ in range(repeat)
+                ))
+            print('{:>10} {}'.format(
+                size,
+                ' '.join('{:>10.2f}ms'.format(ms) for ms in results),
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+def prepare_cache(filename, cachename, cached):
+    """ Make sure the cache file exists (for warm loads), or doesn't (for
+        cold loads).
+    """
+    if cached:
+        if not os.path.exists(cachename):
+            todo.TodoList(filename=filename, cache=True)
+    else:
+        with todo.suppress(FileNotFoundError):
+            os.remove(cachename)
+
+
+def time_command(filename, cachename, cached):
+    """ Return the run time (in milliseconds) for listing all items with
+        todo.py, in a new interpreter.
+    """
+    prepare_cache(filename, cachename, cached)
+    env = dict(os.environ)
+    if cached:
+        env['TODO_CACHE'] = '1'
+    else:
+        env.pop('TODO_CACHE', None)
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, TODOSCRIPT, '-f', filename],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def time_load(filename, cachename, cached):
+    """ Return the time (in milliseconds) that TodoList.load_file() takes,
+        without writing a new cache file.
+    """
+    prepare_cache(filename, cachename, cached)
+    todolist = todo.TodoList(cache=cached)
+    start = time.perf_counter()
+    todolist.load_file(filename)
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == '__main__':
+    run_main(main, USAGESTR, VERSIONSTR)
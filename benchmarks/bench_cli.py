@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_cli.py
+    Runs todo.py commands in a new interpreter against generated lists, and
+    reports the wall time (p50/p95/p99) and max RSS for each command and
+    list size. This includes everything a user waits for: startup, imports,
+    argument parsing, loading, and saving.
+"""
+
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Helpers shared by the benchmarks, using the todo.py from this checkout.
+from bench_common import format_size, make_list, run_main, TODOSCRIPT
+import todo
+
+NAME = 'Todo CLI Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
+
+# Commands to run, as (name, arguments, input, changes_list, exit_code).
+# Lists are rewritten before each run of a command that changes them.
+# Runs that exit with anything but exit_code are counted as failures.
+COMMANDS = (
+    ('add', ['key 0', 'A new item.'], None, True, 0),
+    ('-l', ['-l', 'key 0'], None, False, 0),
+    ('-L', ['-L'], None, False, 0),
+    ('-P', ['-P'], None, False, 0),
+    ('-s', ['-s', 'Item number 5 '], None, False, 0),
+    ('-r', ['-r', 'key 0', 'Item number 0 '], b'y\n', True, 0),
+    ('-R', ['-R', 'key 0', 'Item number 0 '], None, True, 0),
+    ('-m', ['-m', 'key 0', 'Item number 0 ', 'key 1'], None, True, 0),
+    ('-p', ['-p', 'key 0', 'Item number 0 ', 'bottom'], None, True, 0),
+    # todo.py -j always exits with 1.
+    ('-j', ['-j'], None, False, 1),
+    ('-e', ['-e', '{exportfile}', 'key 0'], None, True, 0),
+)
+
+USAGESTR = """{versionstr}
+    Usage:
+        {script} -h | -v
+        {script} [-c name...] [-k num] [-r num] [SIZE...]
+
+    Options:
+        SIZE                   : Number of items in the list.
+                                 Default: 1000 10000 100000
+        -c name,--command name : Only run this command. Can be used more
+                                 than once. Commands are:
+                                 {commands}
+        -h,--help              : Show this help message.
+        -k num,--keys num      : Number of keys to spread items across.
+                                 Default: 10
+        -r num,--repeat num    : Number of times to run each command.
+                                 Default: 20
+        -v,--version           : Show version.
+"""
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sizes = [int(s) for s in argd['SIZE']] or [1000, 10000, 100000]
+    keycnt = int(argd['--keys'] or 10)
+    repeat = int(argd['--repeat'] or 20)
+    commands = COMMANDS
+    if argd['--command']:
+        commands = [c for c in COMMANDS if c[0] in argd['--command']]
+        unknown = set(argd['--command']).difference(c[0] for c in COMMANDS)
+        if unknown:
+            print('Unknown commands: {}'.format(', '.join(sorted(unknown))))
+            return 1
+
+    tmpdir = tempfile.mkdtemp(prefix='todo-bench-')
+    try:
+        for size in sizes:
+            todolist = make_list(size, keycnt=keycnt)
+            print('\n{} items:'.format(size))
+            print('    {:<8} {:>10} {:>10} {:>10} {:>12} {:>6}'.format(
+                'command',
+                'p50',
+                'p95',
+                'p99',
+                'max rss',
+                'fails',
+            ))
+            for name, args, stdin, changes, exitcode in commands:
+                times, maxrss, fails = time_command(
+                    todolist,
+                    args,
+                    tmpdir,
+                    stdin=stdin,
+                    changes=changes,
+                    exitcode=exitcode,
+                    repeat=repeat,
+                )
+                print('    {:<8} {} {:>12} {:>6}'.format(
+                    name,
+                    ' '.join(
+                        '{:>8.2f}ms'.format(percentile(times, p))
+                        for p in (50, 95, 99)
+                    ),
+                    format_size(maxrss * 1024),
+                    fails,
+                ))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+def percentile(values, percent):
+    """ Return the nearest-rank percentile for a list of values. """
+    values = sorted(values)
+    rank = math.ceil(len(values) * percent / 100)
+    return values[max(0, rank - 1)]
+
+
+def run_command(args, stdin=None):
+    """ Run todo.py with arguments in a new interpreter.
+        Returns (milliseconds, max_rss_kb, exit_code).
+        The RSS comes from os.wait4(), because getrusage(RUSAGE_CHILDREN)
+        only has the highest RSS of all child processes so far.
+    """
+    env = dict(os.environ)
+    for name in ('TODO_CACHE', 'TODO_SOCKET'):
+        env.pop(name, None)
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, TODOSCRIPT] + args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+    if stdin:
+        with todo.suppress(BrokenPipeError):
+            proc.stdin.write(stdin)
+    with todo.suppress(BrokenPipeError):
+        proc.stdin.close()
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = (time.perf_counter() - start) * 1000
+    # Let Popen know the process was reaped.
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return elapsed, usage.ru_maxrss, proc.returncode
+
+
+def time_command(
+        todolist, args, tmpdir, stdin=None, changes=False, exitcode=0,
+        repeat=20):
+    """ Run a todo.py command `repeat` times on a list file for `todolist`.
+        Returns (list_of_milliseconds, max_rss_kb, failures), where
+        failures are runs that didn't exit with `exitcode`.
+        Lists are written again (untimed) before each run of a command
+        that changes them, so every run starts with the same list.
+    """
+    filename = os.path.join(tmpdir, 'todo.lst')
+    exportfile = os.path.join(tmpdir, 'export.json')
+    args = [arg.format(exportfile=exportfile) for arg in args]
+    args.extend(('-f', filename))
+    times = []
+    maxrss = fails = 0
+    for i in range(repeat):
+        if changes or (i == 0):
+            todolist.write_file(filename)
+        with todo.suppress(FileNotFoundError):
+            os.remove(exportfile)
+        elapsed, rss, runexitcode = run_command(args, stdin=stdin)
+        times.append(elapsed)
+        maxrss = max(maxrss, rss)
+        if runexitcode != exitcode:
+            fails += 1
+    return times, maxrss, fails
+
+
+if __name__ == '__main__':
+    run_main(
+        main,
+        USAGESTR,
+        VERSIONSTR,
+        commands=', '.join(command[0] for command in COMMANDS),
+    )
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_common.py
+    Helpers shared by the benchmarks. Importing this puts the todo.py from
+    this checkout first on sys.path, so `import todo` uses it.
+"""
+
+import os
+import sys
+
+# Use the todo.py from this checkout.
+sys.path.insert(
+    0,
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+import todo  # noqa
+
+TODOSCRIPT = os.path.abspath(todo.__file__)
+
+
+def format_size(size):
+    """ Format a size in bytes as a human-readable string. """
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '{:.1f}{}'.format(size, unit)
+        size /= 1024
+    return '{:.1f}GB'.format(size)
+
+
+def make_list(itemcnt, keycnt=10):
+    """ Build a TodoList with `itemcnt` items spread across `keycnt` keys.
+    """
+    todolist = todo.TodoList()
+    for i in range(itemcnt):
+        todolist.add_item(
+            'Item number {} with a little more text.'.format(i),
+            key='key {}'.format(i % keycnt),
+            important=(i % 10 == 0),
+        )
+    return todolist
+
+
+def run_main(main, usage, versionstr, **kwargs):
+    """ Parse the command-line args with docopt, and exit with the return
+        value of main(argd).
+        Arguments:
+            main       : The benchmark's main(argd) function.
+            usage      : Usage string, with {script} and {versionstr}
+                         fields, and any other fields in kwargs.
+            versionstr : Name and version of the benchmark.
+    """
+    script = os.path.split(os.path.abspath(sys.argv[0]))[1]
+    usagestr = usage.format(script=script, versionstr=versionstr, **kwargs)
+    sys.exit(main(todo.docopt(usagestr, version=versionstr, script=script)))
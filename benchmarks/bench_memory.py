@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_memory.py
+    Measures memory used by a TodoList against list size with tracemalloc,
+    for TodoItems with __slots__ and for items with a __dict__ (like
+    TodoItem before it had __slots__).
+"""
+
+import gc
+import sys
+import tracemalloc
+
+# Helpers shared by the benchmarks, using the todo.py from this checkout.
+from bench_common import format_size, run_main
+import todo
+
+NAME = 'Todo Memory Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
+
+USAGESTR = """{versionstr}
+    Usage:
+        {script} -h | -v
+        {script} [-k num] [SIZE...]
+
+    Options:
+        SIZE                : Number of items in the list.
+                              Default: 100000 1000000
+        -h,--help           : Show this help message.
+        -k num,--keys num   : Number of keys to spread items across.
+                              Default: 10
+        -v,--version        : Show version.
+"""
+
+
+class DictItem(todo.TodoItem):
+    """ A TodoItem with a __dict__, for comparison. """
+    pass
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sizes = [int(s) for s in argd['SIZE']] or [100000, 1000000]
+    keycnt = int(argd['--keys'] or 10)
+    itemtypes = (
+        ('__slots__', todo.TodoItem),
+        ('__dict__', DictItem),
+    )
+    print('{:>10} {:>12} {:>14} {:>10} {:>14} {:>10}'.format(
+        'items',
+        'text',
+        *(
+            label
+            for name, _ in itemtypes
+            for label in (name, 'per item')
+        )
+    ))
+    for size in sizes:
+        textsize = 0
+        results = []
+        for _, itemtype in itemtypes:
+            used, textsize = measure_list(size, itemtype, keycnt=keycnt)
+            results.extend((format_size(used), format_size(used / size)))
+        print('{:>10} {:>12} {:>14} {:>10} {:>14} {:>10}'.format(
+            size,
+            format_size(textsize),
+            *results
+        ))
+    return 0
+
+
+def make_list(itemcnt, itemtype, keycnt=10):
+    """ Build a TodoList with `itemcnt` items of `itemtype` spread across
+        `keycnt` keys.
+    """
+    todolist = todo.TodoList()
+    for i in range(keycnt):
+        todolist.data['key {}'.format(i)] = todo.TodoKey(
+            label='key {}'.format(i)
+        )
+    todokeys = todolist.todokeys()
+    for i in range(itemcnt):
+        todokey = todokeys[i % keycnt]
+        item = itemtype(
+            text='Item number {} with a little more text.'.format(i),
+            important=(i % 10 == 0),
+        )
+        item.key = todokey
+        todokey.data.append(item)
+    return todolist
+
+
+def measure_list(itemcnt, itemtype, keycnt=10):
+    """ Return (bytes_used, text_bytes) for a TodoList with `itemcnt` items
+        of `itemtype`. text_bytes is the size of the item text alone.
+    """
+    gc.collect()
+    tracemalloc.start()
+    todolist = make_list(itemcnt, itemtype, keycnt=keycnt)
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    textsize = sum(
+        sys.getsizeof(item.text)
+        for todokey in todolist.todokeys()
+        for item in todokey.data
+    )
+    return used, textsize
+
+
+if __name__ == '__main__':
+    run_main(main, USAGESTR, VERSIONSTR)
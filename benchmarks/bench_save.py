@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_save.py
+    Compares TodoList save latency against list size, for the old
+    copy-and-rewrite save and the atomic rename-based save.
+"""
+
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+# Helpers shared by the benchmarks, using the todo.py from this checkout.
+from bench_common import make_list, run_main
+
+NAME = 'Todo Save Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
+
+USAGESTR = """{versionstr}
+    Usage:
+        {script} -h | -v
+        {script} [-k num] [-r num] [SIZE...]
+
+    Options:
+        SIZE                : Number of items in the list.
+                              Default: 1000 10000 100000
+        -h,--help           : Show this help message.
+        -k num,--keys num   : Number of keys to spread items across.
+                              Default: 10
+        -r num,--repeat num : Number of saves to time for each size.
+                              Default: 20
+        -v,--version        : Show version.
+"""
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sizes = [int(s) for s in argd['SIZE']] or [1000, 10000, 100000]
+    keycnt = int(argd['--keys'] or 10)
+    repeat = int(argd['--repeat'] or 20)
+    methods = (
+        ('copy+rewrite', save_copy_rewrite),
+        ('atomic', save_atomic),
+    )
+    print('{:>10} {:>10} {:>14} {:>14}'.format(
+        'items',
+        'bytes',
+        *(name for name, _ in methods)
+    ))
+    tmpdir = tempfile.mkdtemp(prefix='todo-bench-')
+    try:
+        for size in sizes:
+            todolist = make_list(size, keycnt=keycnt)
+            filename = os.path.join(tmpdir, 'todo.lst')
+            timings = []
+            for _, func in methods:
+                timings.append(time_save(func, todolist, filename, repeat))
+            print('{:>10} {:>10} {:>12.2f}ms {:>12.2f}ms'.format(
+                size,
+                os.path.getsize(filename),
+                *timings
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+def save_atomic(todolist, filename):
+    """ The current save: write a temp file, hard link the backup,
+        and rename the temp file over the list.
+    """
+    todolist.write_file(filename)
+
+
+def save_copy_rewrite(todolist, filename):
+    """ The old save: copy the whole file to the backup, then truncate
+        and rewrite the list in place.
+    """
+    jsondata = todolist.to_json()
+    if os.path.exists(filename):
+        shutil.copyfile(filename, '{}~'.format(filename))
+    with open(filename, 'w') as f:
+        f.write(jsondata)
+
+
+def time_save(func, todolist, filename, repeat):
+    """ Return the median time (in milliseconds) for a save function. """
+    # Start each method with the same existing file and backup.
+    for name in (filename, '{}~'.format(filename)):
+        with open(name, 'w') as f:
+            f.write(todolist.to_json())
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(todolist, filename)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+if __name__ == '__main__':
+    run_main(main, USAGESTR, VERSIONSTR)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_startup.py
+    Measures cold-start time for common todo.py commands, by running them
+    in a new interpreter, and shows the slowest imports from
+    `python -X importtime`.
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Helpers shared by the benchmarks, using the todo.py from this checkout.
+from bench_common import make_list, run_main, TODOSCRIPT
+
+NAME = 'Todo Startup Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
+
+USAGESTR = """{versionstr}
+    Usage:
+        {script} -h | -v
+        {script} [-i num] [-n num] [-r num]
+
+    Options:
+        -h,--help            : Show this help message.
+        -i num,--items num   : Number of items in the test list.
+                               Default: 100
+        -n num,--imports num : Number of slow imports to show.
+                               Default: 15
+        -r num,--repeat num  : Number of runs to time for each command.
+                               Default: 10
+        -v,--version         : Show version.
+"""
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    itemcnt = int(argd['--items'] or 100)
+    importcnt = int(argd['--imports'] or 15)
+    repeat = int(argd['--repeat'] or 10)
+
+    tmpdir = tempfile.mkdtemp(prefix='todo-bench-')
+    try:
+        filename = os.path.join(tmpdir, 'todo.lst')
+        make_list(itemcnt).write_file(filename)
+        commands = (
+            ('python -c pass', None),
+            ('todo ITEM', ['-f', filename, 'bench', 'new item']),
+            ('todo -l KEY', ['-f', filename, '-l', 'key 0']),
+            ('todo', ['-f', filename]),
+            ('todo -j (docopt)', ['-f', filename, '-j']),
+        )
+        print('{:<20} {:>12} {:>12}'.format('command', 'median', 'min'))
+        for name, args in commands:
+            times = time_command(args, repeat)
+            print('{:<20} {:>10.2f}ms {:>10.2f}ms'.format(
+                name,
+                statistics.median(times),
+                min(times),
+            ))
+
+        print('\nSlowest imports for: todo -l KEY')
+        imports = import_times(['-f', filename, '-l', 'key 0'])
+        print('{:>12} {:>12}  {}'.format('self', 'cumulative', 'module'))
+        for selftime, cumtime, modname in imports[:importcnt]:
+            print('{:>10.2f}ms {:>10.2f}ms  {}'.format(
+                selftime / 1000,
+                cumtime / 1000,
+                modname,
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+def import_times(args):
+    """ Run todo.py with `python -X importtime`, and return a list of
+        (self_us, cumulative_us, module_name), slowest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', TODOSCRIPT] + args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        pieces = line[len('import time:'):].split('|')
+        try:
+            selftime, cumtime = int(pieces[0]), int(pieces[1])
+        except ValueError:
+            # Header line.
+            continue
+        imports.append((selftime, cumtime, pieces[2].rstrip()))
+    return sorted(imports, key=lambda info: info[1], reverse=True)
+
+
+def time_command(args, repeat):
+    """ Return a list of run times (in milliseconds) for todo.py with
+        `args`, in a new interpreter each time.
+        If `args` is None, an empty python script is timed instead.
+    """
+    if args is None:
+        cmd = [sys.executable, '-c', 'pass']
+    else:
+        cmd = [sys.executable, TODOSCRIPT] + args
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+if __name__ == '__main__':
+    run_main(main, USAGESTR, VERSIONSTR)
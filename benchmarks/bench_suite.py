@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" bench_suite.py
+    Times the core TodoList operations on generated lists, and measures
+    their memory use. Results can be saved as JSON, and compared against
+    a saved baseline to catch regressions.
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Helpers shared by the benchmarks, using the todo.py from this checkout.
+from bench_common import run_main
+import todo
+
+NAME = 'Todo Benchmark Suite'
+VERSION = '0.0.1'
+VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
+
+USAGESTR = """{versionstr}
+    Usage:
+        {script} -h | -v
+        {script} [-b file] [-i num] [-k num] [-l num] [-o file] [-r num]
+                 [-t num] [SIZE...]
+
+    Options:
+        SIZE                    : Number of items in each list.
+                                  Default: 10000 100000
+        -b file,--baseline file : Compare results with a baseline file
+                                  (from --output), and exit with 1 when
+                                  anything is slower than the threshold.
+        -h,--help               : Show this help message.
+        -i num,--important num  : Percent of items that are important.
+                                  Default: 10
+        -k num,--keys num       : Number of keys to spread items across.
+                                  Default: 100
+        -l num,--lines num      : Max lines per item. Items have from 1 to
+                                  this many lines.
+                                  Default: 3
+        -o file,--output file   : Write results to a JSON file, or stdout
+                                  for '-'.
+        -r num,--repeat num     : Number of runs to time for each
+                                  benchmark. The median is used.
+                                  Default: 5
+        -t num,--threshold num  : Percent slower (or bigger) than the
+                                  baseline that counts as a regression.
+                                  Default: 20
+        -v,--version            : Show version.
+"""
+
+# Differences smaller than this (in milliseconds) are too small to tell
+# apart from noise, and are never regressions.
+NOISE_MS = 1.0
+
+# Lines of text for generated items, about the length of real items.
+LINES = (
+    'Fix the parser so it handles empty keys',
+    'Write docs for the new storage options',
+    'Go to the store and get milk, eggs, and bread',
+    'Refactor the mess in the listing code',
+    'Call about the appointment next week',
+    'Look into why saving takes so long on big lists',
+    'Reply to the email about the release',
+    'Clean up old branches and tags',
+    'Check the backup drive, it was making noise',
+    'Try the new search index on the work list',
+    'Update dependencies and run the checks again',
+)
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sizes = [int(s) for s in argd['SIZE']] or [10000, 100000]
+    settings = {
+        'keys': int(argd['--keys'] or 100),
+        'important': int(argd['--important'] or 10),
+        'lines': int(argd['--lines'] or 3),
+        'repeat': int(argd['--repeat'] or 5),
+    }
+    threshold = float(argd['--threshold'] or 20)
+    # Keep stdout clean when the JSON results are written there.
+    out = sys.stderr if argd['--output'] == '-' else sys.stdout
+
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='todo-bench-')
+    try:
+        for size in sizes:
+            print(
+                'Running benchmarks for {} items...'.format(size),
+                file=out,
+            )
+            results[str(size)] = run_benchmarks(size, settings, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    report = {
+        'benchmark': VERSIONSTR,
+        'todo': todo.VERSION,
+        'python': platform.python_version(),
+        'settings': settings,
+        'results': results,
+    }
+    if argd['--output']:
+        write_report(report, argd['--output'])
+
+    if not argd['--baseline']:
+        print_results(results, file=out)
+        return 0
+    try:
+        with open(argd['--baseline'], 'r') as f:
+            baseline = json.load(f)
+    except (EnvironmentError, ValueError) as ex:
+        print('\nUnable to load baseline: {}\n{}'.format(
+            argd['--baseline'],
+            ex,
+        ), file=out)
+        return 1
+    if baseline.get('settings', None) != settings:
+        print('\nThe baseline used other settings: {}'.format(
+            baseline.get('settings', None)
+        ), file=out)
+    regressions = print_results(
+        results,
+        baseline=baseline.get('results', {}),
+        threshold=threshold,
+        file=out,
+    )
+    if regressions:
+        print('\nRegressions (more than {}% slower or bigger):'.format(
+            threshold
+        ), file=out)
+        print('    {}'.format('\n    '.join(regressions)), file=out)
+        return 1
+    return 0
+
+
+def bench_find_item(todolist, filename):
+    """ Find the last item by text, which checks every key. """
+    query = 'Item {}:'.format(todolist.get_count() - 1)
+    start = time.perf_counter()
+    todolist.find_item(query)
+    return time.perf_counter() - start
+
+
+def bench_get_key(todolist, filename):
+    """ Look up every key (up to 1000), by a name in another case. """
+    names = [name.upper() for name in todolist.keynames()[:1000]]
+    start = time.perf_counter()
+    for name in names:
+        todolist.get_key(name)
+    return time.perf_counter() - start
+
+
+def bench_load_file(todolist, filename):
+    """ Load the whole list from a JSON file. """
+    start = time.perf_counter()
+    todo.TodoList(filename=filename)
+    return time.perf_counter() - start
+
+
+def bench_move_item(todolist, filename):
+    """ Move items around in the biggest key, 1000 times. """
+    todokey = biggest_key(todolist)
+    count = todokey.get_count()
+    moves = [
+        ((i * 7919) % count, (i * 104729) % count)
+        for i in range(1000)
+    ]
+    start = time.perf_counter()
+    for index, newindex in moves:
+        if index != newindex:
+            todokey.move_item(index, newindex)
+    elapsed = time.perf_counter() - start
+    todolist.saved()
+    return elapsed
+
+
+def bench_remove_items(todolist, filename):
+    """ Remove about a tenth of the items in the biggest key, from a
+        freshly loaded list.
+    """
+    freshlist = todo.TodoList(filename=filename)
+    todokey = biggest_key(freshlist)
+    start = time.perf_counter()
+    todokey.remove_items(LINES[0])
+    return time.perf_counter() - start
+
+
+def bench_save_file(todolist, filename):
+    """ Save the whole list after adding an item. """
+    todolist.add_item('One more item.', key=todolist.keynames()[0])
+    start = time.perf_counter()
+    todolist.save_file()
+    return time.perf_counter() - start
+
+
+def bench_search_items(todolist, filename):
+    """ Search all items for some text. """
+    start = time.perf_counter()
+    todolist.search_items('the store')
+    return time.perf_counter() - start
+
+
+def bench_to_json(todolist, filename):
+    """ Build the JSON string for the whole list. """
+    start = time.perf_counter()
+    todolist.to_json()
+    return time.perf_counter() - start
+
+
+def bench_to_str(todolist, filename):
+    """ Build the colored listing for every key. """
+    start = time.perf_counter()
+    for todokey in todolist.todokeys():
+        todokey.to_str(color=True)
+    return time.perf_counter() - start
+
+
+def biggest_key(todolist):
+    """ Return the TodoKey with the most items. """
+    return max(todolist.todokeys(), key=lambda k: k.get_count())
+
+
+def make_list(itemcnt, keys=100, important=10, lines=3):
+    """ Build a TodoList with `itemcnt` items spread across `keys` keys.
+        `important` percent of the items are important, and items have
+        from 1 to `lines` lines of text.
+        The same arguments always build the same list.
+    """
+    keycnt = max(1, min(keys, itemcnt))
+    data = {'key {}'.format(i): [] for i in range(keycnt)}
+    keynames = sorted(data)
+    for i in range(itemcnt):
+        itemlines = [
+            LINES[(i + line) % len(LINES)]
+            for line in range(1 + (i % max(1, lines)))
+        ]
+        text = 'Item {}: {}'.format(i, '\n'.join(itemlines))
+        if (i * 37) % 100 < important:
+            text = '{}{}'.format(todo.TodoItem.important_str, text)
+        data[keynames[i % keycnt]].append(text)
+    todolist = todo.TodoList()
+    todolist.load_data(data)
+    return todolist
+
+
+def measure_memory(filename):
+    """ Return (list_kb, peak_kb) for loading a list with tracemalloc.
+        list_kb is the memory still used by the loaded list, and peak_kb is
+        the most that was used while loading it.
+    """
+    tracemalloc.start()
+    todolist = todo.TodoList(filename=filename)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del todolist
+    return current / 1024, peak / 1024
+
+
+def print_results(results, baseline=None, threshold=20, file=None):
+    """ Print a table of results, next to their baseline results when
+        a baseline is given.
+        Returns a list of names for results that regressed.
+    """
+    regressions = []
+    for size, sizeresults in results.items():
+        print('\n{} items:'.format(size), file=file)
+        print('    {:<20} {:>14} {:>14} {:>9}'.format(
+            'benchmark',
+            'result',
+            'baseline',
+            'change',
+        ), file=file)
+        sizebaseline = (baseline or {}).get(size, {})
+        for name, value in sizeresults.items():
+            unit = 'KB' if name.endswith('_kb') else 'ms'
+            base = sizebaseline.get(name, None)
+            if base is None:
+                basestr = changestr = '-'
+            else:
+                basestr = '{:.2f}{}'.format(base, unit)
+                change = ((value - base) / base * 100) if base else 0
+                changestr = '{:+.1f}%'.format(change)
+                noise = (unit == 'ms') and (abs(value - base) < NOISE_MS)
+                if (change > threshold) and not noise:
+                    changestr = '{} !'.format(changestr)
+                    regressions.append('{}/{}'.format(size, name))
+            print('    {:<20} {:>14} {:>14} {:>9}'.format(
+                name,
+                '{:.2f}{}'.format(value, unit),
+                basestr,
+                changestr,
+            ), file=file)
+    return regressions
+
+
+def run_benchmarks(size, settings, tmpdir):
+    """ Run all benchmarks on a generated list with `size` items.
+        Returns {name: median_ms}, with memory use as {name_kb: kb}.
+    """
+    filename = os.path.join(tmpdir, 'todo-{}.lst'.format(size))
+    todolist = make_list(
+        size,
+        keys=settings['keys'],
+        important=settings['important'],
+        lines=settings['lines'],
+    )
+    todolist.write_file(filename)
+    todolist = todo.TodoList(filename=filename)
+    benchmarks = (
+        ('load_file', bench_load_file),
+        ('save_file', bench_save_file),
+        ('to_json', bench_to_json),
+        ('get_key', bench_get_key),
+        ('find_item', bench_find_item),
+        ('search_items', bench_search_items),
+        ('move_item', bench_move_item),
+        ('remove_items', bench_remove_items),
+        ('to_str', bench_to_str),
+    )
+    results = {}
+    for name, func in benchmarks:
+        results[name] = statistics.median(
+            func(todolist, filename) * 1000
+            for _ in range(settings['repeat'])
+        )
+    results['list_kb'], results['load_peak_kb'] = measure_memory(filename)
+    return results
+
+
+def write_report(report, filename):
+    """ Write the results as JSON to a file, or stdout for '-'. """
+    jsondata = json.dumps(report, indent=4, sort_keys=True)
+    if filename == '-':
+        print(jsondata)
+        return
+    with open(filename, 'w') as f:
+        f.write(jsondata)
+    print('Results saved to: {}'.format(filename))
+
+
+if __name__ == '__main__':
+    run_main(main, USAGESTR, VERSIONSTR)
@@ -0,0 +1,1087 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" test_todo.py
+    Tests for todo.py's TodoList and storage backends.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from unittest import mock
+
+# Use the todo.py from this checkout.
+sys.path.insert(
+    0,
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+import todo  # noqa
+
+
+class TodoListTransactionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.todolist = todo.TodoList()
+        for i in range(10):
+            self.todolist.add_item(
+                'item {}'.format(i),
+                key='key {}'.format(i % 2),
+                important=(i % 3 == 0),
+            )
+        self.todolist.saved()
+
+    def dump(self):
+        return {
+            keyname: (
+                self.todolist.get_key(keyname).important,
+                [repr(item) for item in self.todolist.get_key(keyname).data],
+            )
+            for keyname in self.todolist.keynames()
+        }
+
+    def test_rollback(self):
+        """ Changes made in a failed transaction are rolled back. """
+        before = self.dump()
+        with self.assertRaises(RuntimeError):
+            with self.todolist.transaction():
+                self.todolist.add_item('new', key='key 0')
+                self.todolist.add_item('new', key='new key')
+                self.todolist.move_item(0, 2, key='key 0')
+                self.todolist.remove_item(1, key='key 1')
+                self.todolist.get_key('key 1').mark_item(1, important=True)
+                self.todolist.get_key('key 1').data[0].text = 'changed'
+                self.todolist.rename_key('renamed', key='key 1')
+                raise RuntimeError('rollback')
+        self.assertEqual(self.dump(), before)
+        self.assertFalse(self.todolist.has_changes())
+
+    def test_unchanged_keys_not_saved(self):
+        """ Only keys that change have their state saved. """
+        with self.todolist.transaction():
+            todokeys = self.todolist.rollbacks[0]['todokeys']
+            self.assertEqual(todokeys, {})
+            self.todolist.add_item('new', key='key 0')
+            saved = [todokey.label for todokey, _ in todokeys.values()]
+        self.assertEqual(saved, ['key 0'])
+
+    def test_block_list_rollback(self):
+        """ Changes to big keys (TodoBlockLists) are undone without
+            copying their items.
+        """
+        todolist = todo.TodoList()
+        todolist.load_data({
+            'big': ['item {}'.format(i) for i in range(todo.TodoKey.block_min)]
+        })
+        todokey = todolist.get_key('big')
+        self.assertIsInstance(todokey.data, todo.TodoBlockList)
+        before = [item.text for item in todokey.data]
+        with self.assertRaises(RuntimeError):
+            with todolist.transaction():
+                todokey.move_item(0, len(before) - 1)
+                todokey.remove_item(5)
+                todokey.remove_indexes([1, 2, 9000])
+                todokey.add_item('new')
+                todokey.data[7].text = 'changed'
+                state = todolist.rollbacks[0]['todokeys'][id(todokey)][1]
+                self.assertNotIn('items', state)
+                raise RuntimeError('rollback')
+        self.assertEqual([item.text for item in todokey.data], before)
+        self.assertEqual(todolist.undo, [])
+
+    def test_nested_rollback(self):
+        """ A nested transaction can be rolled back on it's own. """
+        with self.todolist.transaction():
+            self.todolist.add_item('kept', key='key 0')
+            before = self.dump()
+            with self.todolist.transaction():
+                self.todolist.add_item('dropped', key='key 0')
+                self.todolist.remove_item(0, key='key 1')
+                raise todo.TodoList.Rollback()
+            self.assertEqual(self.dump(), before)
+            self.assertEqual(len(self.todolist.changes), 1)
+
+
+class TodoBlockListTests(unittest.TestCase):
+
+    def setUp(self):
+        # Small blocks, so a few items are split across many blocks.
+        patcher = mock.patch.object(todo.TodoBlockList, 'block_max', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.items = list(range(20))
+        self.blocklist = todo.TodoBlockList(self.items)
+
+    def assert_same(self):
+        """ The TodoBlockList matches the plain list, and it's blocks and
+            tree of block sizes are still valid.
+        """
+        blocklist = self.blocklist
+        self.assertEqual(list(blocklist), self.items)
+        self.assertEqual(len(blocklist), len(self.items))
+        self.assertEqual(list(reversed(blocklist)), self.items[::-1])
+        for index in range(-len(self.items), len(self.items)):
+            self.assertEqual(blocklist[index], self.items[index])
+        for index in (len(self.items), -len(self.items) - 1):
+            with self.assertRaises(IndexError):
+                blocklist[index]
+        sizes = [len(block) for block in blocklist.blocks]
+        self.assertTrue(all(size <= blocklist.block_max for size in sizes))
+        if len(sizes) > 1:
+            # Emptied blocks are removed.
+            self.assertNotIn(0, sizes)
+        # The tree was kept up to date, instead of rebuilt.
+        rebuilt = todo.TodoBlockList()
+        rebuilt.blocks = blocklist.blocks
+        rebuilt.build_tree()
+        self.assertEqual(blocklist.tree, rebuilt.tree)
+
+    def test_delitem(self):
+        """ Items are deleted like a list, and emptied blocks are removed.
+        """
+        blockcount = len(self.blocklist.blocks)
+        for index in (0, 5, -1, 7, 7, 7):
+            del self.blocklist[index]
+            del self.items[index]
+            self.assert_same()
+        self.assertLess(len(self.blocklist.blocks), blockcount)
+        del self.blocklist[2:9:2]
+        del self.items[2:9:2]
+        self.assert_same()
+        while self.items:
+            del self.blocklist[0]
+            del self.items[0]
+            self.assert_same()
+        self.assertEqual(self.blocklist.blocks, [[]])
+        with self.assertRaises(IndexError):
+            del self.blocklist[0]
+
+    def test_index(self):
+        """ Items are found by index() and `in`, like a list. """
+        for value in (0, 3, 4, 19):
+            self.assertEqual(
+                self.blocklist.index(value),
+                self.items.index(value),
+            )
+            self.assertIn(value, self.blocklist)
+        self.assertNotIn(20, self.blocklist)
+        with self.assertRaises(ValueError):
+            self.blocklist.index(20)
+
+    def test_insert(self):
+        """ Items are inserted like a list, and full blocks are split. """
+        blockcount = len(self.blocklist.blocks)
+        for index, value in enumerate((0, 1, 1, 1, 1, 1, -3, 100, -100)):
+            self.blocklist.insert(value, 'new {}'.format(index))
+            self.items.insert(value, 'new {}'.format(index))
+            self.assert_same()
+        self.assertGreater(len(self.blocklist.blocks), blockcount)
+        self.blocklist.append('last')
+        self.items.append('last')
+        self.blocklist.extend(['more', 'items'])
+        self.items.extend(['more', 'items'])
+        self.assert_same()
+
+    def test_moves(self):
+        """ Items moved across block boundaries end up in the right place.
+        """
+        moves = [(0, 19), (19, 0), (1, 10), (10, 1), (3, 4), (17, 2)]
+        for index, newindex in moves:
+            self.blocklist.insert(newindex, self.blocklist.pop(index))
+            self.items.insert(newindex, self.items.pop(index))
+            self.assert_same()
+
+    def test_pop(self):
+        """ Items are popped like a list, from either end or the middle.
+        """
+        for index in (-1, 0, 8, 8, -2, 3):
+            self.assertEqual(self.blocklist.pop(index), self.items.pop(index))
+            self.assert_same()
+        self.assertEqual(self.blocklist.pop(), self.items.pop())
+        self.assert_same()
+        with self.assertRaises(IndexError):
+            self.blocklist.pop(100)
+
+    def test_slices(self):
+        """ Slices get and set items like a list. """
+        for index in (slice(2, 9), slice(None, None, -1), slice(-5, None)):
+            self.assertEqual(self.blocklist[index], self.items[index])
+        self.blocklist[3:15] = ['a', 'b']
+        self.items[3:15] = ['a', 'b']
+        self.assert_same()
+        self.blocklist[1:1] = list(range(10))
+        self.items[1:1] = list(range(10))
+        self.assert_same()
+        self.blocklist[5] = 'changed'
+        self.items[5] = 'changed'
+        self.assert_same()
+
+
+class TodoSQLiteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.db')
+        todolist = todo.TodoList()
+        todolist.add_item('one', key='key')
+        todolist.save_as(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def item_texts(self, todolist, key='key'):
+        return [item.text for item in todolist.get_key(key).data]
+
+    def test_save_unloaded_key(self):
+        """ Items added to an unloaded key are only loaded once, after the
+            list is saved.
+        """
+        todolist = todo.TodoList(filename=self.filename)
+        todolist.add_item('two', key='key')
+        todolist.save_file()
+        self.assertEqual(todolist.get_key('key').get_count(), 2)
+        self.assertEqual(self.item_texts(todolist), ['one', 'two'])
+        reloaded = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.item_texts(reloaded), ['one', 'two'])
+
+    def test_save_unloaded_key_changes(self):
+        """ Indexes for a saved, unloaded key match the database. """
+        todolist = todo.TodoList(filename=self.filename)
+        todolist.add_item('two', key='key')
+        todolist.save_file()
+        todolist.get_key('key').move_item(1, 0)
+        todolist.get_key('key').remove_item(1)
+        todolist.add_item('three', key='key')
+        todolist.save_file()
+        self.assertEqual(self.item_texts(todolist), ['two', 'three'])
+        reloaded = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.item_texts(reloaded), ['two', 'three'])
+
+
+class TodoShardsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.d')
+        todolist = todo.TodoList()
+        for i in range(12):
+            todolist.add_item(
+                'item {} \u00fc "quoted"\nline'.format(i),
+                key='key {}'.format(i % 3),
+                important=(i % 4 == 0),
+            )
+        todolist.get_key('key 2').important = True
+        todolist.save_as(self.filename)
+        self.expected = self.dump(todolist)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, todolist):
+        return {
+            todokey.label: (
+                todokey.important,
+                [(item.text, item.important) for item in todokey.data],
+            )
+            for todokey in todolist.todokeys()
+        }
+
+    def manifest(self):
+        manifestname = os.path.join(self.filename, 'manifest.json')
+        with open(manifestname, 'r') as f:
+            manifest = json.load(f)
+        return {entry['label']: entry for entry in manifest['keys']}
+
+    def shard_files(self):
+        return sorted(
+            name
+            for name in os.listdir(self.filename)
+            if name != 'manifest.json'
+        )
+
+    def test_round_trip(self):
+        """ Saved lists are loaded the same, one key at a time. """
+        todolist = todo.TodoList(filename=self.filename)
+        self.assertIsInstance(todolist.get_backend(), todo.TodoShards)
+        self.assertFalse(any(k.is_loaded() for k in todolist.todokeys()))
+        self.assertEqual(todolist.get_count(), 12)
+        self.assertFalse(any(k.is_loaded() for k in todolist.todokeys()))
+        self.assertEqual(self.dump(todolist), self.expected)
+        self.assertEqual(todolist.get_important_count(), 3)
+        manifest = self.manifest()
+        self.assertEqual(sorted(manifest), ['key 0', 'key 1', 'key 2'])
+        self.assertTrue(manifest['key 2']['important'])
+        self.assertEqual(manifest['key 1']['count'], 4)
+        self.assertEqual(
+            self.shard_files(),
+            sorted(entry['file'] for entry in manifest.values()),
+        )
+
+    def test_changed_keys(self):
+        """ Only changed keys get a new shard, and old shards are removed.
+        """
+        before = self.manifest()
+        todolist = todo.TodoList(filename=self.filename)
+        todolist.add_item('new', key='key 1')
+        todolist.get_key('key 0').move_item(3, 0)
+        todolist.rename_key('renamed', key='key 2')
+        todolist.save_file()
+        after = self.manifest()
+        self.assertNotEqual(after['key 0']['file'], before['key 0']['file'])
+        self.assertNotEqual(after['key 1']['file'], before['key 1']['file'])
+        # Renaming only changes the manifest.
+        self.assertEqual(after['renamed']['file'], before['key 2']['file'])
+        self.assertEqual(
+            self.shard_files(),
+            sorted(entry['file'] for entry in after.values()),
+        )
+        reloaded = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.dump(reloaded), self.dump(todolist))
+        self.assertEqual(
+            [item.text for item in reloaded.get_key('key 1').data][-1],
+            'new',
+        )
+
+        reloaded.delete_key('key 0')
+        reloaded.save_file()
+        self.assertEqual(sorted(self.manifest()), ['key 1', 'renamed'])
+        self.assertEqual(len(self.shard_files()), 2)
+        again = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.dump(again), self.dump(reloaded))
+
+
+class TodoRemoveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.texts = [
+            'remove first',
+            'keep 1',
+            'remove 2',
+            'remove 3',
+            'keep 4',
+            'remove 5',
+            'keep 6',
+            'remove last',
+        ]
+        self.kept = [text for text in self.texts if text.startswith('keep')]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_list(self, filename, **kwargs):
+        todolist = todo.TodoList()
+        for i, text in enumerate(self.texts):
+            todolist.add_item(text, key='key', important=(i % 2 == 0))
+        todolist.add_item('other', key='other')
+        todolist.save_as(filename)
+        return todo.TodoList(filename=filename, **kwargs)
+
+    def item_texts(self, todolist):
+        return [item.text for item in todolist.get_key('key').data]
+
+    def remove(self, todolist):
+        """ Remove every 'remove' item, and check the results. """
+        todokey = todolist.get_key('key')
+        removed = todokey.remove_items('^remove')
+        self.assertEqual(
+            [(keyresult.index, keyresult.item.text) for keyresult in removed],
+            [(0, 'remove first'), (2, 'remove 2'), (3, 'remove 3'),
+             (5, 'remove 5'), (7, 'remove last')],
+        )
+        self.assertEqual(self.item_texts(todolist), self.kept)
+        self.assertEqual(todokey.get_important_count(), 2)
+        # Changes are recorded from the bottom up.
+        self.assertEqual(
+            todolist.changes,
+            [('remove', 'key', index) for index in (7, 5, 3, 2, 0)],
+        )
+        return removed
+
+    def test_journal(self):
+        """ Several removes are replayed from a journal. """
+        filename = os.path.join(self.tmpdir, 'todo.lst')
+        todolist = self.make_list(filename, journal=True)
+        self.remove(todolist)
+        todolist.save_file()
+        self.assertTrue(os.path.exists(todolist.journal_file()))
+        reloaded = todo.TodoList(filename=filename)
+        self.assertEqual(self.item_texts(reloaded), self.kept)
+        self.assertEqual(
+            [item.text for item in reloaded.get_key('other').data],
+            ['other'],
+        )
+
+    def test_no_matches(self):
+        """ Nothing is changed when no items match. """
+        todolist = self.make_list(os.path.join(self.tmpdir, 'todo.lst'))
+        todokey = todolist.get_key('key')
+        self.assertEqual(todokey.remove_items('^missing'), [])
+        self.assertEqual(todokey.remove_indexes([100, -1]), [])
+        self.assertEqual(self.item_texts(todolist), self.texts)
+        self.assertFalse(todolist.has_changes())
+
+    def test_rollback(self):
+        """ Several removes in one key are undone by a rollback. """
+        todolist = self.make_list(os.path.join(self.tmpdir, 'todo.lst'))
+        todokey = todolist.get_key('key')
+        with todolist.transaction():
+            self.remove(todolist)
+            raise todo.TodoList.Rollback()
+        self.assertEqual(self.item_texts(todolist), self.texts)
+        self.assertEqual(todokey.get_important_count(), 4)
+        self.assertFalse(todolist.has_changes())
+
+    def test_sqlite(self):
+        """ Several removes are saved to a SQLite list. """
+        filename = os.path.join(self.tmpdir, 'todo.db')
+        todolist = self.make_list(filename)
+        self.remove(todolist)
+        todolist.save_file()
+        reloaded = todo.TodoList(filename=filename)
+        self.assertEqual(self.item_texts(reloaded), self.kept)
+
+
+class TodoIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        # Small lists get an index with a lower threshold.
+        patcher = mock.patch.object(todo.TodoList, 'index_min', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.lst')
+        self.texts = {
+            'key {}'.format(keynum): [
+                # Unicode and escaped items don't throw the offsets off.
+                'item {} \u00fc "{}"\n'.format(i, keynum)
+                for i in range(20)
+            ]
+            for keynum in range(5)
+        }
+        todolist = todo.TodoList()
+        todolist.load_data(self.texts)
+        todolist.write_file(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, todolist):
+        return {
+            todokey.label: [item.text for item in todokey.data]
+            for todokey in todolist.todokeys()
+        }
+
+    def test_lazy_keys(self):
+        """ Keys are loaded from their offsets when they are used. """
+        todolist = todo.TodoList(filename=self.filename)
+        index = todolist.load_index()
+        self.assertEqual(sorted(index), sorted(self.texts))
+        with open(self.filename, 'rb') as f:
+            jsondata = f.read()
+        for label, (start, end, count) in index.items():
+            self.assertEqual(
+                json.loads(jsondata[start:end].decode('utf-8')),
+                self.texts[label],
+            )
+            self.assertEqual(count, len(self.texts[label]))
+
+        lazylist = todo.TodoList(filename=self.filename, lazy=True)
+        self.assertFalse(any(k.is_loaded() for k in lazylist.todokeys()))
+        self.assertEqual(lazylist.get_count(), 100)
+        todokey = lazylist.get_key('key 3')
+        self.assertEqual(todokey.get_count(), 20)
+        self.assertEqual([i.text for i in todokey.data], self.texts['key 3'])
+        self.assertEqual(
+            [k.label for k in lazylist.todokeys() if k.is_loaded()],
+            ['key 3'],
+        )
+        self.assertEqual(self.dump(lazylist), self.texts)
+
+    def test_stale_index(self):
+        """ An index is ignored after the list is edited by something else.
+        """
+        with open(self.filename, 'r+b') as f:
+            jsondata = f.read()
+            # Same size, same inode, only the modified time changes.
+            f.seek(0)
+            f.write(jsondata.replace(b'item 1 ', b'ITEM 1 '))
+        st = os.stat(self.filename)
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        todolist = todo.TodoList(filename=self.filename)
+        self.assertIsNone(todolist.load_index())
+
+        lazylist = todo.TodoList(filename=self.filename, lazy=True)
+        expected = {
+            label: [text.replace('item 1 ', 'ITEM 1 ') for text in texts]
+            for label, texts in self.texts.items()
+        }
+        self.assertEqual(self.dump(lazylist), expected)
+
+        # Edits that move the keys around can't use the old offsets.
+        self.texts['key 0'].insert(0, 'a new item')
+        with open(self.filename, 'w') as f:
+            json.dump(self.texts, f)
+        lazylist = todo.TodoList(filename=self.filename, lazy=True)
+        self.assertEqual(self.dump(lazylist), self.texts)
+
+
+class TodoJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.lst')
+        todolist = todo.TodoList()
+        for i in range(1000):
+            todolist.add_item('item {}'.format(i), key='key {}'.format(i % 5))
+        todolist.write_file(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, todolist):
+        return {
+            keyname: [item.text for item in todolist.get_key(keyname).data]
+            for keyname in todolist.keynames()
+        }
+
+    def test_background_compaction(self):
+        """ Changes saved while the journal is compacted in the background
+            are kept, and only applied once.
+        """
+        todolist = todo.TodoList(filename=self.filename, journal=True)
+        todolist.add_item('before', key='key 0')
+        todolist.save_file()
+        thread = todolist.compact_journal(background=True)
+        todolist.add_item('during', key='key 1')
+        todolist.delete_key('key 2')
+        todolist.save_file()
+        thread.join()
+        todolist.add_item('after', key='key 3')
+        todolist.save_file()
+        reloaded = todo.TodoList(filename=self.filename, journal=True)
+        self.assertEqual(self.dump(reloaded), self.dump(todolist))
+
+
+class TodoSearchIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.lst')
+        todolist = todo.TodoList()
+        for i in range(5000):
+            todolist.add_item(
+                'Item number {} with some more text.'.format(i),
+                key='key {}'.format(i % 10),
+            )
+        todolist.write_file(self.filename)
+        self.searchfile = todolist.search_file(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def found_keys(self, todolist, query):
+        return [keyname for keyname, _ in todolist.search_items(query)]
+
+    def test_built_on_search(self):
+        """ The search index is built by the first search, not by saves.
+        """
+        self.assertFalse(os.path.exists(self.searchfile))
+        todolist = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.found_keys(todolist, 'number 42 '), ['key 2'])
+        self.assertTrue(os.path.exists(self.searchfile))
+        reloaded = todo.TodoList(filename=self.filename)
+        self.assertIsNotNone(reloaded.load_search_index())
+
+    def test_stale_keys(self):
+        """ Keys that change after the index is built are still searched.
+        """
+        todolist = todo.TodoList(filename=self.filename)
+        self.found_keys(todolist, 'number 42 ')
+        todolist.add_item('A zebra.', key='key 3')
+        self.assertEqual(self.found_keys(todolist, 'zebra'), ['key 3'])
+        todolist.save_file()
+        self.assertEqual(self.found_keys(todolist, 'zebra'), ['key 3'])
+        reloaded = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.found_keys(reloaded, 'zebra'), ['key 3'])
+
+    def test_streamed_keys_not_loaded(self):
+        """ Building the index for a streamed list doesn't load any keys.
+        """
+        with mock.patch.object(todo.TodoList, 'stream_min', 1):
+            todolist = todo.TodoList(filename=self.filename, stream=True)
+        self.assertEqual(self.found_keys(todolist, 'number 42 '), ['key 2'])
+        self.assertIsNotNone(todolist.search_index)
+        self.assertFalse(any(k.is_loaded() for k in todolist.todokeys()))
+
+    def test_unsaved_keys_not_written(self):
+        """ Keys with unsaved changes are left out of the written index. """
+        todolist = todo.TodoList(filename=self.filename)
+        todolist.get_key('key 4').remove_item(0)
+        self.found_keys(todolist, 'number 42 ')
+        reloaded = todo.TodoList(filename=self.filename)
+        self.assertEqual(self.found_keys(reloaded, 'number 4 '), ['key 4'])
+
+
+class TodoCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        patcher = mock.patch.dict(
+            os.environ,
+            {'XDG_CACHE_HOME': os.path.join(self.tmpdir, 'cache')},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.filename = os.path.join(self.tmpdir, 'todo.lst')
+        self.texts = {'key': ['one', 'two'], 'other': ['three']}
+        self.write_list(self.texts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, todolist):
+        return {
+            todokey.label: [item.text for item in todokey.data]
+            for todokey in todolist.todokeys()
+        }
+
+    def load(self, cached=True, **kwargs):
+        """ Load the list with the cache. When `cached` is True, the list
+            must come from the cache, without parsing the file.
+        """
+        if not cached:
+            return todo.TodoList(filename=self.filename, cache=True, **kwargs)
+        with mock.patch.object(
+                todo.TodoList,
+                'load_json',
+                side_effect=AssertionError('The file was parsed.')):
+            return todo.TodoList(filename=self.filename, cache=True, **kwargs)
+
+    def write_list(self, texts):
+        with open(self.filename, 'w') as f:
+            json.dump(texts, f)
+
+    def test_cached(self):
+        """ Parsed lists are cached, and the cache is used next time. """
+        todolist = todo.TodoList(filename=self.filename)
+        self.assertFalse(os.path.exists(todolist.cache_file()))
+        self.assertEqual(self.dump(self.load(cached=False)), self.texts)
+        self.assertTrue(os.path.exists(todolist.cache_file()))
+        self.assertEqual(self.dump(self.load()), self.texts)
+
+    def test_changed_file(self):
+        """ The cache is ignored, and replaced, after the file changes. """
+        self.load(cached=False)
+        self.texts['key'].append('four')
+        self.write_list(self.texts)
+        self.assertEqual(self.dump(self.load(cached=False)), self.texts)
+        self.assertEqual(self.dump(self.load()), self.texts)
+
+        # Same size, same inode, only the modified time changes.
+        with open(self.filename, 'r+b') as f:
+            jsondata = f.read()
+            f.seek(0)
+            f.write(jsondata.replace(b'four', b'FOUR'))
+        st = os.stat(self.filename)
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.texts['key'][-1] = 'FOUR'
+        self.assertEqual(self.dump(self.load(cached=False)), self.texts)
+
+    def test_journal(self):
+        """ Journal changes are applied on top of the cached snapshot. """
+        self.load(cached=False)
+        todolist = self.load(journal=True)
+        todolist.add_item('four', key='key')
+        todolist.save_file()
+        self.texts['key'].append('four')
+        self.assertEqual(self.dump(self.load()), self.texts)
+
+    def test_other_cache(self):
+        """ Caches for other files, and bad caches, are ignored. """
+        todolist = self.load(cached=False)
+        othername = os.path.join(self.tmpdir, 'other.lst')
+        shutil.copy2(self.filename, othername)
+        shutil.copy(todolist.cache_file(), todolist.cache_file(othername))
+        self.assertIsNone(todolist.load_cache(othername))
+        with open(todolist.cache_file(), 'wb') as f:
+            f.write(b'not a cache')
+        self.assertIsNone(todolist.load_cache())
+        self.assertEqual(self.dump(self.load(cached=False)), self.texts)
+        self.assertEqual(self.dump(self.load()), self.texts)
+
+    def test_saved(self):
+        """ Saving the list replaces the cache. """
+        todolist = self.load(cached=False)
+        todolist.add_item('four', key='other')
+        todolist.save_file()
+        self.texts['other'].append('four')
+        self.assertEqual(self.dump(self.load()), self.texts)
+
+
+class TodoFastArgsTests(unittest.TestCase):
+
+    def docopt_args(self, argv):
+        return todo.docopt(
+            todo.get_usage(),
+            argv=argv,
+            version=todo.VERSIONSTR,
+            script=todo.SCRIPT,
+        )
+
+    def test_fast_args(self):
+        """ Common commands are parsed the same as docopt parses them. """
+        argvs = (
+            [],
+            ['an item'],
+            ['key', 'an item'],
+            ['-l'],
+            ['-l', 'key'],
+            ['-f', 'other.lst', 'an item'],
+            ['--file', 'other.lst', '-l', 'key'],
+            ['-g', 'key', 'an item'],
+            ['--global', '-l'],
+            ['-D', 'an item'],
+            ['key', '--debug', 'an item'],
+            ['-f', 'other.lst', '-D', '-l'],
+        )
+        for argv in argvs:
+            with self.subTest(argv=argv):
+                self.assertEqual(
+                    todo.parse_fast_args(argv),
+                    self.docopt_args(argv),
+                )
+
+    def test_docopt_needed(self):
+        """ Other commands are left for docopt. """
+        argvs = (
+            ['-L'],
+            ['-j'],
+            ['-s', 'query'],
+            ['key', 'an item', 'extra'],
+            ['-l', 'key', 'an item'],
+            ['-i', 'an item'],
+            ['key', '-i'],
+            ['--limit', '2'],
+            ['-f'],
+            ['-f', '-l'],
+            ['-f', 'a.lst', '-f', 'b.lst'],
+            ['-D', '-D'],
+            ['-f', 'other.lst', '-g'],
+        )
+        for argv in argvs:
+            with self.subTest(argv=argv):
+                self.assertIsNone(todo.parse_fast_args(argv))
+
+
+class TodoServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.db')
+        todolist = todo.TodoList()
+        todolist.add_item('one', key='key')
+        todolist.save_as(self.filename)
+        self.server = todo.server_class()(
+            os.path.join(self.tmpdir, 'todo.sock'),
+            delay=60,
+        )
+
+    def tearDown(self):
+        self.server.server_close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def request(self, *args):
+        return self.server.run_request({
+            'argv': ['-f', self.filename] + list(args),
+            'cwd': self.tmpdir,
+        })
+
+    def saved_texts(self):
+        todolist = todo.TodoList(filename=self.filename)
+        return [item.text for item in todolist.get_key('key').data]
+
+    def test_client_returncode(self):
+        """ Commands that don't return an exit code succeed for clients,
+            and are only run once.
+        """
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.start()
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            returncode = todo.run_client(
+                ['-f', self.filename, '-l', 'key'],
+                self.server.socketfile,
+            )
+        thread.join()
+        self.assertEqual(returncode, 0)
+        self.assertEqual(stdout.getvalue().count('one'), 1)
+
+    def test_client_no_server(self):
+        """ Clients can tell when the server can't be reached. """
+        returncode = todo.run_client(
+            ['-l', 'key'],
+            os.path.join(self.tmpdir, 'missing.sock'),
+        )
+        self.assertIs(returncode, todo.NOSERVER)
+
+    def test_save_without_delay(self):
+        """ Lists saved without a delay aren't loaded again for the next
+            request.
+        """
+        self.server.delay = 0
+        self.request('key', 'two')
+        self.assertEqual(self.saved_texts(), ['one', 'two'])
+        todolist = self.server.lists[self.filename]
+        self.request('-l', 'key')
+        self.assertIs(self.server.lists[self.filename], todolist)
+
+    def test_default_keys(self):
+        """ Each list uses it's own default key, when several lists are
+            loaded.
+        """
+        otherfile = os.path.join(self.tmpdir, 'other.lst')
+        todolist = todo.TodoList()
+        todolist.add_item('b item', key='beta')
+        todolist.save_as(otherfile)
+        self.request('-l')
+        self.server.run_request({
+            'argv': ['-f', otherfile, '-l'],
+            'cwd': self.tmpdir,
+        })
+        response = self.request('newitem')
+        self.assertEqual(response['returncode'], 0)
+        todolist = self.server.lists[self.filename]
+        self.assertEqual(todolist.keynames(), ['key'])
+        self.assertEqual(
+            [item.text for item in todolist.get_key('key').data],
+            ['one', 'newitem'],
+        )
+
+    def test_delayed_save(self):
+        """ Delayed saves for SQLite lists are saved by service_actions().
+        """
+        response = self.request('key', 'two')
+        self.assertEqual(response['returncode'], 0)
+        self.assertIn(self.filename, self.server.deadlines)
+        self.server.service_actions()
+        self.assertEqual(self.saved_texts(), ['one'])
+        self.server.deadlines[self.filename] = 0
+        self.server.service_actions()
+        self.assertEqual(self.server.deadlines, {})
+        self.assertEqual(self.saved_texts(), ['one', 'two'])
+
+
+class TodoWindowTests(unittest.TestCase):
+
+    windows = (
+        {},
+        {'limit': '3'},
+        {'offset': '4'},
+        {'limit': '3', 'offset': '4'},
+        {'limit': '0'},
+        {'offset': '100'},
+        {'tail': True},
+        {'tail': True, 'limit': '3'},
+        {'tail': True, 'offset': '4'},
+        {'tail': True, 'limit': '3', 'offset': '18'},
+        {'tail': True, 'limit': '100'},
+    )
+
+    def setUp(self):
+        # Small lists get an index with a lower threshold.
+        patcher = mock.patch.object(todo.TodoList, 'index_min', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.todolist = todo.TodoList()
+        for i in range(20):
+            self.todolist.add_item('item {}'.format(i), key='key')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def window_lines(self, todokey, **window):
+        start, max_items = todo.get_window(todokey.get_count(), **window)
+        return list(todokey.to_lines(max_items=max_items, start=start))
+
+    def test_get_window(self):
+        """ Windows are counted from the start, or from the end for --tail.
+        """
+        self.assertEqual(todo.get_window(20), (0, None))
+        self.assertEqual(todo.get_window(20, limit='3', offset='4'), (4, 3))
+        self.assertEqual(todo.get_window(20, offset='100'), (100, None))
+        self.assertEqual(todo.get_window(20, tail=True), (10, 10))
+        self.assertEqual(todo.get_window(20, limit=3, tail=True), (17, 3))
+        self.assertEqual(
+            todo.get_window(20, limit=3, offset=4, tail=True),
+            (13, 3),
+        )
+        self.assertEqual(
+            todo.get_window(20, limit=3, offset=18, tail=True),
+            (0, 2),
+        )
+        self.assertEqual(todo.get_window(20, offset=30, tail=True), (0, 0))
+        self.assertEqual(todo.get_window(5, tail=True), (0, 5))
+        for window in ({'limit': '-1'}, {'offset': '-1'}, {'limit': 'x'}):
+            with self.assertRaises(ValueError):
+                todo.get_window(20, **window)
+
+    def test_lines(self):
+        """ Windows list the right items, with their real indexes. """
+        todokey = self.todolist.get_key('key')
+        self.assertEqual(
+            self.window_lines(todokey, limit='3', offset='4'),
+            [
+                'key:',
+                '    4: item 4',
+                '    5: item 5',
+                '    6: item 6',
+                '       (plus 13 more...)',
+            ],
+        )
+        self.assertEqual(
+            self.window_lines(todokey, tail=True, limit='2'),
+            ['key:', '    18: item 18', '    19: item 19'],
+        )
+        self.assertEqual(
+            self.window_lines(todokey, tail=True, limit='2', offset='1'),
+            [
+                'key:',
+                '    17: item 17',
+                '    18: item 18',
+                '       (plus 1 more...)',
+            ],
+        )
+
+    def test_unloaded_keys(self):
+        """ Every storage type lists the same windows, without loading the
+            key.
+        """
+        expected = [
+            self.window_lines(self.todolist.get_key('key'), **window)
+            for window in self.windows
+        ]
+        for filename in ('todo.lst', 'todo.db', 'todo.d'):
+            filename = os.path.join(self.tmpdir, filename)
+            self.todolist.save_as(filename)
+            with self.subTest(filename=filename):
+                todolist = todo.TodoList(filename=filename, lazy=True)
+                todokey = todolist.get_key('key')
+                self.assertFalse(todokey.is_loaded())
+                self.assertEqual(
+                    [
+                        self.window_lines(todokey, **window)
+                        for window in self.windows
+                    ],
+                    expected,
+                )
+                self.assertFalse(todokey.is_loaded())
+
+
+class TodoStreamTests(unittest.TestCase):
+
+    # Old {index: item} keys, escaped quotes, newlines, and unicode.
+    listdata = '''{
+    "plain": [
+        "one",
+        "two \\"quoted\\"",
+        "line\\nbreak",
+        "\\u00fcnicode ✓",
+        "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve"
+    ],
+    "old": {"0": "first", "1": "second \\"q\\"", "2": "third\\nline"},
+    "empty": []
+}'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='todo-test-')
+        self.filename = os.path.join(self.tmpdir, 'todo.lst')
+        self.write_list(self.listdata)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assert_same_output(self, *args):
+        """ Commands print the same thing for streamed and normal lists.
+        """
+        normal = self.run_main(*args)
+        self.assertIsNone(todo.todolist.lazyfile)
+        # Even small lists are streamed with a lower threshold.
+        with mock.patch.object(todo.TodoList, 'stream_min', 1):
+            streamed = self.run_main(*args)
+        self.assertIsInstance(todo.todolist.lazyfile, todo.TodoStream)
+        todo.todolist.lazyfile.close()
+        self.assertEqual(streamed, normal)
+        return streamed
+
+    def run_main(self, *args):
+        argd = todo.docopt(
+            todo.get_usage(),
+            argv=['-f', self.filename] + list(args),
+            script=todo.SCRIPT,
+        )
+        stdout = StringIO()
+        stderr = StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            returncode = todo.main(argd)
+        return returncode, stdout.getvalue(), stderr.getvalue()
+
+    def write_list(self, text):
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def test_json(self):
+        """ Streamed lists print the same JSON. """
+        _, output, _ = self.assert_same_output('-j')
+        self.assertIn('"two \\"quoted\\""', output)
+        self.assertIn('"line\\nbreak"', output)
+        self.assertIn('"third\\nline"', output)
+
+    def test_list(self):
+        """ Streamed lists are listed and previewed the same. """
+        _, output, _ = self.assert_same_output('-L')
+        self.assertIn('two "quoted"', output)
+        self.assertIn('\u00fcnicode \u2713', output)
+        self.assertIn('second "q"', output)
+        self.assertIn('twelve', output)
+        self.assert_same_output('-P')
+
+    def test_old_list(self):
+        """ Old lists (a single list of items) are streamed the same. """
+        self.write_list('["one", "two \\"quoted\\"", "line\\nbreak"]')
+        self.assert_same_output('-L')
+        self.assert_same_output('-j')
+
+    def test_search(self):
+        """ Streamed lists are searched the same. """
+        _, output, _ = self.assert_same_output('-s', 'q')
+        self.assertIn('second "q"', output)
+        self.assert_same_output('-s', '\u00fc')
+        self.assert_same_output('-s', 'line')
+        self.assert_same_output('-s', 'missing')
+
+    def test_window(self):
+        """ Streamed lists use the same --limit, --offset, and --tail.
+        """
+        _, output, _ = self.assert_same_output('-L', '--limit', '2')
+        self.assertIn('two "quoted"', output)
+        self.assertNotIn('line', output)
+        self.assert_same_output('-L', '--limit', '2', '--offset', '1')
+        self.assert_same_output('-L', '--offset', '10')
+        _, output, _ = self.assert_same_output('-L', '--tail')
+        self.assertNotIn('two "quoted"', output)
+        self.assertIn('twelve', output)
+        self.assert_same_output('-L', '--tail', '--limit', '2')
+        self.assert_same_output('-L', '--tail', '--offset', '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
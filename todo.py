@@ -7,13 +7,25 @@
 """
 
 import functools
+import io
+import itertools
 import json
 import os
 import re
 import shutil
+import stat
 import sys
-from collections import namedtuple, UserDict, UserList
-from contextlib import suppress
+import threading
+import time
+from collections import namedtuple, OrderedDict, UserDict, UserList
+from collections.abc import MutableSequence
+from contextlib import (
+    contextmanager,
+    nullcontext,
+    redirect_stderr,
+    redirect_stdout,
+    suppress,
+)
 
 # Creates a friendlier message when third-party imports fail.
 bad_import_msg = '\n'.join((
@@ -21,41 +33,125 @@ bad_import_msg = '\n'.join((
     'You may need to install {name} with pip: pip install {package}'
 )).format
 
-try:
-    from colr import (
-        __version__ as colr_version,
-        auto_disable as colr_auto_disable,
-        color,
-        Colr as C,
-        disabled as colr_disabled,
-    )
-except ImportError as ex:
-    print(
-        bad_import_msg(err=ex, name='Colr', package='colr'),
-        file=sys.stderr,
-    )
-    sys.exit(1)
-try:
-    from colr import docopt
-except ImportError as ex:
-    print(
-        bad_import_msg(err=ex, name='Docopt', package='docopt'),
-        file=sys.stderr,
-    )
-    sys.exit(1)
+# Third-party modules are imported the first time they are needed, so that
+# common commands start quickly. colr is only imported when colors are used,
+# and printdebug is only imported in debug mode.
+# The colr module, once it's imported (see import_colr()).
+colrmod = None
+# Whether colors are enabled, even when colr hasn't been imported yet.
+COLORS = True
+# The printdebug.DebugColrPrinter, in debug mode (see enable_debug()).
+debugprinter = None
 
-try:
-    from printdebug import DebugColrPrinter
-except ImportError as ex:
-    print(
-        bad_import_msg(err=ex, name='PrintDebug', package='printdebug'),
-        file=sys.stderr,
+
+def C(*args, **kwargs):
+    """ A colr.Colr() object, importing colr if needed. """
+    return import_colr().Colr(*args, **kwargs)
+
+
+def color(text=None, fore=None, back=None, style=None, **kwargs):
+    """ colr.color(), without importing colr when colors are disabled.
+        Plain strings are wrapped in cached escape codes (see color_codes()),
+        instead of building the codes for every call.
+    """
+    if not COLORS:
+        return '' if text is None else str(text)
+    if isinstance(text, str) and (not kwargs) and ('\x1b' not in text):
+        # Text with escape codes in it is left to colr, which checks them.
+        prefix, suffix = color_codes(fore=fore, back=back, style=style)
+        return ''.join((prefix, text, suffix)) if text else prefix
+    return import_colr().color(
+        text=text,
+        fore=fore,
+        back=back,
+        style=style,
+        **kwargs
     )
-    sys.exit(1)
 
-debugprinter = DebugColrPrinter()
-debugprinter.disable()
-debug = debugprinter.debug
+
+@functools.lru_cache(maxsize=None)
+def color_codes(fore=None, back=None, style=None):
+    """ Returns (prefix, suffix) escape codes for a color/style, as colr
+        would add them to some text. They are only built once for each
+        style.
+    """
+    colr = import_colr()
+    prefix = colr.color(text='', fore=fore, back=back, style=style)
+    colored = colr.color(text=' ', fore=fore, back=back, style=style)
+    return prefix, colored[len(prefix) + 1:]
+
+
+def colr_auto_disable():
+    """ colr.auto_disable(), without importing colr.
+        Colors are disabled when stdout is not a terminal.
+    """
+    if not sys.stdout.isatty():
+        colr_disable()
+
+
+def colr_disable():
+    """ colr.disable(), without importing colr. """
+    global COLORS
+    COLORS = False
+    if colrmod is not None:
+        colrmod.disable()
+
+
+def colr_disabled():
+    """ colr.disabled(), without importing colr. """
+    return not COLORS
+
+
+def colr_enable():
+    """ colr.enable(), without importing colr. """
+    global COLORS
+    COLORS = True
+    if colrmod is not None:
+        colrmod.enable()
+
+
+def debug(*args, **kwargs):
+    """ Does nothing, until enable_debug() replaces it with the
+        debugprinter's debug().
+    """
+    return None
+
+
+def docopt(doc, **kwargs):
+    """ colr.docopt(), importing colr and docopt when it is first used. """
+    import_colr()
+    try:
+        with timed('import docopt'):
+            from colr import docopt as colr_docopt
+    except ImportError as ex:
+        print(
+            bad_import_msg(err=ex, name='Docopt', package='docopt'),
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    return colr_docopt(doc, **kwargs)
+
+
+def import_colr():
+    """ Import colr if it hasn't been imported yet, and return the module.
+        The module is set up to match colr_enable()/colr_disable().
+    """
+    global colrmod
+    if colrmod is None:
+        try:
+            with timed('import colr'):
+                import colr
+        except ImportError as ex:
+            print(
+                bad_import_msg(err=ex, name='Colr', package='colr'),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if not COLORS:
+            colr.disable()
+        colrmod = colr
+    return colrmod
+
 
 NAME = 'Todo'
 VERSION = '2.6.1'
@@ -63,29 +159,33 @@ VERSIONSTR = '{} v. {}'.format(NAME, VERSION)
 SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
 SCRIPTDIR = os.path.abspath(sys.path[0])
 
-USAGESTR = """{versionstr}
+# The usage string is only formatted when docopt needs it (see get_usage()).
+USAGETEMPLATE = """{versionstr}
     Usage:
         {script} -h | -v
         {script} [-a | -b | -d | -r | -R | -s | -t | -u] KEY ITEM
-             [-f filename | -g] [-D]
+             [-f filename | -g] [options]
         {script} [-a | -b | -d | -r | -R | -s | -t | -u] ITEM
-             [-f filename | -g] [-D]
-        {script} [-c] | [-i] | ([-j] [KEY]) [-f filename | -g] [-D]
-        {script} -a [-i] KEY ITEM           [-f filename | -g] [-D]
-        {script} -a [-i] ITEM               [-f filename | -g] [-D]
-        {script} -e FILE KEY                [-f filename | -g] [-D]
-        {script} -I KEY [ITEM]              [-f filename | -g] [-D]
-        {script} -I (KEY | ITEM)            [-f filename | -g] [-D]
-        {script} -i KEY [ITEM]              [-f filename | -g] [-D]
-        {script} -i (KEY | ITEM)            [-f filename | -g] [-D]
-        {script} -K KEY                     [-f filename | -g] [-D]
-        {script} -l [-i] [KEY]              [-f filename | -g] [-D]
-        {script} (-k | -L | -P) [-i]        [-f filename | -g] [-D]
-        {script} -m KEY ITEM <new_key>      [-f filename | -g] [-D]
-        {script} -m ITEM <new_key>          [-f filename | -g] [-D]
-        {script} -n [KEY] <new_keyname>     [-f filename | -g] [-D]
-        {script} -p KEY ITEM <new_position> [-f filename | -g] [-D]
-        {script} -p ITEM <new_position>     [-f filename | -g] [-D]
+             [-f filename | -g] [options]
+        {script} [-c] | [-i] | ([-j] [KEY]) [-f filename | -g] [options]
+        {script} -a [-i] KEY ITEM           [-f filename | -g] [options]
+        {script} -a [-i] ITEM               [-f filename | -g] [options]
+        {script} -B [<batch_file>]          [-f filename | -g] [options]
+        {script} -C <new_file>              [-f filename | -g] [options]
+        {script} -e FILE KEY                [-f filename | -g] [options]
+        {script} -I KEY [ITEM]              [-f filename | -g] [options]
+        {script} -I (KEY | ITEM)            [-f filename | -g] [options]
+        {script} -i KEY [ITEM]              [-f filename | -g] [options]
+        {script} -i (KEY | ITEM)            [-f filename | -g] [options]
+        {script} -K KEY                     [-f filename | -g] [options]
+        {script} -l [-i] [KEY]              [-f filename | -g] [options]
+        {script} (-k | -L | -P) [-i]        [-f filename | -g] [options]
+        {script} -m KEY ITEM <new_key>      [-f filename | -g] [options]
+        {script} -m ITEM <new_key>          [-f filename | -g] [options]
+        {script} -n [KEY] <new_keyname>     [-f filename | -g] [options]
+        {script} -p KEY ITEM <new_position> [-f filename | -g] [options]
+        {script} -p ITEM <new_position>     [-f filename | -g] [options]
+        {script} --server [<socket_file>]   [options]
 
     Options:
         KEY                    : Key or label for the item.
@@ -93,23 +193,40 @@ USAGESTR = """{versionstr}
         ITEM                   : Item to add, or query to use when finding
                                  an item. When looking items up, the item
                                  number may also be used.
+        <batch_file>           : File with commands for --batch.
+                                 Defaults to stdin, or use '-'.
         <new_key>              : New key for item when moving between keys.
         <new_keyname>          : New key name when renaming a key.
+        <new_file>             : New file name when converting the list.
         <new_position>         : New position number for item when position
                                  action is used.
                                  Index must be (>= 0 and < list length).
                                  You may also use 't[op]', or 'b[ottom]'.
+        <socket_file>          : Unix socket file for --server.
+                                 Defaults to $TODO_SOCKET, or a todo.sock
+                                 file in $XDG_RUNTIME_DIR (or /tmp).
         -a,--add               : Add an item to the list.
                                  You may omit this option and just enter
                                  the item (with optional key first),
                                  unless you want to mark an item as
                                  important while adding it.
         -b,--bottom            : Unprioritize item. (put on the bottom).
+        -B,--batch             : Run commands from a file or stdin, one per
+                                 line, and save once when finished.
+                                 Commands use the same arguments as the
+                                 command line, or a JSON list of
+                                 arguments. Lines starting with # are
+                                 ignored.
         -c,--clear             : Clear all items. Confirmation needed.
+        -C,--convert           : Copy the list into a new file, converting
+                                 it to the new file's storage type.
         -d,--down              : Bump item down one spot on the list.
         -D,--debug             : Debug mode, prints extra information.
                                  Gives you a look into what's going on
                                  behind the scenes.
+        --delay secs           : Seconds the server waits before saving
+                                 changes, so a burst of changes is saved
+                                 once. [default: 1]
         -f FILE,--file FILE    : Use this input file instead of todo.lst.
         -g,--global            : Use global todo.lst even when a local file
                                  exists.
@@ -117,35 +234,81 @@ USAGESTR = """{versionstr}
         -i,--important         : Mark key/item as important (bold/red).
                                  Only show important items when listing.
         -I,--unimportant       : Mark key/item as unimportant.
+        -J,--journal           : Append changes to a journal file instead of
+                                 rewriting the whole list on every save.
+                                 This is automatic when a journal exists.
         -j,--json              : Show list, or a specific key in JSON format.
         -k,--listkeys          : List key names only.
         -K,--removekey         : Remove a key/label. (includes all items)
         -l,--list              : List items from a certain key.
                                  Defaults to: (first key)
+        --limit num            : Only list this many items from each key.
         -L,--listall           : List all items from all keys.
                                  This is the default action when no
                                  arguments are given.
         -m,--movetokey         : Move item to a new key, or another key.
         -n,--renamekey         : Give a key another name/label.
+        --offset num           : Skip this many items in each key when
+                                 listing.
         -p,--position          : Move item to a new position in the same
                                  key.
+        --pager                : Show output in a pager ($PAGER, or less).
+        --profile              : Profile the command with cProfile, and
+                                 print the slowest functions to stderr.
+        --profile-count num    : Number of functions (and allocation
+                                 sites) to show when profiling.
+                                 [default: 25]
+        --profile-file file    : Save the profile to a .pstats file, for
+                                 pstats or other profile viewers.
+                                 Implies --profile.
+        --profile-memory       : Trace memory allocations while profiling,
+                                 and show the peak memory use and the top
+                                 allocation sites. Implies --profile.
         -P,--preview           : Preview the list. Like --listall, except
                                  some items are cut off.
         -r,--remove            : Remove an item from the list.
                                  Accepts item number or regex to match.
+                                 All matching items are removed.
                                  Confirmation is needed.
         -R,--REMOVE            : Same as --remove, no confirmation though.
         -s,--search            : Search for items by index or regex/text.
+        --server               : Keep lists loaded in a background server,
+                                 listening on a unix socket. When
+                                 $TODO_SOCKET is set, commands are sent to
+                                 the server instead of loading the list.
+        -S TYPE,--storage TYPE : Storage type for the list file, either
+                                 'json', 'sqlite', or 'shards'.
+                                 By default, files ending in .db, .sqlite,
+                                 or .sqlite3 are SQLite databases, and
+                                 directories (or names ending in .d) hold
+                                 one file per key.
         -t,--top               : Prioritize item (put on top of the list).
+        --tail                 : List the last items of each key. Shows 10
+                                 items, unless --limit is used. Items
+                                 skipped with --offset are at the end.
+        --timings file         : Append the time spent in each part of
+                                 the run to a file, as a JSON line.
+                                 Use '-' for stderr. Debug mode also
+                                 prints them as a table.
         -u,--up                : Bump item up one spot on the list.
         -v,--version           : Show version.
-""".format(script=SCRIPT, versionstr=VERSIONSTR)
+"""
 
 # Global flags/settings. ------------------------------------------
 DEBUG = False
 DEBUGARGS = False
+# Set while --batch commands are running. The batch is saved, and the save
+# is reported, once when all commands are finished. (see do_batch())
+BATCH = False
+# Parts of the run that were timed, as [phase, depth, seconds], or None
+# when nothing is being timed. (see timed())
+TIMINGS = None
+# Number of timed() phases that are running.
+TIMING_DEPTH = 0
+# Returned by run_client() when the server can't be reached. Exit codes
+# can't be confused with it.
+NOSERVER = object()
 DEFAULTFILE = os.path.join(SCRIPTDIR, 'todo.lst')
-LOCALFILE = os.path.join(os.getcwd(), 'todo.lst')
 # Global TodoList() to work with (..set in main())
 todolist = None
 
@@ -157,7 +320,8 @@ def main(argd):  # noqa
     """ Main entry point, expects doctopt arg dict as argd """
     global DEBUG, todolist, userkey, useritem
     DEBUG = argd['--debug']
-    debugprinter.enable(DEBUG)
+    if DEBUG or DEBUGARGS:
+        enable_debug()
     if DEBUGARGS:
         DEBUG = True
         debug('Arguments: ')
@@ -165,61 +329,77 @@ def main(argd):  # noqa
         return 0
     debug_header()
 
-    # Use provided file, then local, then the default.
-    if argd['--file']:
-        todofile = argd['--file']
-    elif (not argd['--global']) and os.path.exists(LOCALFILE):
-        todofile = LOCALFILE
-    else:
-        todofile = DEFAULTFILE
-
-    # Load todolist if available.
-    try:
-        todolist = TodoList(filename=todofile)
-    except TodoList.NoFileExists:
-        debug('No file exists at: {}'.format(todofile))
-    except TodoList.ParseError as exparse:
-        printstatus('The todo.lst couldn\'t be loaded!', error=exparse)
-        return 1
-    except Exception as ex:
-        printstatus('There was an error while loading the list:', error=ex)
-        return 1
-
-    if todolist is None:
-        todolist = TodoList()
-        todolist.filename = todofile
-    if not argd['--json']:
-        printheader(todolist)
+    if argd['--server']:
+        return do_server(
+            argd['<socket_file>'] or get_socketfile(),
+            delay=argd['--delay'],
+        )
 
     # Build a map of cmdline-args to functions.
-    # Return the proper function to run, or None.
-    runaction = get_action(argd)
-    if runaction is None:
-        # Default actions when no args are present.
-        if argd['ITEM']:
-            # If the item is actually the name of a key, list that key.
-            trykey = todolist.get_key(argd['ITEM'])
-            if trykey:
-                return do_listkey(trykey)
-
-            # User is adding an item.
-            kwargs = {
-                'key': (argd['KEY'] or TodoKey.null),
-                'important': argd['--important'],
-            }
-            return do_add(argd['ITEM'], **kwargs)
-
-        # User is listing all items.
-        return do_listall()
+    # Return the proper function to run, or None for the default action.
+    action = get_action(argd)
 
-    # Run the action that was chosen based on cmdline-args.
     try:
-        retvalue = runaction()
-    except Exception as ex:
-        printstatus('Error:', error=ex)
+        profilecount = int(argd['--profile-count'])
+    except ValueError as ex:
+        printstatus('Invalid --profile-count:', error=ex)
         return 1
+    # The other --profile options imply --profile.
+    profiling = (
+        argd['--profile'] or
+        argd['--profile-file'] or
+        argd['--profile-memory']
+    )
+    # Loading the list, and running the action, are profiled together.
+    with profiled(
+            enabled=profiling,
+            count=profilecount,
+            filename=argd['--profile-file'],
+            memory=argd['--profile-memory']):
+        # Load todolist if available.
+        with timed('find file'):
+            filename = get_todofile(argd)
+        try:
+            todolist = load_list(
+                filename,
+                argd,
+                # Big lists are streamed for commands that only read them.
+                stream=is_read_only(action, argd),
+            )
+        except TodoList.ParseError as exparse:
+            printstatus('The todo.lst couldn\'t be loaded!', error=exparse)
+            return 1
+        except Exception as ex:
+            printstatus('There was an error while loading the list:', error=ex)
+            return 1
+
+        with paged_stdout(enabled=argd['--pager']):
+            if not argd['--json']:
+                with timed('header'):
+                    printheader(todolist)
+
+            runaction = action or get_default_action(argd)
 
-    return retvalue
+            # Run the action that was chosen based on cmdline-args.
+            # Any saves are done once, after the action is finished.
+            # Batches use their own transaction, so they can report the
+            # save after it's done.
+            if argd['--batch']:
+                transaction = nullcontext()
+            else:
+                transaction = todolist.transaction()
+            try:
+                with transaction:
+                    with timed('action'):
+                        retvalue = runaction()
+            except BrokenPipeError:
+                # The pager was closed before everything was written.
+                return 1
+            except Exception as ex:
+                printstatus('Error:', error=ex)
+                return 1
+
+        return retvalue
 
 # Functions -------------------------------------------------------
 
@@ -234,12 +414,22 @@ def build_actions(argdict):
     debug('Using key: {!r}'.format(userkey))
 
     userimportant = argdict['--important']
+    # Part of each key to list, for --limit, --offset, and --tail.
+    listwindow = {
+        'limit': argdict['--limit'],
+        'offset': argdict['--offset'],
+        'tail': argdict['--tail'],
+    }
     actions = {
         '--add': {
             'function': do_add,
             'args': [useritem],
             'kwargs': {'key': userkey, 'important': userimportant},
         },
+        '--batch': {
+            'function': do_batch,
+            'args': [argdict['<batch_file>']],
+        },
         '--bottom': {
             'function': do_move_item,
             'args': [useritem, 'bottom'],
@@ -248,6 +438,10 @@ def build_actions(argdict):
         '--clear': {
             'function': do_clear,
         },
+        '--convert': {
+            'function': do_convert,
+            'args': [argdict['<new_file>']],
+        },
         '--down': {
             'function': do_move_item,
             'args': [useritem, 'down'],
@@ -268,16 +462,15 @@ def build_actions(argdict):
         },
         '--list': {
             'function': do_listkey,
-            'kwargs': {
-                'key': userkey,
-                'important_only': userimportant,
-            },
+            'kwargs': dict(
+                listwindow,
+                key=userkey,
+                important_only=userimportant,
+            ),
         },
         '--listall': {
             'function': do_listall,
-            'kwargs': {
-                'important_only': userimportant,
-            },
+            'kwargs': dict(listwindow, important_only=userimportant),
         },
         '--listkeys': {
             'function': do_listkeys,
@@ -295,10 +488,11 @@ def build_actions(argdict):
         },
         '--preview': {
             'function': do_listall,
-            'kwargs': {
-                'preview': True,
-                'important_only': userimportant
-            },
+            'kwargs': dict(
+                listwindow,
+                preview=True,
+                important_only=userimportant,
+            ),
         },
         '--remove': {
             'function': do_remove,
@@ -360,7 +554,7 @@ def check_empty_key(key=None, silentsave=False):
             todokey))
         return False
 
-    if len(todokey) == 0:
+    if todokey.get_count() == 0:
         debug('Key is empty: {}'.format(todokey.label))
         warn = ('This key is empty now:', todokey.label)
         msg = 'Would you like to remove the key?'
@@ -393,18 +587,25 @@ def confirm(question, header=None, warn=None, forceanswer=False):
         question = '\n{}'.format(question)
     question = '{} (y/N): '.format(question)
 
-    ans = input(question).lower()
-    while forceanswer and (not ans):
+    try:
         ans = input(question).lower()
+        while forceanswer and (not ans):
+            ans = input(question).lower()
+    except EOFError:
+        # No more input (stdin was used for --batch, or closed).
+        print('')
+        return False
 
     return (ans[0] == 'y') if ans else False
 
 
 def debug_header():
     """ Print some debug info about this Todo version, if DEBUG is truthy. """
+    if not DEBUG:
+        return
     debug('Using:')
     debug(
-        'colr  : {}'.format(colr_version),
+        'colr  : {}'.format(import_colr().__version__),
         align=True
     )
     debug(
@@ -430,11 +631,77 @@ def do_add(text, key=None, important=False):
         'Added item:',
         key=key,
         item=newitem,
-        index=len(key) - 1,
+        index=key.get_count() - 1,
     )
     return do_save()
 
 
+def do_batch(filename=None):
+    """ Run commands from a file (or stdin), one per line.
+        The list is loaded once, and saved once when all commands are
+        finished. A command that fails is rolled back, without undoing
+        the other commands.
+        Returns 1 if any of the commands failed, otherwise 0.
+    """
+    global BATCH
+    if filename and (filename != '-'):
+        try:
+            with open(filename, 'r') as f:
+                lines = f.readlines()
+        except EnvironmentError as ex:
+            printstatus('Unable to read batch file:', error=ex)
+            return 1
+    else:
+        # All lines are read first, so they aren't mistaken for answers.
+        lines = sys.stdin.readlines()
+
+    total = errs = 0
+    BATCH = True
+    try:
+        with todolist.transaction():
+            for linenum, line in enumerate(lines, start=1):
+                line = line.strip()
+                if (not line) or line.startswith('#'):
+                    continue
+                total += 1
+                printstatus('Command {}:'.format(linenum), item=line)
+                try:
+                    argdict = parse_batch_line(line)
+                except ValueError as ex:
+                    printstatus('Invalid command:', error=ex)
+                    errs += 1
+                    continue
+                runaction = (
+                    get_action(argdict) or get_default_action(argdict)
+                )
+                try:
+                    with todolist.transaction():
+                        ret = runaction()
+                        if ret:
+                            # Only this command's changes are undone.
+                            raise TodoList.Rollback()
+                except Exception as ex:
+                    printstatus('Error:', error=ex)
+                    ret = 1
+                if ret:
+                    errs += 1
+            saving = todolist.save_requested and todolist.has_changes()
+    finally:
+        BATCH = False
+
+    if saving:
+        itemcount = todolist.get_count()
+        if itemcount:
+            printstatus('Items saved:', index=itemcount)
+        else:
+            printstatus('Items saved. (list is blank)')
+    printstatus(
+        'Batch finished, {} of {} commands failed.'.format(errs, total),
+        error=(errs > 0),
+    )
+    return 1 if errs else 0
+
+
 def do_clear():
     """ Clear all items (after confirmation.) """
     itemcnt = todolist.get_count()
@@ -449,6 +716,22 @@ def do_clear():
     return 1
 
 
+def do_convert(filename):
+    """ Copy the list into a new file, converting between storage types. """
+    if os.path.exists(filename):
+        warnmsg = ('This file already exists:', filename)
+        if not confirm('Overwrite it with this list?', warn=warnmsg):
+            printstatus('User cancelled.', error=True)
+            return 1
+    itemcount = todolist.save_as(filename)
+    printstatus(
+        'Converted list to {}:'.format(TodoList.storage_for(filename)),
+        index=itemcount,
+        item=filename,
+    )
+    return 0
+
+
 def do_export(key=None, filename=None):
     """ Export a key, or all keys to another JSON file.
         This will try to safely merge with existing files.
@@ -458,7 +741,7 @@ def do_export(key=None, filename=None):
             filename  : Existing or new JSON file name. Content will be
                         printed to stdout if '-' is given.
     """
-    todokey = get_key(key or TodoKey.null)
+    todokey = get_key(key or todolist.null_key)
     if todokey is None:
         return 1
     if filename in (None, '-'):
@@ -475,24 +758,35 @@ def do_json(key=None):
         return do_export(key=key)
 
     try:
-        jsondata = todolist.to_json()
+        # Lines are written as they are built, so streamed lists are never
+        # loaded all at once.
+        write_lines(todolist.to_json_lines())
     except TodoList.ParseError:
         printstatus('Unable to format JSON!', error=True)
         return 1
-
-    print(jsondata)
     return 1
 
 
-def do_listall(preview=False, important_only=False):
+def do_listall(
+        preview=False, important_only=False,
+        limit=None, offset=None, tail=False):
     """ List all items in all keys. """
+    try:
+        # Check the window once, instead of failing for every key.
+        get_window(0, limit=limit, offset=offset)
+    except ValueError as ex:
+        printstatus('Invalid --limit/--offset:', error=ex)
+        return 1
     retall = 0
     names = todolist.keynames()
     for keyname in names:
         ret = do_listkey(
             keyname,
             preview=preview,
-            important_only=important_only
+            important_only=important_only,
+            limit=limit,
+            offset=offset,
+            tail=tail,
         )
         if ret == 1:
             retall = 1
@@ -503,9 +797,14 @@ def do_listall(preview=False, important_only=False):
     return retall
 
 
-def do_listkey(key=None, preview=False, important_only=False):
-    """ List all items within a key. """
-    todokey = get_key(key or TodoKey.null)
+def do_listkey(
+        key=None, preview=False, important_only=False,
+        limit=None, offset=None, tail=False):
+    """ List all items within a key, or just part of them when a limit,
+        offset, or tail is used. Only the listed items are loaded for lazy
+        keys.
+    """
+    todokey = get_key(key or todolist.null_key)
 
     if todokey is None:
         return 1
@@ -518,21 +817,33 @@ def do_listkey(key=None, preview=False, important_only=False):
             nobreak=True
         )
         return 1
-    if important_only and (not todokey.important_items()):
+    if important_only and (not todokey.get_important_count()):
         return 0
 
-    if preview:
-        keystr = todokey.preview_str(
-            color=True,
-            important_only=important_only
-        )
-    else:
-        keystr = todokey.to_str(
-            color=True,
-            important_only=important_only
+    if preview and (limit is None):
+        limit = todokey.preview_items
+    try:
+        start, max_items = get_window(
+            todokey.get_count(),
+            limit=limit,
+            offset=offset,
+            tail=tail,
         )
+    except ValueError as ex:
+        printstatus('Invalid --limit/--offset:', error=ex)
+        return 1
 
-    print('    {}'.format(keystr.replace('\n', '\n    ')))
+    # Lines are written as they are built, instead of building one big
+    # string for the whole key.
+    write_lines(
+        todokey.to_lines(
+            max_items=max_items,
+            color=True,
+            important_only=important_only,
+            start=start,
+        ),
+        indent='    ',
+    )
 
 
 def do_listkeys(important_only=False):
@@ -555,7 +866,7 @@ def do_listkeys(important_only=False):
         ).ljust(longestkeylen)
         # Number of items.
         lenfmt = C(
-            '{} items'.format(len(todolist[keyname])),
+            '{} items'.format(todolist[keyname].get_count()),
             fore='blue',
         ).join('[', ']')
         print('{} {}'.format(namefmt, lenfmt))
@@ -583,7 +894,7 @@ def do_mark_important(query, key=None, adding=False, important=True):
         if not items:
             printstatus('Cannot find that item: {}'.format(key), error=True)
             return 1
-        # TODO: this is very inefficient.
+        # Each item is saved once, when main()'s transaction is finished.
         errs = 0
         for listresult in items:
             if adding:
@@ -605,7 +916,7 @@ def do_mark_important(query, key=None, adding=False, important=True):
         return do_add(query, key=key, important=important)
 
     # We should have a useable key name after this, or else everything fails.
-    todokey = get_key(key or TodoKey.null)
+    todokey = get_key(key or todolist.null_key)
     if todokey is None:
         return 1
 
@@ -614,14 +925,13 @@ def do_mark_important(query, key=None, adding=False, important=True):
 
     if not query:
         # No query, we are marking a key as important.
-        todokey.important = important
+        todokey.mark_important(important)
         printstatus(msg, key=todokey)
     else:
-        keyresult = todokey.find_item(query)
+        keyresult = todokey.mark_item(query, important=important)
         if not keyresult:
             printstatus('Unable to find that item:', item=query, error=True)
             return 1
-        keyresult.item.important = important
         printstatus(
             msg,
             key=todokey,
@@ -636,7 +946,7 @@ def do_move_item(query, newindex, key=None):
     if not newindex:
         printstatus('Invalid new position given:', index=newindex, error=True)
         return 1
-    key = key or TodoKey.null
+    key = key or todolist.null_key
     todokey = get_key(key)
     if todokey is None:
         return 1
@@ -723,8 +1033,23 @@ def do_move_tokey(query, newkey, key=None):
 
 
 def do_remove(query, key=None, confirmation=True):
-    """ Remove an item (if no key is given, the default key is used.) """
-    items = todolist.find_item(query, key=key)
+    """ Remove all items matching a query (if no key is given, all keys are
+        searched.)
+    """
+    if key is None:
+        results = [
+            (todolist.get_key(keyname), keyresults)
+            for keyname, keyresults in todolist.search_items(query)
+        ]
+    else:
+        todokey = todolist.get_key(key, None)
+        keyresults = [] if todokey is None else todokey.search_items(query)
+        results = [(todokey, keyresults)] if keyresults else []
+    items = [
+        TodoList.TodoListResult(todokey, index, item)
+        for todokey, keyresults in results
+        for index, item in keyresults
+    ]
     if not items:
         printstatus('Could not find:', key=(key or '(any key)'), item=query)
         if query in todolist.keynames():
@@ -750,32 +1075,36 @@ def do_remove(query, key=None, confirmation=True):
             printstatus('User Cancelled', error=True)
             return 1
 
-    for listresult in items:
-        removed = listresult.key.remove_item(listresult.index)
-        if removed is None:
-            printstatus('Could not find:', key=listresult.key, item=query)
+    # Each key's matches are removed at once, so the indexes found above
+    # don't shift while removing them.
+    for todokey, keyresults in results:
+        indexes = [keyresult.index for keyresult in keyresults]
+        removed = todokey.remove_indexes(indexes)
+        if len(removed) != len(indexes):
+            printstatus('Could not find:', key=todokey, item=query)
             return 1
-        printstatus(
-            'Removed:',
-            key=listresult.key,
-            item=removed,
-            index=listresult.index
-        )
+        for keyresult in removed:
+            printstatus(
+                'Removed:',
+                key=todokey,
+                item=keyresult.item,
+                index=keyresult.index
+            )
         # Offer to delete the key if it is empty.
-        if not check_empty_key(listresult.key, silentsave=True):
-            debug('Key still has items: {}'.format(listresult.key.label))
+        if not check_empty_key(todokey, silentsave=True):
+            debug('Key still has items: {}'.format(todokey.label))
 
     return do_save()
 
 
 def do_removekey(key=None, confirmation=True, silentsave=False):
     """ Remove a key and all of it's items. """
-    key = key if key is not None else TodoKey.null
+    key = key if key is not None else todolist.null_key
     todokey = get_key(key)
     if todokey is None:
         return 1
 
-    itemcnt = len(todokey)
+    itemcnt = todokey.get_count()
     if itemcnt > 1 and confirmation:
         warnmsg = 'This will delete {} items!'.format(itemcnt)
         msg = 'Are you sure you want to delete {}?'.format(colorkey(key))
@@ -792,7 +1121,7 @@ def do_removekey(key=None, confirmation=True, silentsave=False):
 
 def do_renamekey(newkeyname, key=None):
     """ Rename a key. """
-    key = key if key is not None else TodoKey.null
+    key = key if key is not None else todolist.null_key
     # TODO: All of these checks need to be TodoList methods...
     # TODO: write TODO comments in the TODO apps code.
     # TODO: use the Todo app to write TODOS.
@@ -823,7 +1152,16 @@ def do_renamekey(newkeyname, key=None):
 
 
 def do_save(silent=False):
-    """ Save all items to disk. """
+    """ Save all items to disk, if anything has changed. """
+    if BATCH:
+        # Saved and reported once, when the batch is finished.
+        todolist.save_file()
+        return 0
+    if todolist.filename and os.path.exists(todolist.filename):
+        if not todolist.has_changes():
+            if not silent:
+                printstatus('No changes to save.')
+            return 0
     itemcount = todolist.save_file()
     if itemcount > 0:
         if not silent:
@@ -865,6 +1203,104 @@ def do_search(query, key=None):
     return 0 if total else 1
 
 
+def do_server(socketfile, delay=1):
+    """ Run a TodoServer on a unix socket, until it is interrupted. """
+    global TIMINGS
+    # The server runs until it's stopped, timings would pile up.
+    TIMINGS = None
+    try:
+        delay = float(delay)
+    except (TypeError, ValueError):
+        printstatus('Invalid delay:', item=delay, error=True)
+        return 1
+    # Only imported when it's needed, to keep startup fast.
+    import signal
+    import socket
+    if os.path.exists(socketfile):
+        # Remove stale socket files, but not one that is still being used.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socketfile)
+            except EnvironmentError:
+                debug('Removing stale socket: {}'.format(socketfile))
+                os.remove(socketfile)
+            else:
+                printstatus(
+                    'A server is already running on:',
+                    item=socketfile,
+                    error=True,
+                )
+                return 1
+    try:
+        server = server_class()(socketfile, delay=delay)
+    except EnvironmentError as ex:
+        printstatus('Unable to start the server:', error=ex)
+        return 1
+
+    # Pending changes are saved when the server is stopped.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    printstatus('Server listening on:', item=socketfile)
+    try:
+        # Poll often enough to save close to the delay.
+        server.serve_forever(poll_interval=min(delay, 0.5) or 0.5)
+    except KeyboardInterrupt:
+        printstatus('Stopping the server.')
+    finally:
+        server.server_close()
+    return 0
+
+
+def enable_debug():
+    """ Import printdebug and set up the debugprinter, replacing the
+        placeholder debug() function with the debugprinter's.
+    """
+    global debug, debugprinter
+    # Colors for the debug printer should match the current settings.
+    import_colr()
+    try:
+        with timed('import printdebug'):
+            from printdebug import DebugColrPrinter
+    except ImportError as ex:
+        print(
+            bad_import_msg(err=ex, name='PrintDebug', package='printdebug'),
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    debugprinter = DebugColrPrinter()
+    debug = debugprinter.debug
+
+
+def file_mode(filename):
+    """ Return the permission bits for an existing file, or the default
+        permissions for a new file (based on the current umask).
+    """
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def fsync_dir(dirname):
+    """ Flush a directory's entries to disk, so renames inside of it are
+        durable. Returns False if the directory couldn't be synced.
+    """
+    try:
+        fd = os.open(dirname or os.curdir, os.O_RDONLY)
+    except EnvironmentError as ex:
+        debug('Unable to open directory for sync: {} ({})'.format(dirname, ex))
+        return False
+    try:
+        os.fsync(fd)
+    except EnvironmentError as ex:
+        debug('Unable to sync directory: {} ({})'.format(dirname, ex))
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
 def get_action(argdict):
     """ Return a function to run based on user args. If no action can be found,
         (no args present) then None is returned.
@@ -893,9 +1329,75 @@ def get_action(argdict):
     return None
 
 
+def get_default_action(argdict):
+    """ Return a function to run when no action args are present.
+        This adds an item, lists a key, or lists all items.
+    """
+    if argdict['ITEM']:
+        # If the item is actually the name of a key, list that key.
+        trykey = todolist.get_key(argdict['ITEM'])
+        if trykey:
+            return functools.partial(do_listkey, trykey)
+
+        # User is adding an item.
+        return functools.partial(
+            do_add,
+            argdict['ITEM'],
+            key=(argdict['KEY'] or todolist.null_key),
+            important=argdict['--important'],
+        )
+
+    # User is listing all items.
+    return do_listall
+
+
+def get_default_args():
+    """ Return the arg dict that docopt would return for no arguments,
+        built from the usage string without parsing the usage patterns.
+        Used by parse_fast_args(). The unformatted USAGETEMPLATE has the
+        same options, so it doesn't need to be formatted.
+    """
+    usage, _, options = USAGETEMPLATE.partition('Options:')
+    argd = {}
+    # Long names for short options, from the Options section.
+    longnames = {}
+    optname = None
+    for line in options.splitlines():
+        optmatch = re.match(r'^ {8}(\S.*?)\s+:', line)
+        if optmatch is None:
+            # Continuation of an option's description.
+            default = re.search(r'\[default: (.+?)\]', line)
+            if default and optname:
+                argd[optname] = default.group(1)
+            continue
+        names = optmatch.group(1)
+        if not names.startswith('-'):
+            # Positional argument.
+            optname = names
+            argd[optname] = None
+            continue
+        parts = names.split(',')
+        short = [p.split()[0] for p in parts if not p.startswith('--')]
+        long = [p.split()[0] for p in parts if p.startswith('--')]
+        optname = (long or short)[0]
+        argd[optname] = None if (' ' in names) else False
+        for shortname in short:
+            longnames[shortname] = optname
+        default = re.search(r'\[default: (.+?)\]', line)
+        if default:
+            argd[optname] = default.group(1)
+    # Short options and positional args that are only in the Usage section.
+    for shortname in re.findall(r'(?<![\w-])-\w\b', usage):
+        if shortname not in longnames:
+            argd.setdefault(shortname, False)
+    for argname in re.findall(r'(?<![\w-])[A-Z]+(?![\w-])', usage):
+        argd.setdefault(argname, None)
+    return argd
+
+
 def get_filenames(fore=None, back=None, style=None):
     """ Return a list of acceptable todo.lst file paths.
-        Returns [DEFAULTFILE] or [DEFAULTFILE, LOCALFILE].
+        Returns [DEFAULTFILE] or [DEFAULTFILE, get_localfile()].
         Arguments:
             fore, back, style : Arguments for color().
                                 If any of these arguments are given,
@@ -903,10 +1405,11 @@ def get_filenames(fore=None, back=None, style=None):
                                 returning the list.
 
     """
-    if DEFAULTFILE == LOCALFILE:
+    localfile = get_localfile()
+    if DEFAULTFILE == localfile:
         files = [DEFAULTFILE]
     else:
-        files = sorted((DEFAULTFILE, LOCALFILE))
+        files = sorted((DEFAULTFILE, localfile))
 
     if any((fore, back, style)):
         return [color(s, fore=fore, back=back, style=style) for s in files]
@@ -924,7 +1427,7 @@ def get_key(keyname=None):
         return keyname
 
     if keyname is None:
-        keyname = TodoKey.null
+        keyname = todolist.null_key
     key = todolist.get_key(keyname, default=None)
     if key is None:
         printstatus('No key named:', key=keyname, error=True)
@@ -932,6 +1435,78 @@ def get_key(keyname=None):
     return key
 
 
+def get_localfile():
+    """ Return the todo.lst file name for the current directory. """
+    return os.path.join(os.getcwd(), 'todo.lst')
+
+
+def get_socketfile():
+    """ Return the default unix socket file for --server.
+        This is $TODO_SOCKET, or a socket in $XDG_RUNTIME_DIR (or /tmp).
+    """
+    socketfile = os.environ.get('TODO_SOCKET', None)
+    if socketfile:
+        return socketfile
+    # Only imported when it's needed, to keep startup fast.
+    import tempfile
+    return os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR', None) or tempfile.gettempdir(),
+        'todo-{}.sock'.format(os.getuid()),
+    )
+
+
+def get_todofile(argdict):
+    """ Return the todo.lst file name to use, based on user args.
+        Uses the provided file, then the local file, then the default.
+    """
+    if argdict['--file']:
+        return argdict['--file']
+    if not argdict['--global']:
+        localfile = get_localfile()
+        if os.path.exists(localfile):
+            return localfile
+    return DEFAULTFILE
+
+
+@functools.lru_cache(maxsize=None)
+def get_usage():
+    """ Return the usage string for docopt. It's only formatted the first
+        time it is needed, so common commands don't format it at all.
+    """
+    return USAGETEMPLATE.format(script=SCRIPT, versionstr=VERSIONSTR)
+
+
+def get_window(count, limit=None, offset=None, tail=False):
+    """ Return (start, max_items) for listing part of a key with `count`
+        items. The limit and offset may be strings from the command line.
+        With `tail`, the window is at the end of the key, and the offset
+        is counted from the end.
+        Possibly raises ValueError for bad numbers.
+    """
+    offset = int(offset or 0)
+    limit = None if limit is None else int(limit)
+    if (offset < 0) or ((limit is not None) and (limit < 0)):
+        raise ValueError('Expecting a positive number.')
+    if not tail:
+        return offset, limit
+    if limit is None:
+        limit = TodoKey.tail_items
+    stop = max(count - offset, 0)
+    start = max(stop - limit, 0)
+    return start, stop - start
+
+
+def is_read_only(action, argdict):
+    """ Returns True if an action from get_action() only reads the list,
+        by listing all items, searching, or printing JSON.
+        When `action` is None, the default action is checked.
+    """
+    if action is None:
+        # Without an item, the default action lists all items.
+        return not argdict['ITEM']
+    return action.func in (do_json, do_listall, do_search)
+
+
 def kwarg_str(d):
     """ Just converts a dict into a keyword-arg-looking string.
         kwarg_str({'this': True, 'thing': 25}) == 'this=True, thing=25'
@@ -942,6 +1517,33 @@ def kwarg_str(d):
     return ''
 
 
+def load_list(filename, argdict, stream=False):
+    """ Load a TodoList from a file, using the journal/storage args.
+        With stream=True, big JSON lists are streamed (see TodoStream).
+        Returns an empty TodoList (with the file name set) when the file
+        doesn't exist yet.
+        Possibly raises TodoList.ParseError, or other load errors.
+    """
+    # Journal mode is also used when a journal already exists for the file.
+    journal = True if argdict['--journal'] else None
+    try:
+        return TodoList(
+            filename=filename,
+            journal=journal,
+            lazy=True,
+            stream=stream,
+            storage=argdict['--storage'],
+            # Parsed lists are cached when $TODO_CACHE is set.
+            cache=bool(os.environ.get('TODO_CACHE', '')),
+        )
+    except TodoList.NoFileExists:
+        debug('No file exists at: {}'.format(filename))
+
+    todolst = TodoList(journal=journal, storage=argdict['--storage'])
+    todolst.filename = filename
+    return todolst
+
+
 def merge_json(dictobj, filename):
     """ Merge JSON data into an existing JSON file, or create a new file.
         Arguments:
@@ -1005,6 +1607,124 @@ def no_nones(iterable):
     return all((element is not None) for element in iterable)
 
 
+@contextmanager
+def paged_stdout(enabled=True):
+    """ Send everything written to stdout to a pager ($PAGER, or less) while
+        the block runs. Output is streamed to the pager as it is written.
+        Nothing is paged when stdout isn't a terminal.
+    """
+    if not (enabled and sys.stdout.isatty()):
+        yield sys.stdout
+        return
+    # Only imported when it's needed, to keep startup fast.
+    import shlex
+    import subprocess
+    pagercmd = shlex.split(os.environ.get('PAGER', '') or 'less -R')
+    try:
+        pager = subprocess.Popen(
+            pagercmd,
+            stdin=subprocess.PIPE,
+            universal_newlines=True,
+        )
+    except EnvironmentError as ex:
+        debug('Unable to start pager: {} ({})'.format(pagercmd, ex))
+        yield sys.stdout
+        return
+    try:
+        with redirect_stdout(pager.stdin):
+            yield pager.stdin
+    finally:
+        with suppress(BrokenPipeError):
+            pager.stdin.close()
+        pager.wait()
+
+
+def parse_batch_line(line):
+    """ Parse a line from a --batch file into a docopt arg dict.
+        The line can use command-line syntax, or be a JSON list of args.
+        Raises ValueError for invalid commands.
+    """
+    if line.startswith('['):
+        try:
+            argv = json.loads(line)
+        except ValueError as ex:
+            raise ValueError('Invalid JSON: {}'.format(ex))
+        if not all(isinstance(arg, str) for arg in argv):
+            raise ValueError('JSON commands must be a list of strings.')
+    else:
+        # Only imported when it's needed, to keep startup fast.
+        import shlex
+        argv = shlex.split(line)
+
+    try:
+        argdict = docopt(get_usage(), argv=argv, help=False, script=SCRIPT)
+    except SystemExit:
+        # DocoptExit would end the batch.
+        raise ValueError('Invalid arguments: {}'.format(' '.join(argv)))
+    # Options that only make sense once, for the whole batch.
+    batchflags = (
+        '--batch', '--file', '--global', '--help', '--journal', '--storage',
+        '--version',
+    )
+    for flag in batchflags:
+        if argdict[flag]:
+            raise ValueError('Not allowed in batch mode: {}'.format(flag))
+    return argdict
+
+
+def parse_fast_args(argv):
+    """ Parse args for the most common commands, without docopt:
+            todo
+            todo ITEM
+            todo KEY ITEM
+            todo -l [KEY]
+        These may also use -f FILE, -g, or -D.
+        Returns a docopt-style arg dict, or None when docopt is needed.
+    """
+    argd = {}
+    args = []
+    flags = {
+        '-D': '--debug',
+        '--debug': '--debug',
+        '-g': '--global',
+        '--global': '--global',
+    }
+    argiter = iter(argv)
+    for arg in argiter:
+        if arg in ('-f', '--file'):
+            filename = next(argiter, None)
+            if (filename is None) or filename.startswith('-'):
+                return None
+            argname, argval = '--file', filename
+        elif arg in flags:
+            argname, argval = flags[arg], True
+        else:
+            args.append(arg)
+            continue
+        if argname in argd:
+            return None
+        argd[argname] = argval
+    if ('--file' in argd) and ('--global' in argd):
+        return None
+
+    if args[:1] == ['-l']:
+        argd['--list'] = True
+        args = args[1:]
+        argnames = ('KEY', )
+    elif len(args) == 2:
+        argnames = ('KEY', 'ITEM')
+    else:
+        argnames = ('ITEM', )
+    if len(args) > len(argnames):
+        return None
+    if any(arg.startswith('-') for arg in args):
+        return None
+    argd.update(zip(argnames, args))
+    defaults = get_default_args()
+    defaults.update(argd)
+    return defaults
+
+
 def printheader(todolst=None):
     """ Print the program header message. """
     # Use the global todolist when not specified.
@@ -1139,6 +1859,415 @@ def printstatus(
             print(colorerr(errmsg), file=sys.stderr)
 
 
+def printtimings(total, argdict, table=True, filename=None):
+    """ Print the timed phases of this run (see timed()) as a table on
+        stderr, and/or append them to a file as a JSON line ('-' for
+        stderr). `total` is the time for the whole run, in seconds.
+    """
+    if TIMINGS is None:
+        return
+    if table:
+        lines = ['Timings:']
+        for phase, depth, seconds in TIMINGS:
+            lines.append('    {:<32} {:>10.2f}ms'.format(
+                '{}{}'.format('    ' * depth, phase),
+                seconds * 1000,
+            ))
+        lines.append('    {:<32} {:>10.2f}ms'.format('total', total * 1000))
+        print('\n'.join(lines), file=sys.stderr)
+    if not filename:
+        return
+    # Nested phases are named by their path, like: write_file/to_json
+    # Phases that ran more than once are added up.
+    phases = {}
+    path = []
+    for phase, depth, seconds in TIMINGS:
+        del path[depth:]
+        path.append(phase)
+        name = '/'.join(path)
+        phases[name] = phases.get(name, 0) + (seconds * 1000)
+    defaults = get_default_args()
+    line = json.dumps(
+        {
+            'time': time.time(),
+            'version': VERSION,
+            'file': getattr(todolist, 'filename', None),
+            # Only the options that were used are kept, not their values
+            # or any keys/items.
+            'flags': sorted(
+                argname
+                for argname, argval in argdict.items()
+                if argname.startswith('-') and
+                (argval != defaults.get(argname, None))
+            ),
+            'total_ms': round(total * 1000, 3),
+            'phases_ms': {
+                name: round(ms, 3)
+                for name, ms in phases.items()
+            },
+        },
+        sort_keys=True,
+    )
+    if filename == '-':
+        print(line, file=sys.stderr)
+        return
+    try:
+        with open(filename, 'a') as f:
+            f.write('{}\n'.format(line))
+    except EnvironmentError as ex:
+        printstatus('Unable to write timings:', error=ex)
+
+
+@contextmanager
+def profiled(enabled=True, count=25, filename=None, memory=False):
+    """ Profile the code in this block with cProfile, and print the
+        `count` functions with the most cumulative time to stderr when
+        it's finished. The profile is saved to `filename` if one is given.
+        With memory=True, allocations are traced with tracemalloc, and the
+        peak memory use and top allocation sites are printed too.
+    """
+    if not enabled:
+        yield None
+        return
+    # Only imported when it's needed, to keep startup fast.
+    import cProfile
+    import pstats
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        sys.stdout.flush()
+        print('\nProfile:', file=sys.stderr)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        if filename:
+            try:
+                stats.dump_stats(filename)
+            except EnvironmentError as ex:
+                printstatus('Unable to save profile:', error=ex)
+            else:
+                print('Profile saved to: {}'.format(filename), file=sys.stderr)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(count)
+        if memory:
+            print(
+                'Memory: {:.2f}MB peak, {:.2f}MB at the end.'.format(
+                    peak / (1024 * 1024),
+                    current / (1024 * 1024),
+                ),
+                file=sys.stderr,
+            )
+            print('Top allocation sites:', file=sys.stderr)
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<unknown>'),
+            ))
+            for allocated in snapshot.statistics('lineno')[:count]:
+                print('    {}'.format(allocated), file=sys.stderr)
+
+
+def run_client(argv, socketfile):
+    """ Send command-line args to a TodoServer, and print the response.
+        Returns the exit code for the command, or NOSERVER if the server
+        couldn't be reached.
+    """
+    request = {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'color': not colr_disabled(),
+    }
+    # Only imported when it's needed, to keep startup fast.
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socketfile)
+    except EnvironmentError as ex:
+        debug('Unable to connect to server: {} ({})'.format(socketfile, ex))
+        sock.close()
+        return NOSERVER
+
+    with sock:
+        batchargs = (
+            arg for arg in argv
+            if (arg == '--batch') or
+            (arg.startswith('-') and (not arg.startswith('--')) and
+                ('B' in arg))
+        )
+        if any(batchargs):
+            # --batch may read commands from stdin.
+            request['stdin'] = sys.stdin.read()
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    try:
+        response = json.loads(line.decode('utf-8'))
+    except ValueError as ex:
+        printstatus('Invalid response from the server:', error=ex)
+        return 1
+    with suppress(BrokenPipeError), paged_stdout(enabled='--pager' in argv):
+        sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    # Commands that don't return anything succeeded, like main().
+    return response['returncode'] or 0
+
+
+@functools.lru_cache(maxsize=None)
+def server_class():
+    """ Return the TodoServer class, building it the first time. The
+        server is built here because socketserver is only imported when
+        it's needed, to keep startup fast.
+    """
+    import socketserver
+
+    class TodoServer(socketserver.UnixStreamServer):
+
+        """ A server that keeps TodoLists loaded, and runs commands for
+            clients on a unix socket (see run_client()). Commands are run one
+            at a time.
+            Requests are a JSON line with 'argv', 'cwd', 'color', and an
+            optional 'stdin'. Responses are a JSON line with 'stdout',
+            'stderr', and 'returncode'.
+            Saves are delayed, so a burst of changes is saved once. Delayed
+            saves run on the serving thread (see service_actions()), because
+            some backends (like sqlite3) can only be used by one thread.
+        """
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            """ Handles a single command from run_client(). """
+
+            def handle(self):
+                line = self.rfile.readline()
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError as ex:
+                    response = {
+                        'stdout': '',
+                        'stderr': 'Invalid request: {}\n'.format(ex),
+                        'returncode': 1,
+                    }
+                else:
+                    response = self.server.run_request(request)
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+        def __init__(self, socketfile, delay=1):
+            self.socketfile = socketfile
+            # Seconds to wait before saving changes.
+            self.delay = delay
+            # Loaded TodoLists, by absolute file name.
+            self.lists = {}
+            # File stamps for each list, to notice changes by other programs.
+            self.stamps = {}
+            # Times (from time.monotonic()) to save lists with changes waiting
+            # to be saved.
+            self.deadlines = {}
+            super().__init__(socketfile, self.Handler)
+
+        def file_stamp(self, todolst):
+            """ Return a stamp for a list's files, which changes when they are
+                written.
+            """
+            return [
+                TodoList.snapshot_stamp(todolst.filename),
+                TodoList.snapshot_stamp(todolst.journal_file()),
+            ]
+
+        def flush(self):
+            """ Save all lists that have changes waiting to be saved. """
+            for filename in list(self.deadlines):
+                self.save_list(filename)
+
+        def get_list(self, argdict):
+            """ Return a loaded TodoList for user args, loading it if needed.
+                Lists that were changed by another program are loaded again.
+            """
+            filename = os.path.abspath(get_todofile(argdict))
+            todolst = self.lists.get(filename, None)
+            if (todolst is not None) and (filename not in self.deadlines):
+                if self.file_stamp(todolst) != self.stamps[filename]:
+                    debug('List was changed, reloading: {}'.format(filename))
+                    todolst = None
+            if todolst is None:
+                todolst = load_list(filename, argdict)
+                self.lists[filename] = todolst
+                self.stamps[filename] = self.file_stamp(todolst)
+            return todolst
+
+        def run_args(self, argdict):
+            """ Run a command for a client, like main() does.
+                Returns the exit code for the command.
+            """
+            global todolist
+            if argdict['--server']:
+                printstatus('The server is already running.', error=True)
+                return 1
+            todolist = self.get_list(argdict)
+            if not argdict['--json']:
+                printheader(todolist)
+
+            runaction = get_action(argdict) or get_default_action(argdict)
+            with todolist.transaction():
+                returncode = runaction()
+                # Saved once the transaction is finished, so the file stamps
+                # are taken after the list is written. With a delay, it's saved
+                # later along with any other changes before then.
+                saving = todolist.save_requested
+                todolist.save_requested = False
+            if saving:
+                self.schedule_save(todolist.filename)
+            return returncode
+
+        def run_request(self, request):
+            """ Run a command from a client request, capturing it's output.
+                Returns a response dict.
+            """
+            stdout = io.StringIO()
+            stderr = io.StringIO()
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                oldstdin = sys.stdin
+                # There is no terminal, so confirmations are answered with
+                # 'no'.
+                sys.stdin = io.StringIO(request.get('stdin', ''))
+                if request.get('color', False):
+                    colr_enable()
+                else:
+                    colr_disable()
+                try:
+                    # The local todo.lst is in the client's directory.
+                    os.chdir(request['cwd'])
+                    argd = docopt(
+                        get_usage(),
+                        argv=request['argv'],
+                        version=VERSIONSTR,
+                        script=SCRIPT,
+                    )
+                    returncode = self.run_args(argd)
+                except SystemExit as ex:
+                    # Usage errors, --help, and --version.
+                    if (ex.code is None) or isinstance(ex.code, int):
+                        returncode = ex.code or 0
+                    else:
+                        print(ex.code, file=sys.stderr)
+                        returncode = 1
+                except Exception as ex:
+                    printstatus('Error:', error=ex)
+                    returncode = 1
+                finally:
+                    sys.stdin = oldstdin
+            return {
+                'stdout': stdout.getvalue(),
+                'stderr': stderr.getvalue(),
+                'returncode': returncode,
+            }
+
+        def save_list(self, filename):
+            """ Save a list that has changes waiting to be saved. """
+            self.deadlines.pop(filename, None)
+            todolst = self.lists[filename]
+            debug('Saving list: {}'.format(filename))
+            try:
+                todolst.save_file()
+            except Exception as ex:
+                printstatus('Unable to save list:', item=filename, error=ex)
+            self.stamps[filename] = self.file_stamp(todolst)
+
+        def schedule_save(self, filename):
+            """ Save a list after the delay, unless a save is already waiting.
+            """
+            if filename in self.deadlines:
+                return
+            if not self.delay:
+                self.save_list(filename)
+                return
+            self.deadlines[filename] = time.monotonic() + self.delay
+
+        def server_close(self):
+            """ Save any waiting changes, and remove the socket file. """
+            self.flush()
+            super().server_close()
+            with suppress(FileNotFoundError):
+                os.remove(self.socketfile)
+
+        def service_actions(self):
+            """ Save lists that have waited long enough. This is called by
+                serve_forever() between requests, at least once every
+                poll interval.
+            """
+            now = time.monotonic()
+            for filename, deadline in list(self.deadlines.items()):
+                if deadline <= now:
+                    self.save_list(filename)
+
+    return TodoServer
+
+
+@contextmanager
+def timed(phase):
+    """ Time a phase of the run, when phases are being timed (see
+        TIMINGS). Phases that start inside of another phase are nested
+        under it. This can also be used as a decorator.
+        Only the main thread is timed.
+    """
+    global TIMING_DEPTH
+    mainthread = threading.current_thread() is threading.main_thread()
+    if (TIMINGS is None) or (not mainthread):
+        yield
+        return
+    timing = [phase, TIMING_DEPTH, 0.0]
+    TIMINGS.append(timing)
+    TIMING_DEPTH += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing[2] = time.perf_counter() - start
+        TIMING_DEPTH -= 1
+
+
+def write_json_file(filename, obj):
+    """ Write an object to a JSON file, using a temp file that is renamed
+        over `filename`. Possibly raises TodoList.SaveError.
+    """
+    tmpname = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        with open(tmpname, 'w') as f:
+            json.dump(obj, f, indent=4, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpname, filename)
+    except (EnvironmentError, TypeError, ValueError) as ex:
+        with suppress(FileNotFoundError):
+            os.remove(tmpname)
+        errmsg = 'Unable to write to file: {}'.format(filename)
+        raise TodoList.SaveError(errmsg) from ex
+    return True
+
+
+def write_lines(lines, indent='', file=None):
+    """ Write lines to stdout (or `file`) a chunk at a time, without
+        building one big string for all of them. Each line is indented,
+        including any lines inside of it.
+    """
+    if file is None:
+        file = sys.stdout
+    newline = '\n{}'.format(indent)
+    chunk = []
+    for line in lines:
+        chunk.append(''.join((indent, line.replace('\n', newline), '\n')))
+        if len(chunk) == 1000:
+            file.write(''.join(chunk))
+            chunk = []
+    file.write(''.join(chunk))
+
+
 # Classes ---------------------------------------------------------
 
 def colorindex(i):
@@ -1170,20 +2299,55 @@ class TodoItem(object):
     """ A single item in the todo list.
         It has some text, and other item-related properties.
     """
+    # Items don't get a __dict__, which saves memory for big lists.
+    __slots__ = ('key', '_text', '_important')
     # This marks an item as important when in string format.
     important_str = '** '
 
     def __init__(self, text=None, important=False):
-        self.text = '' if text is None else text
-        self.important = important
+        # The TodoKey this item belongs to, which is told about changes.
+        self.key = None
+        self._text = '' if text is None else text
+        self._important = important
         # Items with the important_str override the important kwarg.
-        if self.text.startswith(TodoItem.important_str):
-            self.important = True
-            self.text = self.text[len(TodoItem.important_str):]
+        if self._text.startswith(TodoItem.important_str):
+            self._important = True
+            self._text = self._text[len(TodoItem.important_str):]
 
     def __bool__(self):
         return bool(self.text)
 
+    @property
+    def important(self):
+        return self._important
+
+    @important.setter
+    def important(self, value):
+        if value == self._important:
+            return
+        if self.key is not None:
+            self.key.before_change()
+            self.key.record_undo('item', self, self._text, self._important)
+        self._important = value
+        if self.key is not None:
+            self.key.count_important(1 if value else -1)
+            self.key.item_changed(self)
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        if value == self._text:
+            return
+        if self.key is not None:
+            self.key.before_change()
+            self.key.record_undo('item', self, self._text, self._important)
+        self._text = value
+        if self.key is not None:
+            self.key.item_changed(self)
+
     def __repr__(self):
         return self.to_str(usetextmarker=True)
 
@@ -1227,14 +2391,203 @@ class TodoItem(object):
         return usestr
 
 
-class TodoKey(UserList):
+class TodoBlockList(MutableSequence):
 
-    """ A single key in the todo list. Holds items with indexes. """
-    # The key to use when no key is given. (null/None)
-    # This is set to a default when TodoList.load_data() is finished.
+    """ A list of items for huge keys, split into small blocks.
+        The size of each block is kept in a Fenwick tree, so finding the
+        block for an index takes O(log n) steps. Inserting or popping only
+        shifts the items in one block, instead of every item after the
+        index like a plain list does. It can be used anywhere a list of
+        TodoItems is used.
+    """
+    # Blocks are split in half when they grow larger than this.
+    block_max = 1024
+
+    def __init__(self, iterable=()):
+        self.blocks = []
+        self.tree = [0]
+        self.length = 0
+        self.build(list(iterable))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __contains__(self, value):
+        return any(value in block for block in self.blocks)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            items = list(self)
+            del items[index]
+            self.build(items)
+            return
+        blocknum, offset = self.locate(index)
+        block = self.blocks[blocknum]
+        del block[offset]
+        self.length -= 1
+        if block or (len(self.blocks) == 1):
+            self.tree_add(blocknum, -1)
+        else:
+            del self.blocks[blocknum]
+            self.build_tree()
+
+    def __eq__(self, other):
+        if isinstance(other, (list, TodoBlockList)):
+            return (len(self) == len(other)) and (list(self) == list(other))
+        return NotImplemented
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        blocknum, offset = self.locate(index)
+        return self.blocks[blocknum][offset]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.blocks)
+
+    def __len__(self):
+        return self.length
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reversed__(self):
+        return itertools.chain.from_iterable(
+            reversed(block) for block in reversed(self.blocks)
+        )
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            items = list(self)
+            items[index] = value
+            self.build(items)
+            return
+        blocknum, offset = self.locate(index)
+        self.blocks[blocknum][offset] = value
+
+    def build(self, items):
+        """ Split a list of items into half-full blocks, and build the tree
+            of block sizes.
+        """
+        size = self.block_max // 2
+        self.blocks = [
+            items[i:i + size]
+            for i in range(0, len(items), size)
+        ] or [[]]
+        self.length = len(items)
+        self.build_tree()
+
+    def build_tree(self):
+        """ Rebuild the Fenwick tree of block sizes, after blocks are added
+            or removed. This is O(number of blocks).
+        """
+        tree = [0] * (len(self.blocks) + 1)
+        for treeindex, block in enumerate(self.blocks, start=1):
+            tree[treeindex] += len(block)
+            parent = treeindex + (treeindex & -treeindex)
+            if parent < len(tree):
+                tree[parent] += tree[treeindex]
+        self.tree = tree
+
+    def clear(self):
+        self.build([])
+
+    def copy(self):
+        return self.__class__(self)
+
+    def extend(self, values):
+        if values is self:
+            values = list(values)
+        for value in values:
+            self.append(value)
+
+    def insert(self, index, value):
+        """ Insert a value before `index`, like list.insert(). """
+        if index < 0:
+            index = max(index + self.length, 0)
+        if index >= self.length:
+            blocknum = len(self.blocks) - 1
+            offset = len(self.blocks[blocknum])
+        else:
+            blocknum, offset = self.locate(index)
+        block = self.blocks[blocknum]
+        block.insert(offset, value)
+        self.length += 1
+        if len(block) <= self.block_max:
+            self.tree_add(blocknum, 1)
+            return
+        half = len(block) // 2
+        self.blocks[blocknum:blocknum + 1] = [block[:half], block[half:]]
+        self.build_tree()
+
+    def locate(self, index):
+        """ Return (block_number, offset) for an item index, by walking down
+            the Fenwick tree.
+            Raises IndexError for bad indexes, like a list.
+        """
+        if index < 0:
+            index += self.length
+        if not (0 <= index < self.length):
+            raise IndexError('list index out of range')
+        blocknum = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            treeindex = blocknum + step
+            if treeindex < len(self.tree) and self.tree[treeindex] <= index:
+                blocknum = treeindex
+                index -= self.tree[treeindex]
+            step >>= 1
+        return blocknum, index
+
+    def reverse(self):
+        self.build(list(reversed(self)))
+
+    def sort(self, *args, **kwargs):
+        items = list(self)
+        items.sort(*args, **kwargs)
+        self.build(items)
+
+    def tree_add(self, blocknum, amount):
+        """ Add `amount` to the size of a block in the Fenwick tree. """
+        treeindex = blocknum + 1
+        while treeindex < len(self.tree):
+            self.tree[treeindex] += amount
+            treeindex += treeindex & -treeindex
+
+
+def records_items(method):
+    """ Wrap a UserList method for TodoKey, so that changes made through
+        it are recorded in the change log.
+    """
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        self.before_change()
+        # These can change any of the items, so they are all saved.
+        self.record_undo('data', list(self.data))
+        result = method(self, *args, **kwargs)
+        self.record_items()
+        return result
+    return wrapped
+
+
+class TodoKey(UserList):
+
+    """ A single key in the todo list. Holds items with indexes. """
+    # The key to use when no key is given. (null/None)
+    # This is set to a default when TodoList.load_data() is finished.
     # The top key is used as the default when the list is not empty.
     null = 'No Label'
     important_str = '*'
+    # Number of items shown in a preview_str().
+    preview_items = 2
+    # Number of items shown by --tail, when no --limit is used.
+    tail_items = 10
+    # Keys with at least this many items keep them in a TodoBlockList, so
+    # moving items around doesn't shift the whole list each time.
+    block_min = 10000
 
     # Returned from a move_item operation.
     TodoKeyMove = namedtuple('TodoKeyMove', ('index', 'newindex', 'item'))
@@ -1243,6 +2596,20 @@ class TodoKey(UserList):
     TodoKeyResult = namedtuple('TodoKeyResult', ('index', 'item'))
     TodoKeyResult.__bool__ = no_nones
 
+    # Items changed through the list methods replace the whole key when
+    # saved. The TodoKey methods record smaller changes.
+    __delitem__ = records_items(UserList.__delitem__)
+    __iadd__ = records_items(UserList.__iadd__)
+    __setitem__ = records_items(UserList.__setitem__)
+    append = records_items(UserList.append)
+    clear = records_items(UserList.clear)
+    extend = records_items(UserList.extend)
+    insert = records_items(UserList.insert)
+    pop = records_items(UserList.pop)
+    remove = records_items(UserList.remove)
+    reverse = records_items(UserList.reverse)
+    sort = records_items(UserList.sort)
+
     def __init__(self, *args, **kwargs):
         label = kwargs.get('label', None)
         # Empty label values default to TodoKey.null.
@@ -1251,14 +2618,51 @@ class TodoKey(UserList):
             # Label kwarg was given. Pop it so it doesn't interfere with
             # UserList.__init__()
             kwargs.pop('label')
-        self.important = kwargs.get('important', False)
+        self._important = kwargs.get('important', False)
         with suppress(KeyError):
             kwargs.pop('important')
         if self.label.startswith(self.important_str):
-            self.important = True
+            self._important = True
             self.label = self.label[len(self.important_str):]
+        # Change log shared with the TodoList that owns this key.
+        # Keys that don't belong to a TodoList don't record changes.
+        self.changes = None
+        # The TodoList that owns this key, which is told about changes
+        # before they are made. (see before_change())
+        self.todolist = None
+        # Lazy keys call loader() to get their items the first time they
+        # are used. Until then, size is the number of items, and new items
+        # are kept in pending.
+        self.loader = kwargs.get('loader', None)
+        with suppress(KeyError):
+            kwargs.pop('loader')
+        self.size = kwargs.get('size', 0)
+        with suppress(KeyError):
+            kwargs.pop('size')
+        # Streamed keys (see TodoStream) read their items from the loader
+        # each time they are listed or searched, instead of loading them.
+        self.streamed = kwargs.get('streamed', False)
+        with suppress(KeyError):
+            kwargs.pop('streamed')
+        self.pending = []
+        self._data = None
+        # Number of important items, kept up to date as items change.
+        # It is None when it needs to be counted again (see
+        # get_important_count()).
+        self.important_count = None
+        # Set when items are changed, for storage that saves keys one at a
+        # time.
+        self.dirty = False
 
         super().__init__(*args, **kwargs)
+        if self.loader is not None:
+            self._data = None
+        else:
+            # Use a TodoBlockList for big lists.
+            self.data = self._data
+            for item in self._data:
+                if isinstance(item, TodoItem) and (item.key is None):
+                    item.key = self
         # These will only print when running ./todo.py itself.
         # Otherwise, todo.DEBUG would have to be set.
         # So, by default nothing is ever printed from these classes.
@@ -1268,7 +2672,7 @@ class TodoKey(UserList):
         ))
 
     def __bool__(self):
-        return bool(self.data)
+        return self.get_count() > 0
 
     def __eq__(self, other):
         """ TodoKeys are equal if they have the same label, and all the items
@@ -1300,6 +2704,40 @@ class TodoKey(UserList):
     def __str__(self):
         return self.to_str(color=True)
 
+    @property
+    def data(self):
+        """ The list of TodoItems, which is loaded on first use for lazy
+            keys.
+        """
+        if self._data is None:
+            # A known important count still holds for the loaded items.
+            important_count = self.important_count
+            self.data = self.load_items()
+            self.important_count = important_count
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        if (
+                (value is not None) and
+                (len(value) >= self.block_min) and
+                not isinstance(value, TodoBlockList)):
+            value = TodoBlockList(value)
+        self._data = value
+        self.important_count = None
+
+    @property
+    def important(self):
+        return self._important
+
+    @important.setter
+    def important(self, value):
+        if value == self._important:
+            return
+        self.before_change()
+        self._important = value
+        self.record_change('keyimportant', value)
+
     def add_item(self, item, important=False):
         """ Add an item to this key. """
         debug('TodoKey."{}".add_item(\'{}\')'.format(self.label, item))
@@ -1307,9 +2745,34 @@ class TodoKey(UserList):
             newitem = item
         else:
             newitem = TodoItem(text=str(item), important=important)
-        self.data.append(newitem)
+        self.before_change()
+        newitem.key = self
+        if newitem.important:
+            self.count_important(1)
+        if self._data is None:
+            # Don't load a lazy key just to add to it.
+            self.pending.append(newitem)
+        else:
+            self.data.append(newitem)
+            self.record_undo('add')
+            if len(self._data) == self.block_min:
+                # The key just got big, switch to a TodoBlockList.
+                self.data = self._data
+        self.record_change('add', newitem.to_json())
         return newitem
 
+    def before_change(self):
+        """ Tell the TodoList that owns this key that it's about to change,
+            so the change can be rolled back. (see TodoList.transaction())
+        """
+        if self.todolist is not None:
+            self.todolist.before_change(self)
+
+    def count_important(self, amount):
+        """ Add to the important item count, when it is known. """
+        if self.important_count is not None:
+            self.important_count += amount
+
     def find_item(self, query):
         """ Find an item by its index or regex pattern/text.
             If there is a match, return (index, TodoItem())
@@ -1317,12 +2780,13 @@ class TodoKey(UserList):
             * Indexes are zero-based.
         """
         debug('Finding item in {}: {!r}'.format(self.label, query))
-        intval, querypat = self.parse_query(query)
+        query = TodoQuery.parse(query)
+        if query.index is not None:
+            if 0 <= query.index < len(self.data):
+                return self.TodoKeyResult(query.index, self.data[query.index])
+            return self.TodoKeyResult(None, None)
         for index, item in enumerate(self.data):
-            if (intval is not None) and (intval == index):
-                return self.TodoKeyResult(index, item)
-            itemtext = item.to_str(color=False)
-            if (querypat is not None) and querypat.search(itemtext):
+            if query.match_text(item.to_str(color=False)):
                 return self.TodoKeyResult(index, item)
         return self.TodoKeyResult(None, None)
 
@@ -1333,8 +2797,34 @@ class TodoKey(UserList):
             where TodoList.get_count() gives you the TodoItem count.
             TodoKey.get_count() actually does the same as len(TodoKey).
         """
+        if self._data is None:
+            # Lazy key, that hasn't been loaded yet.
+            return self.size + len(self.pending)
         return len(self.data)
 
+    def get_important_count(self):
+        """ Return the number of important items in this key.
+            The items are only counted the first time, or after they are
+            replaced.
+        """
+        if self.important_count is None:
+            self.important_count = sum(
+                1 for item in self.iter_items() if item.important
+            )
+        return self.important_count
+
+    def get_items(self, start=0, stop=None):
+        """ Return a list of items from `start` up to `stop`, like a slice.
+            Lazy keys only load the items that are returned, and stay
+            unloaded. Those items aren't part of the key, so changes to
+            them aren't recorded.
+            Streamed keys return an iterator, that reads the items one at
+            a time.
+        """
+        if (self._data is None) and (not self.pending):
+            return self.loader(window=slice(start, stop))
+        return self.data[start:stop]
+
     def get_label(self, color=False, usetextmarker=False):
         """ Retrieve the formatted label for this key. """
         lbl = self.label
@@ -1344,10 +2834,101 @@ class TodoKey(UserList):
             return colorimpkey(lbl) if self.important else colorkey(lbl)
         return lbl
 
+    def get_state(self):
+        """ Return the state of this key, for rolling back a transaction.
+            Items aren't saved here, changes to them are undone one at a
+            time (see record_undo()). Keys that aren't loaded yet are just
+            unloaded again.
+        """
+        return {
+            'label': self.label,
+            'important': self.important,
+            'dirty': self.dirty,
+            'loaded': self.is_loaded(),
+            'loader': self.loader,
+            'size': self.size,
+            'streamed': self.streamed,
+            'pending': list(self.pending),
+            'important_count': self.important_count,
+        }
+
+    def item_changed(self, item):
+        """ Record a change that was made directly to one of this key's
+            items, by setting it's text or importance.
+        """
+        for index, existing in enumerate(self.data):
+            if existing is item:
+                self.record_change('item', index, item.to_json())
+                return index
+        return None
+
+    def is_loaded(self):
+        """ Returns True if this key's items have been loaded.
+            Only lazy keys are ever unloaded.
+        """
+        return self._data is not None
+
     def important_items(self):
         """ Return a list with only important items from this TodoKey. """
+        if not self.get_important_count():
+            return []
         return [item for item in self if item.important]
 
+    def iter_items(self):
+        """ Iterate over this key's items. Streamed keys are read one item
+            at a time, and stay unloaded. Other keys are loaded if needed.
+        """
+        if self.streamed and (self._data is None) and (not self.pending):
+            return self.loader(window=slice(0, None))
+        return iter(self.data)
+
+    def load_items(self):
+        """ Load items for a lazy key, using it's loader.
+            Returns a list of TodoItems.
+        """
+        items = self.loader() if self.loader is not None else []
+        debug('Loaded {} items for lazy key: {}'.format(
+            len(items),
+            self.label,
+        ))
+        items.extend(self.pending)
+        for item in items:
+            item.key = self
+        self.loader = None
+        self.pending = []
+        self.size = 0
+        self.streamed = False
+        return items
+
+    def mark_important(self, important=True):
+        """ Mark this key as important, or unimportant. """
+        self.important = important
+        return self
+
+    def mark_item(self, query, important=True):
+        """ Mark an item as important, or unimportant.
+            The query is just as in find_item(), an index or regex/text.
+            Returns (index, TodoItem) on success.
+            Returns (None, None) on failure.
+        """
+        keyresult = self.find_item(query)
+        if not keyresult:
+            debug('Falsey key result: {}'.format(keyresult))
+            return keyresult
+        if keyresult.item.important != important:
+            self.before_change()
+            self.record_undo(
+                'item',
+                keyresult.item,
+                keyresult.item._text,
+                keyresult.item._important,
+            )
+            # The index is already known, item_changed() isn't needed.
+            keyresult.item._important = important
+            self.count_important(1 if important else -1)
+            self.record_change('important', keyresult.index, important)
+        return keyresult
+
     def move_item(self, query, newindex):
         """ Move an item from one position to another.
             The query is just as in find_item(), an index or regex/text.
@@ -1365,14 +2946,15 @@ class TodoKey(UserList):
         try:
             newindex = int(newindex)
         except (TypeError, ValueError) as exint:
-            raise self.BadIndexError(str(exint)) from exint
+            raise TodoList.BadIndexError(str(exint)) from exint
 
         maxlength = self.get_count() - 1
         if newindex == keyresult.index:
-            raise self.SameIndexError('Indexes cannot be the same.')
+            raise TodoList.SameIndexError('Indexes cannot be the same.')
         elif (0 > newindex) or (newindex > maxlength):
-            raise self.BadIndexError('Index must be within the bounds.')
+            raise TodoList.BadIndexError('Index must be within the bounds.')
 
+        self.before_change()
         try:
             # Remove the item, and reinsert it into the new index.
             removed = self.data.pop(keyresult.index)
@@ -1383,6 +2965,8 @@ class TodoKey(UserList):
             if not errmsg.endswith('.'):
                 errmsg = '{}.'.format(errmsg)
             raise TodoList.BadIndexError(errmsg) from ex
+        self.record_undo('move', keyresult.index, newindex)
+        self.record_change('move', keyresult.index, newindex)
 
         return self.TodoKeyMove(keyresult.index, newindex, keyresult.item)
 
@@ -1391,30 +2975,56 @@ class TodoKey(UserList):
         """ Parse a search/find query. Returns either:
             (int index, None), (None, Regex Pattern)
             or on error, raises TodoList.BadQueryError().
+            This is kept for compatibility, TodoQuery.parse() is used to
+            find items.
         """
-        if (query is None) or (query == ''):
-            raise cls.BadQueryError('Empty query!')
-
-        try:
-            intval = int(query)
-            querypat = None
-        except (TypeError, ValueError):
-            intval = None
-            try:
-                querypat = re.compile(query, re.IGNORECASE)
-            except (re.error, TypeError) as exreg:
-                errmsg = 'Invalid query: {}\n{}'.format(query, exreg)
-                raise cls.BadQueryError(errmsg)
-        return intval, querypat
+        query = TodoQuery.parse(query)
+        if query.index is not None:
+            return query.index, None
+        return None, query.get_pattern()
 
     def preview_str(self, color=True, important_only=False):
         """ A short preview list of this key's items. """
         return self.to_str(
-            max_items=2,
+            max_items=self.preview_items,
             color=color,
             important_only=important_only
         )
 
+    def record_change(self, action, *args):
+        """ Record a change to this key in the TodoList's change log.
+            Changes are saved as (action, label, *args).
+        """
+        if action != 'keyimportant':
+            # The items need to be saved.
+            self.dirty = True
+        if self.changes is not None:
+            self.changes.append((action, self.label) + args)
+
+    def record_items(self):
+        """ Record a change that replaces all of this key's items.
+        """
+        for item in self.data:
+            item.key = self
+        # The items may have been replaced, count them again when needed.
+        self.important_count = None
+        self.dirty = True
+        if self.changes is not None:
+            self.changes.append((
+                'key',
+                self.get_label(usetextmarker=True),
+                [item.to_json() for item in self.data],
+            ))
+
+    def record_undo(self, action, *args):
+        """ Record how to undo a change to this key's loaded items, while
+            a transaction is running. (see undo_change())
+            Changes are saved in the TodoList's undo log, as
+            (todokey, action, *args).
+        """
+        if (self.todolist is not None) and self.todolist.rollbacks:
+            self.todolist.undo.append((self, action) + args)
+
     def remove_item(self, query):
         """ Removes an item from this key. The query can be the index,
             or a regex pattern/text to match.
@@ -1423,23 +3033,57 @@ class TodoKey(UserList):
         keyresult = self.find_item(query)
         removed = None
         if keyresult:
+            self.before_change()
             removed = self.data.pop(keyresult.index)
+            self.record_undo('insert', keyresult.index, removed)
+            if removed.important:
+                self.count_important(-1)
+            self.record_change('remove', keyresult.index)
         else:
             debug('Falsey key result: {}'.format(keyresult))
 
         return removed
 
-    def remove_items(self, query):
-        """ Removes several items that match an index or regex pattern/text.
-            Returns a list of the removed TodoItems, or [].
+    def remove_indexes(self, indexes):
+        """ Removes the items at several indexes in one pass, keeping the
+            order of the other items.
+            Returns a list of TodoKeyResult(index, item) for the removed
+            items, with their indexes from before anything was removed.
+            Indexes that don't exist are ignored.
         """
+        indexes = set(indexes)
         removed = []
-        for index, item in self.search_items(query):
-            removeditem = self.data.pop(index)
-            if removeditem:
-                removed.append(item)
+        kept = []
+        for index, item in enumerate(self.data):
+            if index in indexes:
+                removed.append(self.TodoKeyResult(index, item))
+            else:
+                kept.append(item)
+        if not removed:
+            return removed
+        self.before_change()
+        self.data[:] = kept
+        # Changes are recorded from the bottom up, so each index is still
+        # correct when they are replayed one at a time.
+        # Undone in the opposite order, from the top down.
+        for keyresult in reversed(removed):
+            self.record_undo('insert', keyresult.index, keyresult.item)
+            if keyresult.item.important:
+                self.count_important(-1)
+            self.record_change('remove', keyresult.index)
         return removed
 
+    def remove_items(self, query):
+        """ Removes all items that match an index or regex pattern/text.
+            The query is only run once, and the matches are removed in one
+            pass (see remove_indexes()).
+            Returns a list of TodoKeyResult(index, item) for the removed
+            items, with their original indexes, or [].
+        """
+        return self.remove_indexes(
+            keyresult.index for keyresult in self.search_items(query)
+        )
+
     def search_items(self, query, firstonly=False):
         """ Search all items, return all that match the query.
             Query is the index, or regex pattern (like find_item()).
@@ -1454,16 +3098,41 @@ class TodoKey(UserList):
             debug('Falsey key result: {}'.format(keyresult))
             return []
         # Find multiple matches.
-        intval, querypat = self.parse_query(query)
-        found = []
-        for index, item in enumerate(self.data):
-            itemtext = item.to_str(color=False)
-            if (intval is not None) and (intval == index):
-                found.append(self.TodoKeyResult(index, item))
-            elif (querypat is not None) and querypat.search(itemtext):
-                found.append(self.TodoKeyResult(index, item))
+        query = TodoQuery.parse(query)
+        if query.index is not None:
+            if self.streamed and (not self.is_loaded()):
+                # Only the item at that index is read.
+                if query.index < 0:
+                    return []
+                return [
+                    self.TodoKeyResult(query.index, item)
+                    for item in self.get_items(query.index, query.index + 1)
+                ]
+            # Only one item can match an index.
+            keyresult = self.find_item(query)
+            return [keyresult] if keyresult else []
+        return [
+            self.TodoKeyResult(index, item)
+            for index, item in enumerate(self.iter_items())
+            if query.match_text(item.to_str(color=False))
+        ]
 
-        return found
+    def set_state(self, state):
+        """ Restore this key to a state from get_state(), after it's item
+            changes were undone.
+        """
+        self.label = state['label']
+        self._important = state['important']
+        self.dirty = state['dirty']
+        # States are shared by nested transactions, and aren't changed.
+        self.pending = list(state['pending'])
+        if not state['loaded']:
+            # The key was never loaded, load it again when needed.
+            self.data = None
+            self.loader = state['loader']
+            self.size = state['size']
+            self.streamed = state['streamed']
+        self.important_count = state['important_count']
 
     def to_dict(self):
         """ Turn this key into a dict of {index: TodoItem} """
@@ -1496,41 +3165,137 @@ class TodoKey(UserList):
             }
         }
 
-    def to_str(
+    def to_lines(
             self, max_items=None, color=False,
-            usetextmarker=False, important_only=False):
-        """ Return a string representation of this key, optionally cutting
-            the list off at `max_items`.
+            usetextmarker=False, important_only=False, start=0):
+        """ Yields the lines of to_str() one at a time, optionally starting
+            at index `start` and cutting the list off after `max_items`.
+            Only the items that are shown are loaded for lazy keys.
         """
-        lbl = self.get_label(color=color, usetextmarker=usetextmarker)
-        lines = [
-            '{}:'.format(lbl)
-        ]
-        linecnt = 0
-        for index, item in enumerate(self.data):
-            linecnt += 1
-            if max_items and linecnt > max_items:
-                break
+        yield '{}:'.format(
+            self.get_label(color=color, usetextmarker=usetextmarker)
+        )
+        stop = None if max_items is None else start + max_items
+        items = self.get_items(start, stop)
+        for index, item in enumerate(items, start=start):
             if important_only and (not item.important):
                 continue
-            lines.append('    {}: {}'.format(
+            yield '    {}: {}'.format(
                 index,
                 item.to_str(color=color, usetextmarker=usetextmarker)
-            ))
-        else:
-            # The entire list was built.
-            return '\n'.join(lines)
-        # The list was cut short.
-        if self.data:
-            lines.append(
-                '       (plus {} more...)'.format(len(self) - max_items)
             )
-        return '\n'.join(lines)
+        count = self.get_count()
+        if (stop is not None) and (stop < count):
+            # The list was cut short.
+            yield '       (plus {} more...)'.format(count - stop)
+
+    def to_str(
+            self, max_items=None, color=False,
+            usetextmarker=False, important_only=False):
+        """ Return a string representation of this key, optionally cutting
+            the list off at `max_items`.
+        """
+        return '\n'.join(self.to_lines(
+            max_items=max_items,
+            color=color,
+            usetextmarker=usetextmarker,
+            important_only=important_only,
+        ))
+
+    def undo_change(self, action, *args):
+        """ Undo a change to this key's items, from record_undo().
+            Possibly raises TodoList.ParseError for unknown actions.
+        """
+        if action == 'add':
+            self.data.pop()
+        elif action == 'data':
+            self.data = args[0]
+        elif action == 'insert':
+            self.data.insert(args[0], args[1])
+        elif action == 'item':
+            item, item._text, item._important = args
+        elif action == 'move':
+            self.data.insert(args[0], self.data.pop(args[1]))
+        elif action == 'set':
+            self.data[args[0]] = args[1]
+        else:
+            raise TodoList.ParseError('Unknown action: {!r}'.format(action))
+
+
+class TodoKeyDict(dict):
+
+    """ A dict of {label: TodoKey}, used for TodoList.data.
+        It keeps a map of casefolded labels, for case-insensitive lookups.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        # {casefolded label: label}
+        self.folded = {}
+        self.update(*args, **kwargs)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.unfold(key)
+
+    def __setitem__(self, key, todokey):
+        super().__setitem__(key, todokey)
+        # The first key with this name is used, like a search would.
+        self.folded.setdefault(key.casefold(), key)
+
+    def clear(self):
+        super().clear()
+        self.folded.clear()
+
+    def copy(self):
+        return self.__class__(self)
+
+    def find(self, key):
+        """ Return the real label for a case-insensitive label, or None if
+            there is no key with that label.
+        """
+        return self.folded.get(key.casefold(), None)
+
+    def pop(self, key, *args):
+        if key not in self:
+            if args:
+                return args[0]
+            raise KeyError(key)
+        todokey = self[key]
+        del self[key]
+        return todokey
+
+    def popitem(self):
+        key, todokey = super().popitem()
+        self.unfold(key)
+        return key, todokey
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def unfold(self, key):
+        """ Remove a deleted key from the casefolded label map, using
+            another key with the same name if there is one.
+        """
+        folded = key.casefold()
+        if self.folded.get(folded, None) != key:
+            return
+        del self.folded[folded]
+        for otherkey in self:
+            if otherkey.casefold() == folded:
+                self.folded[folded] = otherkey
+                break
+
+    def update(self, *args, **kwargs):
+        for key, todokey in dict(*args, **kwargs).items():
+            self[key] = todokey
 
 
 class TodoList(UserDict):
 
-    """ A todo list with keys, the default key being TodoKey.null. """
+    """ A todo list with keys, the default key being null_key. """
     class AddError(ValueError):
         pass
 
@@ -1554,6 +3319,12 @@ class TodoList(UserDict):
     class ParseError(ValueError):
         pass
 
+    class Rollback(Exception):
+        """ Raised inside of a transaction() to roll it back, without an
+            error.
+        """
+        pass
+
     class SameIndexError(BadIndexError):
         pass
 
@@ -1576,6 +3347,23 @@ class TodoList(UserDict):
     TodoListResult = namedtuple('TodoListResult', ('key', 'index', 'item'))
     TodoListResult.__bool__ = no_nones
 
+    # Size (in bytes) that the journal can grow to before it is compacted
+    # into a fresh snapshot of the list.
+    journal_max = 1024 * 1024
+    # Known storage types. JSON files are handled by TodoList itself.
+    storage_types = ('json', 'sqlite', 'shards')
+    # Max number of threads used to load lazy keys all at once.
+    load_workers = 8
+    # Format version for parse cache files. Older cache files are ignored.
+    cache_version = 1
+    # Size (in bytes) that a JSON file must be to get a key offset index
+    # and a search index. Smaller files are quick enough to load all at
+    # once, and to search without an index.
+    index_min = 64 * 1024
+    # Size (in bytes) that a JSON file must be to be streamed, when
+    # streaming is used. (see TodoStream)
+    stream_min = 16 * 1024 * 1024
+
     def __init__(self, *args, **kwargs):
         filename = kwargs.get('filename', None)
         if filename is None:
@@ -1583,6 +3371,64 @@ class TodoList(UserDict):
         else:
             self.filename = filename
             kwargs.pop('filename')
+        # When journal is None, it is used only if a journal file exists.
+        self.journal = kwargs.get('journal', None)
+        with suppress(KeyError):
+            kwargs.pop('journal')
+        # Set when the journal can't be appended to, and must be compacted.
+        self.journal_stale = False
+        # Storage type for the list file, or None to use the file extension.
+        self.storage = kwargs.get('storage', None)
+        with suppress(KeyError):
+            kwargs.pop('storage')
+        if self.storage not in (None, ) + self.storage_types:
+            raise ValueError('Unknown storage type: {}'.format(self.storage))
+        # Storage backends that have been used, by file name.
+        self.backends = {}
+        # With lazy=True, keys from indexed JSON files are only parsed when
+        # they are used. The file is kept open for those lazy keys.
+        self.lazy = kwargs.get('lazy', False)
+        with suppress(KeyError):
+            kwargs.pop('lazy')
+        self.lazyfile = None
+        # With stream=True, big JSON files are read one item at a time
+        # from a memory-mapped file, for commands that only read the list.
+        # The TodoStream is kept in lazyfile.
+        self.stream = kwargs.get('stream', False)
+        with suppress(KeyError):
+            kwargs.pop('stream')
+        # With cache=True, parsed JSON files are cached (see cache_file()),
+        # and loaded from the cache while the file is unchanged.
+        self.cache = kwargs.get('cache', False)
+        with suppress(KeyError):
+            kwargs.pop('cache')
+        # Held while the journal or snapshot is written. It isn't
+        # reentrant, because a background compaction releases it from
+        # another thread. (see compact_journal())
+        self.journal_lock = threading.Lock()
+        # Changes made since the last load/save, as (action, label, *args).
+        self.changes = []
+        # The default key, for commands that don't name one. Each list has
+        # it's own, because the server keeps several lists loaded.
+        # (see set_null_key())
+        self.null_key = TodoKey.null
+        # Stamp for the JSON file that was loaded or written.
+        self.snapshot = None
+        # Search index for JSON files, loaded or built when it is first
+        # needed. False when there is no usable index.
+        # (see get_search_index())
+        self.search_index = None
+        # Labels for keys that changed since the search index was written.
+        self.search_stale = set()
+        # Saves are deferred while a transaction is running.
+        self.transactions = 0
+        self.save_requested = False
+        # States to roll back to for each running transaction, outermost
+        # first. (see get_state())
+        self.rollbacks = []
+        # Item changes made during the running transactions, oldest first,
+        # so they can be undone. (see TodoKey.record_undo())
+        self.undo = []
         # Make TodoList.data available, intialize like any other dict.
         super().__init__(*args, **kwargs)
         if self.filename is not None:
@@ -1591,24 +3437,108 @@ class TodoList(UserDict):
     def __bool__(self):
         return bool(self.data)
 
+    @property
+    def data(self):
+        """ The TodoKeyDict of {label: TodoKey}. """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        if not isinstance(value, TodoKeyDict):
+            value = TodoKeyDict(value)
+        self._data = value
+
+    def __delitem__(self, key):
+        self.delete_key(key)
+
+    def __setitem__(self, key, todokey):
+        """ Set a TodoKey directly, recording it as a whole-key change. """
+        todokey.changes = self.changes
+        todokey.todolist = self
+        todokey.dirty = True
+        self.data[key] = todokey
+        self.changes.append((
+            'key',
+            todokey.get_label(usetextmarker=True),
+            [item.to_json() for item in todokey.data],
+        ))
+
     def add_item(self, text, key=None, important=False):
         """ Add an item, with an option to save under a certain key.
             Returns (TodoKey, TodoItem) on success.
         """
         if not text:
             raise self.AddError('No item to add.')
-        key = key if key is not None else TodoKey.null
+        key = key if key is not None else self.null_key
         debug('TodoList.add_item(\'{}\', key=\'{}\')'.format(text, key))
         # Find the existing key, or create a new one.
-        existing = self.get_key(key, default=TodoKey(label=key))
+        existing = self.get_key(key, default=None)
+        if existing is None:
+            existing = TodoKey(label=key)
+            self[existing.label] = existing
         # Create the new TodoItem.
         newitem = existing.add_item(item=text, important=important)
-        # Save the new items to this key.
-        self.data[key] = existing
         return (existing, newitem)
 
+    def apply_change(self, change):
+        """ Apply a single change from the change log/journal.
+            Changes are tuples/lists of (action, label, *args).
+            Possibly raises TodoList.ParseError for unknown changes.
+        """
+        action, args = change[0], change[1:]
+        try:
+            if action == 'clear':
+                self.clear()
+                return None
+            label = args[0]
+            if action == 'add':
+                self.add_item(args[1], key=label)
+            elif action == 'delkey':
+                self.delete_key(label)
+            elif action == 'key':
+                todokey = TodoKey(label=label)
+                for text in args[1]:
+                    todokey.add_item(item=text)
+                self[todokey.label] = todokey
+            elif action == 'rename':
+                self.rename_key(args[1], key=label)
+            elif action == 'important':
+                self.get_key(label).mark_item(args[1], important=args[2])
+            elif action == 'item':
+                todokey = self.get_key(label)
+                item = TodoItem(text=args[2])
+                todokey.before_change()
+                item.key = todokey
+                olditem = todokey.data[args[1]]
+                if item.important != olditem.important:
+                    todokey.count_important(1 if item.important else -1)
+                todokey.data[args[1]] = item
+                todokey.record_undo('set', args[1], olditem)
+            elif action == 'keyimportant':
+                self.get_key(label).mark_important(args[1])
+            elif action == 'move':
+                self.get_key(label).move_item(args[1], args[2])
+            elif action == 'remove':
+                self.get_key(label).remove_item(args[1])
+            else:
+                raise self.ParseError('Unknown action: {!r}'.format(action))
+        except (AttributeError, IndexError, KeyError, TypeError) as ex:
+            errmsg = 'Unable to apply change: {!r}'.format(change)
+            raise self.ParseError(errmsg) from ex
+        return None
+
+    @staticmethod
+    def backend_class(storagetype):
+        """ Return the storage backend class for a storage type. """
+        return {'sqlite': TodoSQLite, 'shards': TodoShards}[storagetype]
+
+    @timed('backup_file')
     def backup_file(self, filename=None):
-        """ Backup existing todo.lst. """
+        """ Backup existing todo.lst.
+            The backup is a hard link to the existing file, because saves
+            replace todo.lst with a new file instead of rewriting it.
+            If hard links aren't supported, the file is copied.
+        """
         filename = filename or self.filename
         if not filename:
             raise ValueError('No file name is set.')
@@ -1620,6 +3550,19 @@ class TodoList(UserDict):
         if os.path.exists(backupname):
             debug('Overwriting backup file: {}'.format(filename))
 
+        tmpname = '{}.{}.tmp'.format(backupname, os.getpid())
+        try:
+            with suppress(FileNotFoundError):
+                os.remove(tmpname)
+            os.link(filename, tmpname)
+            os.replace(tmpname, backupname)
+        except EnvironmentError as exlink:
+            debug('Failed to link backupfile, copying: {}'.format(exlink))
+            with suppress(FileNotFoundError):
+                os.remove(tmpname)
+        else:
+            return True
+
         try:
             shutil.copyfile(filename, backupname)
         except EnvironmentError as ex:
@@ -1631,11 +3574,164 @@ class TodoList(UserDict):
             return False
         return True
 
+    def before_change(self, todokey):
+        """ Save a TodoKey's state the first time it changes during a
+            transaction, so it can be rolled back. Keys that don't change
+            are never saved.
+        """
+        keystate = None
+        for state in self.rollbacks:
+            if id(todokey) in state['todokeys']:
+                continue
+            if keystate is None:
+                keystate = todokey.get_state()
+            state['todokeys'][id(todokey)] = (todokey, keystate)
+
+    @staticmethod
+    def build_items(texts, window=None):
+        """ Build a list of TodoItems from item text (JSON strings).
+            If a `window` slice is given, only those items are built.
+        """
+        if window is not None:
+            texts = texts[window]
+        return [TodoItem(text=str(text)) for text in texts]
+
+    def build_search_index(self):
+        """ Build the search index for this list's JSON file, and write it.
+            The index holds the trigrams found in each key's items.
+            Keys that haven't changed since the current index was built
+            keep their trigrams. Other keys are read without loading them
+            (see TodoKey.get_items()). Keys with unsaved changes are left
+            out, because the file doesn't have them yet (search_keys()
+            always includes them).
+            Small files don't get an index, and any old index is removed.
+            Returns the index, or None if there is no usable index.
+        """
+        if (not self.filename) or (self.snapshot is None):
+            return None
+        searchname = self.search_file()
+        if self.snapshot[1] < self.index_min:
+            with suppress(FileNotFoundError):
+                os.remove(searchname)
+            self.search_stale.clear()
+            return None
+
+        # Trigrams for each key in the current index.
+        oldkeys = {}
+        old = self.search_index or None
+        if old is not None:
+            for trigram, keylabels in old['trigrams'].items():
+                for label in keylabels:
+                    oldkeys.setdefault(label, set()).add(trigram)
+        labels = []
+        trigrams = {}
+        with timed('build search index'):
+            for todokey in self.todokeys():
+                if todokey.dirty:
+                    continue
+                unchanged = (
+                    (old is not None) and
+                    (todokey.label not in self.search_stale) and
+                    (todokey.label in old['keys'])
+                )
+                if unchanged:
+                    keytrigrams = oldkeys.get(todokey.label, set())
+                else:
+                    keytrigrams = set()
+                    # Unloaded keys stay unloaded, and streamed keys are
+                    # read one item at a time.
+                    for item in todokey.get_items():
+                        keytrigrams.update(self.trigrams(item.to_str()))
+                for trigram in keytrigrams:
+                    trigrams.setdefault(trigram, []).append(len(labels))
+                labels.append(todokey.label)
+        self.search_stale.clear()
+        if not os.path.exists(self.journal_file()):
+            # Keys saved to a journal aren't in the snapshot yet.
+            self.write_search_index(searchname, labels, trigrams)
+        return {
+            'keys': set(labels),
+            'trigrams': {
+                trigram: {labels[keynum] for keynum in keynums}
+                for trigram, keynums in trigrams.items()
+            },
+        }
+
+    def cache_file(self, filename=None):
+        """ Return the parse cache file name for a todo.lst file. Cache files
+            are kept in $XDG_CACHE_HOME/todo (or ~/.cache/todo), named after
+            a hash of the full path.
+        """
+        filename = filename or self.filename
+        if not filename:
+            raise ValueError('No file name is set.')
+        # Only imported when it's needed, to keep startup fast.
+        import hashlib
+        cachedir = os.environ.get('XDG_CACHE_HOME', '') or os.path.join(
+            os.path.expanduser('~'),
+            '.cache',
+        )
+        pathhash = hashlib.sha1(
+            os.path.abspath(filename).encode('utf-8', 'surrogateescape')
+        ).hexdigest()
+        return os.path.join(cachedir, 'todo', '{}.cache'.format(pathhash))
+
+    def candidate_keys(self, query):
+        """ Return the TodoKeys that may have items matching a query.
+            Lazy keys are only included when their storage finds a match,
+            so they are never loaded just to be searched.
+        """
+        todokeys = self.todokeys()
+        backend = self.get_backend()
+        if backend is None:
+            # JSON files may have a search index.
+            matched = self.search_keys(query)
+            return todokeys if matched is None else matched
+        if all(k.is_loaded() for k in todokeys):
+            return todokeys
+        matched = {id(k) for k in backend.search_keys(query)}
+        return [
+            k for k in todokeys
+            if k.is_loaded() or k.pending or (id(k) in matched)
+        ]
+
     def clear(self):
         """ Clears all items without warning. """
         self.data = {}
+        self.changes.append(('clear', ))
         return True
 
+    def compact_journal(self, filename=None, background=False):
+        """ Write a fresh snapshot of the list, and remove the journal.
+            If background is True, the snapshot is written in another
+            thread, and the Thread is returned. The JSON is always built
+            here first, so the list can keep changing while it's written.
+            The journal lock is held until the journal is removed, so
+            changes saved meanwhile go into a new journal for the new
+            snapshot.
+        """
+        filename = filename or self.filename
+        self.journal_lock.acquire()
+        try:
+            debug('Compacting journal: {}'.format(self.journal_file(filename)))
+            jsondata, offsets, jsonobj = self.to_json_snapshot()
+        except BaseException:
+            self.journal_lock.release()
+            raise
+
+        def write_snapshot():
+            try:
+                self.write_snapshot(filename, jsondata, offsets, jsonobj)
+            finally:
+                self.journal_lock.release()
+
+        if not background:
+            write_snapshot()
+            return None
+        thread = threading.Thread(target=write_snapshot, name='todo-compact')
+        thread.start()
+        return thread
+
     def delete_key(self, key=None):
         """ Delete an entire key from this list.
             The key can be a name, or a TodoKey.
@@ -1645,19 +3741,24 @@ class TodoList(UserDict):
         if isinstance(key, TodoKey):
             key = key.label
         try:
-            del self.data[key]
-        except (TypeError, KeyError) as ex:
+            # Keys are found case-insensitively, like get_key().
+            label = self.data.find(key)
+            del self.data[label]
+        except (AttributeError, TypeError, KeyError) as ex:
             errmsg = 'Unable to remove key: {}\n{}'.format(key, ex)
             raise self.BadKeyError(errmsg)
+        self.changes.append(('delkey', label))
         return True
 
     def find_item(self, query, key=None):
         """ Finds a specific item in the list.
             The query can be a regex pattern (str), or an index.
-            If 'key' is not set, TodoKey.null is used.
+            If 'key' is not set, TodoList.null_key is used.
             Returns a list [(TodoKey(), Index, TodoItem()), ...] on success.
             Returns [] if no result is found.
         """
+        # The query is only parsed once, for all keys.
+        query = TodoQuery.parse(query)
         if key:
             debug('Finding item in key: {}'.format(key))
             todokey = self.get_key(key, None)
@@ -1678,7 +3779,7 @@ class TodoList(UserDict):
 
         debug('Finding item in any key.')
         found = []
-        for todokey in self.todokeys():
+        for todokey in self.candidate_keys(query):
             keyresult = todokey.find_item(query)
             if keyresult:
                 found.append(
@@ -1690,15 +3791,37 @@ class TodoList(UserDict):
                 )
         return found
 
+    def get_backend(self, filename=None):
+        """ Return the storage backend for a file, or None for JSON files.
+        """
+        filename = filename or self.filename
+        if not filename:
+            return None
+        storagetype = self.storage or self.storage_for(filename)
+        if storagetype == 'json':
+            return None
+        backend = self.backends.get(filename, None)
+        if backend is None:
+            backend = self.backend_class(storagetype)(filename)
+            self.backends[filename] = backend
+        return backend
+
     def get_count(self):
         """ Get an overall count of items in all keys.
             To get just the key count, len(TodoList) works.
         """
         total = 0
         for todokey in self.todokeys():
-            total += len(todokey)
+            total += todokey.get_count()
         return total
 
+    def get_important_count(self):
+        """ Get an overall count of important items in all keys. """
+        return sum(
+            todokey.get_important_count()
+            for todokey in self.todokeys()
+        )
+
     def get_key(self, key=None, default=None):
         """ Returns raw format items from a key.
             If no key exists, returns None.
@@ -1708,14 +3831,53 @@ class TodoList(UserDict):
             # A valid TodoKey was passed in already.
             return key
 
-        key = key if key is not None else TodoKey.null
-        key = key.lower()
+        key = key if key is not None else self.null_key
         debug('TodoList.get_key(\'{}\')'.format(key))
-        for todokeyname in self.data:
-            todokey = self.data[todokeyname]
-            if todokey.label.lower() == key:
-                return todokey
-        return default
+        label = self.data.find(key)
+        if label is None:
+            return default
+        return self.data[label]
+
+    def get_search_index(self):
+        """ Return the search index for this list's JSON file, loading it
+            if needed. Saves only mark changed keys as stale, the index is
+            built (or updated for stale keys) here when it's next needed.
+            Returns None if there is no usable index.
+        """
+        if self.search_index is None:
+            self.search_index = self.load_search_index() or False
+        if (self.search_index is False) or self.search_stale:
+            self.search_index = self.build_search_index() or False
+        return self.search_index or None
+
+    def get_state(self):
+        """ Return the state of this list, for rolling back a transaction.
+            Only the keys are saved here. Each key's state is saved the
+            first time it changes (see before_change()), and changes to
+            items are undone one at a time from the undo log, so items are
+            never copied.
+        """
+        return {
+            'keys': list(self.data.items()),
+            'changes': len(self.changes),
+            'undo': len(self.undo),
+            'null': self.null_key,
+            'save_requested': self.save_requested,
+            'todokeys': {},
+        }
+
+    def has_changes(self):
+        """ Returns True if anything has changed since the list was loaded,
+            or last saved.
+        """
+        return bool(self.changes)
+
+    def index_file(self, filename=None):
+        """ Return the key offset index file name for a todo.lst file. """
+        filename = filename or self.filename
+        if not filename:
+            raise ValueError('No file name is set.')
+        return '{}.idx'.format(filename)
 
     @staticmethod
     def is_null_str(s):
@@ -1724,6 +3886,23 @@ class TodoList(UserDict):
             return str(s).lower() in ('', 'null', 'none', 'no label')
         return True
 
+    def iter_items(self):
+        """ Yields a TodoListResult(key, index, item) for every item, in
+            the order that they are listed. Streamed keys are read one item
+            at a time, without loading them. (see TodoKey.iter_items())
+        """
+        for keyname in self.keynames():
+            todokey = self.data[keyname]
+            for index, item in enumerate(todokey.iter_items()):
+                yield self.TodoListResult(keyname, index, item)
+
+    def journal_file(self, filename=None):
+        """ Return the journal file name for a todo.lst file. """
+        filename = filename or self.filename
+        if not filename:
+            raise ValueError('No file name is set.')
+        return '{}.journal'.format(filename)
+
     def keynames(self):
         """ Shortcut to sorted(TodoList.data.keys()) """
         return sorted(self.keys())
@@ -1732,8 +3911,12 @@ class TodoList(UserDict):
         """ Shortcut to TodoList.data.keys() """
         return self.data.keys()
 
-    def load_data(self, data, append=False):
-        """ Load items from a dict. """
+    @timed('load_data')
+    def load_data(self, data, append=False, lazy=False):
+        """ Load items from a dict.
+            With lazy=True, each key's TodoItems are only built when the key
+            is used.
+        """
         if not data:
             # No data passed in!
             self.data = {}
@@ -1741,25 +3924,60 @@ class TodoList(UserDict):
 
         for keyname in sorted(data):
             keyitems = data[keyname]
-            todokey = TodoKey(label=keyname)
             if isinstance(keyitems, dict):
-                for itemkey in sorted(keyitems):
-                    text = keyitems[itemkey]
-                    todokey.add_item(item=text)
-            elif isinstance(keyitems, list):
-                for text in keyitems:
-                    todokey.add_item(item=text)
+                keyitems = [keyitems[itemkey] for itemkey in sorted(keyitems)]
+            elif not isinstance(keyitems, list):
+                keyitems = []
+            if lazy:
+                todokey = TodoKey(
+                    label=keyname,
+                    loader=functools.partial(self.build_items, keyitems),
+                    size=len(keyitems),
+                )
+            else:
+                # Items are built all at once. They are already saved, so
+                # there are no changes to record.
+                todokey = TodoKey(self.build_items(keyitems), label=keyname)
+            todokey.changes = self.changes
+            todokey.todolist = self
             self.data[todokey.get_label()] = todokey
 
-        # Set the default key to the first key found, if there is data
-        # available.
-        if self.data:
-            TodoKey.null = self.keynames()[0]
-            msgnullsetting = 'TodoKey.null = \'{}\''.format(TodoKey.null)
-            debug('TodoList.load_data(): {}'.format(msgnullsetting))
-
+        self.set_null_key()
         return self.get_count()
 
+    @timed('load_cache')
+    def load_cache(self, filename=None):
+        """ Load the parsed JSON for a file from it's cache file.
+            Returns None if there is no cache, or the file has changed since
+            the cache was written.
+        """
+        # Only imported when it's needed, to keep startup fast.
+        import marshal
+        filename = filename or self.filename
+        cachename = self.cache_file(filename)
+        try:
+            with open(cachename, 'rb') as f:
+                cache = marshal.loads(f.read())
+            version = cache['version']
+            cachedname, stamp = cache['filename'], cache['snapshot']
+            jsonobj = cache['data']
+        except FileNotFoundError:
+            return None
+        except (
+                EnvironmentError, EOFError, KeyError,
+                TypeError, ValueError) as ex:
+            debug('Ignoring bad cache: {} ({})'.format(cachename, ex))
+            return None
+        if (
+                (version != self.cache_version) or
+                (cachedname != os.path.abspath(filename)) or
+                (stamp != self.snapshot_stamp(filename))):
+            debug('Ignoring old cache: {}'.format(cachename))
+            return None
+        debug('Loaded cache: {}'.format(cachename))
+        return jsonobj
+
+    @timed('load_file')
     def load_file(self, filename=None):
         """ Load items from a json file. """
         if not filename:
@@ -1771,19 +3989,112 @@ class TodoList(UserDict):
             errmsg = 'File doesn\'t exist: {}'.format(filename)
             raise self.NoFileExists(errmsg)
 
+        backend = self.get_backend(filename)
+        if backend is not None:
+            backend.load(self)
+            self.set_null_key()
+            del self.changes[:]
+            return self.get_count()
+
+        jsonobj = self.load_cache(filename) if self.cache else None
+        if jsonobj is not None:
+            # Keys are still only built when they are used.
+            self.load_data(jsonobj, lazy=self.lazy)
+        elif self.stream and self.load_stream(filename):
+            pass
+        elif not (self.lazy and self.load_lazy(filename)):
+            self.load_json(filename)
+        if filename == self.filename:
+            self.snapshot = self.snapshot_stamp(filename)
+        if self.load_journal(filename) and (self.journal is None):
+            # Keep using the journal that already exists.
+            self.journal = True
+        self.set_null_key()
+        # The loaded items are already saved.
+        del self.changes[:]
+        return self.get_count()
+
+    def load_index(self, filename=None):
+        """ Load the key offset index for a JSON file.
+            Returns {jsonkey: [start, end, count]}, or None if there is no
+            usable index.
+        """
+        filename = filename or self.filename
+        indexname = self.index_file(filename)
         try:
-            with open(filename, 'r') as f:
+            with open(indexname, 'r') as f:
+                index = json.load(f)
+            stamp, keys = index['snapshot'], index['keys']
+        except FileNotFoundError:
+            return None
+        except (EnvironmentError, KeyError, TypeError, ValueError) as ex:
+            debug('Ignoring bad index: {} ({})'.format(indexname, ex))
+            return None
+        if stamp != self.snapshot_stamp(filename):
+            debug('Ignoring old index: {}'.format(indexname))
+            return None
+        return keys
+
+    @timed('load_journal')
+    def load_journal(self, filename=None):
+        """ Replay changes from the journal over the loaded snapshot.
+            Journals written for an older snapshot are ignored.
+            Returns the number of changes applied.
+        """
+        journalname = self.journal_file(filename)
+        try:
+            with open(journalname, 'r') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return 0
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read: {}'.format(journalname)
+            raise self.LoadError(errmsg) from exread
+
+        try:
+            header = json.loads(lines[0])
+            snapshot = header['snapshot']
+        except (IndexError, KeyError, TypeError, ValueError):
+            debug('Invalid journal header: {}'.format(journalname))
+            self.journal_stale = True
+            return 0
+        if snapshot != self.snapshot_stamp(filename):
+            debug('Ignoring old journal: {}'.format(journalname))
+            self.journal_stale = True
+            return 0
+
+        applied = 0
+        for line in lines[1:]:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # A save was interrupted. Nothing after this can be trusted.
+                debug('Bad journal entry: {!r}'.format(line))
+                self.journal_stale = True
+                break
+            self.apply_change(change)
+            applied += 1
+        debug('Applied {} changes from: {}'.format(applied, journalname))
+        return applied
+
+    def load_json(self, filename=None):
+        """ Load all keys and items from a JSON file.
+            Returns the number of items loaded.
+        """
+        filename = filename or self.filename
+        # Stamped before reading, so a cache is never newer than it's stamp.
+        stamp = self.snapshot_stamp(filename)
+        try:
+            with timed('read'), open(filename, 'r') as f:
                 rawdata = f.read()
         except EnvironmentError as exread:
             errmsg = 'Unable to read: {}'.format(filename)
             raise self.LoadError(errmsg) from exread
 
-        if not rawdata.strip():
-            # Empty file.
-            return self.load_data({})
-
         try:
-            jsonobj = json.loads(rawdata)
+            # Empty files are just empty lists.
+            with timed('decode'):
+                jsonobj = json.loads(rawdata) if rawdata.strip() else {}
         except (TypeError, ValueError) as exparse:
             errmsg = 'Unable to parse JSON from: {}'.format(filename)
             raise self.ParseError(errmsg) from exparse
@@ -1792,18 +4103,173 @@ class TodoList(UserDict):
             # Convert old todo data to new format.
             converted = {TodoKey.null: {}}
             converted[TodoKey.null] = {i: s for i, s in enumerate(jsonobj)}
-            return self.load_data(converted)
+            jsonobj = converted
 
+        if self.cache:
+            self.write_cache(filename, jsonobj, stamp=stamp)
         return self.load_data(jsonobj)
 
-    def move_item(self, query, newindex, key=None):
-        """ Move an item from one position to another in it's own key.
-            see: TodoKey.move_item()
-            Returns (TodoKey, oldindex, newindex, TodoItem) on success.
+    def load_key_items(self, fd, start, end, window=None):
+        """ Load the items for a single key from part of a JSON file.
+            If a `window` slice is given, only those items are returned.
+            Returns a list of TodoItems.
+        """
+        try:
+            rawdata = os.pread(fd, end - start, start)
+            keyitems = json.loads(rawdata.decode('utf-8'))
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read key from: {}'.format(self.filename)
+            raise self.LoadError(errmsg) from exread
+        except ValueError as exparse:
+            errmsg = 'Unable to parse key from: {}'.format(self.filename)
+            raise self.ParseError(errmsg) from exparse
+        if isinstance(keyitems, dict):
+            keyitems = [keyitems[itemkey] for itemkey in sorted(keyitems)]
+        if window is not None:
+            keyitems = keyitems[window]
+        return [TodoItem(text=text) for text in keyitems]
+
+    def load_keys(self, todokeys=None):
+        """ Load items for lazy keys ahead of time, in parallel when the
+            storage allows it. All keys are loaded if none are given.
+        """
+        if todokeys is None:
+            todokeys = self.todokeys()
+        unloaded = [k for k in todokeys if not k.is_loaded()]
+        backend = self.get_backend()
+        parallel = True if backend is None else backend.parallel
+        if parallel and (len(unloaded) > 1):
+            # Only imported when it's needed, to keep startup fast.
+            from concurrent.futures import ThreadPoolExecutor
+            workers = min(self.load_workers, len(unloaded))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Each key loads it's own items when .data is used.
+                for _ in pool.map(lambda k: k.data, unloaded):
+                    pass
+        else:
+            for todokey in unloaded:
+                todokey.data
+        return len(unloaded)
+
+    @timed('load_lazy')
+    def load_lazy(self, filename=None):
+        """ Load every key from a JSON file as a lazy key, using the key
+            offset index. A key's items are only parsed when it is used.
+            Returns False if there is no usable index for the file.
+        """
+        filename = filename or self.filename
+        index = self.load_index(filename)
+        if index is None:
+            return False
+        try:
+            f = open(filename, 'rb')
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read: {}'.format(filename)
+            raise self.LoadError(errmsg) from exread
+        # The file may have been replaced after the index was read.
+        # Saves replace the file instead of rewriting it, so the open file
+        # will always match the index from now on.
+        if self.snapshot_stamp(f.fileno()) != self.snapshot_stamp(filename):
+            f.close()
+            return False
+        if self.lazyfile is not None:
+            self.lazyfile.close()
+        self.lazyfile = f
+        for jsonkey, (start, end, count) in index.items():
+            todokey = TodoKey(
+                label=jsonkey,
+                loader=functools.partial(
+                    self.load_key_items,
+                    f.fileno(),
+                    start,
+                    end,
+                ),
+                size=count,
+            )
+            todokey.changes = self.changes
+            todokey.todolist = self
+            self.data[todokey.get_label()] = todokey
+        debug('Loaded {} lazy keys from: {}'.format(len(index), filename))
+        return True
+
+    def load_search_index(self, filename=None):
+        """ Load the search index for a JSON file.
+            Returns {'keys': {label, ..}, 'trigrams': {trigram: {label, ..}}},
+            or None if there is no usable index.
+        """
+        filename = filename or self.filename
+        if not filename:
+            return None
+        searchname = self.search_file(filename)
+        try:
+            with open(searchname, 'r') as f:
+                index = json.load(f)
+            stamp, labels = index['snapshot'], index['keys']
+            trigrams = {
+                trigram: {labels[keynum] for keynum in keynums}
+                for trigram, keynums in index['trigrams'].items()
+            }
+        except FileNotFoundError:
+            return None
+        except (
+                EnvironmentError,
+                IndexError,
+                KeyError,
+                TypeError,
+                ValueError) as ex:
+            debug('Ignoring bad search index: {} ({})'.format(searchname, ex))
+            return None
+        if (stamp is None) or (stamp != self.snapshot):
+            debug('Ignoring old search index: {}'.format(searchname))
+            return None
+        return {'keys': set(labels), 'trigrams': trigrams}
+
+    @timed('load_stream')
+    def load_stream(self, filename=None):
+        """ Load every key from a big JSON file as a streamed key, which
+            reads it's items from a memory-mapped file one at a time (see
+            TodoStream). Keys are found with the key offset index, or by
+            scanning the file once.
+            Returns False if the file is too small to stream.
+        """
+        filename = filename or self.filename
+        try:
+            size = os.path.getsize(filename)
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read: {}'.format(filename)
+            raise self.LoadError(errmsg) from exread
+        if size < self.stream_min:
+            return False
+        stream = TodoStream(filename)
+        index = self.load_index(filename)
+        # The file may have been replaced after it was mapped.
+        if (index is None) or (stream.stamp != self.snapshot_stamp(filename)):
+            index = stream.keys()
+        if self.lazyfile is not None:
+            self.lazyfile.close()
+        self.lazyfile = stream
+        for jsonkey in sorted(index):
+            start, end, count = index[jsonkey]
+            todokey = TodoKey(
+                label=jsonkey,
+                loader=functools.partial(stream.load_items, start, end),
+                size=count,
+                streamed=True,
+            )
+            todokey.changes = self.changes
+            todokey.todolist = self
+            self.data[todokey.get_label()] = todokey
+        debug('Loaded {} streamed keys from: {}'.format(len(index), filename))
+        return True
+
+    def move_item(self, query, newindex, key=None):
+        """ Move an item from one position to another in it's own key.
+            see: TodoKey.move_item()
+            Returns (TodoKey, oldindex, newindex, TodoItem) on success.
             Returns (None, None, None, None) on failure.
             Possibly raises TodoList.BadIndexError, TodoList.SameIndexError
         """
-        key = key if key is not None else TodoKey.null
+        key = key if key is not None else self.null_key
         todokey = self.get_key(key, None)
         if todokey is None:
             return self.TodoListMove(None, None, None, None)
@@ -1821,7 +4287,7 @@ class TodoList(UserDict):
             Returns (oldTodoKey, newTodoKey, TodoItem) on success.
             Returns (None, None, None) on failure.
         """
-        key = key if key is not None else TodoKey.null
+        key = key if key is not None else self.null_key
         todokey = self.get_key(key, None)
         if todokey is None:
             return self.TodoListMoveToKey(None, None, None)
@@ -1851,11 +4317,11 @@ class TodoList(UserDict):
 
     def remove_item(self, query, key=None):
         """ Remove an item from the todo list.
-            If no key is given, then TodoKey.null is used.
+            If no key is given, then TodoList.null_key is used.
             If the item was successfully removed, it is returned.
             Returns None on failure.
         """
-        key = key if key is not None else TodoKey.null
+        key = key if key is not None else self.null_key
         todokey = self.get_key(key, None)
         if todokey is None:
             return None
@@ -1863,37 +4329,134 @@ class TodoList(UserDict):
         return removed
 
     def rename_key(self, newkeyname, key=None):
-        """ Rename a key. Old key defaults to TodoKey.null """
-        key = key if key is not None else TodoKey.null
-        try:
-            removed = self.data.pop(key)
-        except KeyError:
+        """ Rename a key. Old key defaults to TodoList.null_key """
+        key = key if key is not None else self.null_key
+        if isinstance(key, TodoKey):
+            key = key.label
+        # Keys are found case-insensitively, like get_key().
+        label = self.data.find(key)
+        if label is None:
             return None
+        removed = self.data.pop(label)
+        removed.before_change()
         removed.label = newkeyname
         self.data[newkeyname] = removed
+        self.changes.append(('rename', label, newkeyname))
         return self.get_key(newkeyname)
 
+    def save_as(self, filename, storage=None):
+        """ Write a full copy of this list to another file, converting it
+            to that file's storage type (or the `storage` type given).
+            Returns the number of items written.
+        """
+        storagetype = storage or self.storage_for(filename)
+        if storagetype == 'json':
+            self.write_file(filename)
+        else:
+            backend = self.backend_class(storagetype)(filename)
+            try:
+                backend.write(self)
+            finally:
+                backend.close()
+        return self.get_count()
+
     def save_file(self, filename=None):
-        """ Save items to file. """
+        """ Save items to file.
+            Nothing is written when nothing has changed since the list was
+            loaded or saved. Inside of a transaction(), the save is done
+            when the transaction is finished.
+            In journal mode, only the changes are appended to the journal.
+        """
         if not filename:
             filename = self.filename
         if not filename:
             raise self.SaveError('No filename provided.')
 
-        # make json string.
-        jsondata = self.to_json()
-        # Backup any existing todo.lst.
-        self.backup_file(filename=filename)
+        if self.transactions and (filename == self.filename):
+            debug('Deferring save until the transaction is finished.')
+            self.save_requested = True
+            return self.get_count()
 
-        # write to file.
-        try:
-            with open(filename, 'w') as f:
-                f.write(jsondata)
-        except EnvironmentError as exwrite:
-            errmsg = 'Unable to write to file: {}'.format(filename)
-            raise self.SaveError(errmsg) from exwrite
+        unchanged = (
+            (not self.changes) and
+            (filename == self.filename) and
+            os.path.exists(filename)
+        )
+        if unchanged:
+            debug('No changes to save: {}'.format(filename))
+            return self.get_count()
+
+        backend = self.get_backend(filename)
+        if backend is not None:
+            with timed('backend save'):
+                if filename == self.filename:
+                    # Only the changes are saved.
+                    backend.save(self)
+                else:
+                    backend.write(self)
+            self.saved()
+            return self.get_count()
+
+        usejournal = (
+            self.journal and
+            (not self.journal_stale) and
+            os.path.exists(filename)
+        )
+        if usejournal:
+            self.save_journal(filename)
+        else:
+            with self.journal_lock:
+                self.write_file(filename)
+        self.saved()
         return self.get_count()
 
+    def saved(self):
+        """ Forget about recorded changes, after they have been saved. """
+        del self.changes[:]
+        for todokey in self.data.values():
+            todokey.dirty = False
+
+    @timed('save_journal')
+    def save_journal(self, filename=None):
+        """ Append all recorded changes to the journal.
+            The journal is compacted in the background when it grows past
+            TodoList.journal_max.
+        """
+        if not self.changes:
+            return 0
+        journalname = self.journal_file(filename)
+        lines = [json.dumps(change) for change in self.changes]
+        with self.journal_lock:
+            if not os.path.exists(journalname):
+                # The header ties this journal to the current snapshot.
+                stamp = self.snapshot_stamp(filename)
+                lines.insert(0, json.dumps({'snapshot': stamp}))
+            try:
+                with open(journalname, 'a') as f:
+                    f.write('\n'.join(lines))
+                    f.write('\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                    journalsize = f.tell()
+            except EnvironmentError as exwrite:
+                errmsg = 'Unable to write to file: {}'.format(journalname)
+                raise self.SaveError(errmsg) from exwrite
+        # The search index is updated when it's next used.
+        self.search_stale.update(
+            todokey.label for todokey in self.todokeys() if todokey.dirty
+        )
+        debug('Journal size: {}'.format(journalsize))
+        if journalsize > self.journal_max:
+            self.compact_journal(filename=filename, background=True)
+        return journalsize
+
+    def search_file(self, filename=None):
+        """ Return the search index file name for a todo.lst file. """
+        filename = filename or self.filename
+        if not filename:
+            raise ValueError('No file name is set.')
+        return '{}.search'.format(filename)
+
     def search_items(self, query, firstonly=False):
         """ Searches ALL items that match the query.
             The query can be a regex pattern (str), or an index.
@@ -1903,9 +4466,14 @@ class TodoList(UserDict):
                 where results are: [(KeyName, [(Index, TodoItem)])]
             Returns [] when no match is found.
         """
+        # The query is only parsed once, for all keys.
+        query = TodoQuery.parse(query)
         results = []
+        candidates = {id(k) for k in self.candidate_keys(query)}
         for keyname in self.keynames():
             todokey = self.get_key(keyname)
+            if id(todokey) not in candidates:
+                continue
             founditems = todokey.search_items(query)
             if founditems:
                 if firstonly:
@@ -1913,8 +4481,146 @@ class TodoList(UserDict):
                 results.append((keyname, founditems))
         return results
 
-    def to_json(self, usedict=False):
-        """ Return the json string for this todo list. """
+    def search_keys(self, query):
+        """ Return the TodoKeys that may have items matching a plain text
+            query, using the search index. Keys that have changed since
+            the index was written are always included.
+            Returns None if the index can't be used for the query.
+        """
+        query = TodoQuery.parse(query)
+        if (query.text is None) or (len(query.text) < 3):
+            # Index and regex queries need a full scan.
+            return None
+        index = self.get_search_index()
+        if index is None:
+            return None
+        labels = None
+        for trigram in self.trigrams(query.text):
+            keylabels = index['trigrams'].get(trigram, set())
+            labels = keylabels if labels is None else (labels & keylabels)
+        return [
+            todokey
+            for todokey in self.todokeys()
+            if todokey.dirty or
+            (todokey.label in self.search_stale) or
+            (todokey.label not in index['keys']) or
+            (todokey.label in labels)
+        ]
+
+    def set_state(self, state):
+        """ Restore this list to a state from get_state(). Changes that were
+            recorded after the state was saved are forgotten.
+        """
+        while len(self.undo) > state['undo']:
+            todokey, action, *args = self.undo.pop()
+            todokey.undo_change(action, *args)
+        for todokey, keystate in state['todokeys'].values():
+            todokey.set_state(keystate)
+        self.data = state['keys']
+        del self.changes[state['changes']:]
+        self.null_key = state['null']
+        self.save_requested = state['save_requested']
+
+    def set_null_key(self):
+        """ Set the default key to the first key found, if there is data
+            available.
+        """
+        if self.data:
+            self.null_key = self.keynames()[0]
+            msgnullsetting = 'null_key = \'{}\''.format(self.null_key)
+            debug('TodoList.set_null_key(): {}'.format(msgnullsetting))
+        return self.null_key
+
+    @staticmethod
+    def snapshot_stamp(filename):
+        """ Return a stamp that identifies a snapshot file's contents,
+            as [inode, size, modified time], or None if it doesn't exist.
+            An open file descriptor can also be used.
+        """
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    @staticmethod
+    def storage_for(filename):
+        """ Return the storage type for a file name, based on the file
+            extension, or the file header for existing files.
+        """
+        ext = os.path.splitext(filename.rstrip(os.sep))[-1].lower()
+        if ext in TodoSQLite.extensions:
+            return 'sqlite'
+        if os.path.isdir(filename) or (ext in TodoShards.extensions):
+            return 'shards'
+        try:
+            with open(filename, 'rb') as f:
+                header = f.read(len(TodoSQLite.magic))
+        except EnvironmentError:
+            return 'json'
+        return 'sqlite' if header == TodoSQLite.magic else 'json'
+
+    def to_json(self, usedict=False, offsets=None, jsonobj=None):
+        """ Return the json string for this todo list.
+            If `offsets` is a dict, it is filled with the position of each
+            key's items in the JSON string, as {jsonkey: [start, end, count]}
+            If `jsonobj` is given (from to_json_obj()), it is used instead of
+            building it again.
+        """
+        d = self.to_json_obj(usedict=usedict) if jsonobj is None else jsonobj
+        try:
+            if offsets is None:
+                jsondata = json.dumps(d, indent=4, sort_keys=True)
+            else:
+                jsondata = self.to_json_offsets(d, offsets)
+        except (TypeError, ValueError) as exjson:
+            errmsg = 'Unable to generate JSON from: {!r} \n{}'.format(
+                d,
+                exjson)
+            raise self.ParseError(errmsg)
+        return jsondata
+
+    def to_json_lines(self):
+        """ Yields the lines of to_json() one at a time. Streamed keys are
+            read one item at a time, without loading them.
+        """
+        todokeys = sorted(
+            self.todokeys(),
+            key=lambda todokey: todokey.get_label(usetextmarker=True),
+        )
+        if not todokeys:
+            yield '{}'
+            return
+        yield '{'
+        lastkey = todokeys[-1]
+        for todokey in todokeys:
+            keystr = '    {}: '.format(
+                json.dumps(todokey.get_label(usetextmarker=True))
+            )
+            keyend = '' if todokey is lastkey else ','
+            # Each item line needs a comma, except for the last one.
+            itemstr = None
+            for item in todokey.iter_items():
+                if itemstr is None:
+                    yield '{}['.format(keystr)
+                else:
+                    yield '{},'.format(itemstr)
+                itemstr = '        {}'.format(
+                    json.dumps(item.to_str(color=False, usetextmarker=True))
+                )
+            if itemstr is None:
+                yield '{}[]{}'.format(keystr, keyend)
+            else:
+                yield itemstr
+                yield '    ]{}'.format(keyend)
+        yield '}'
+
+    def to_json_obj(self, usedict=False):
+        """ Return a JSON-friendly dict for this todo list, as
+            {jsonkey: [item, ..]}, or {jsonkey: {index: item}} with
+            `usedict`.
+        """
+        self.load_keys()
         d = {}
         for todokey in self.data.values():
             # Keys can be represented as dicts or lists.
@@ -1930,25 +4636,1078 @@ class TodoList(UserDict):
                 for item in todokey.data:
                     itemtext = item.to_str(color=False, usetextmarker=True)
                     d[jsonkey].append(itemtext)
+        return d
 
+    @staticmethod
+    def to_json_offsets(d, offsets):
+        """ Build the same JSON as json.dumps(d, indent=4, sort_keys=True)
+            one key at a time, recording where each key's items are in
+            `offsets` as {jsonkey: [start, end, count]}.
+            The output is ASCII, so string offsets are also byte offsets.
+        """
+        if not d:
+            return json.dumps(d)
+        chunks = ['{']
+        pos = 1
+        for i, jsonkey in enumerate(sorted(d)):
+            keystr = '{}\n    {}: '.format(
+                ',' if i else '',
+                json.dumps(jsonkey),
+            )
+            itemstr = json.dumps(
+                d[jsonkey],
+                indent=4,
+                sort_keys=True,
+            ).replace('\n', '\n    ')
+            start = pos + len(keystr)
+            pos = start + len(itemstr)
+            offsets[jsonkey] = [start, pos, len(d[jsonkey])]
+            chunks.append(keystr)
+            chunks.append(itemstr)
+        chunks.append('\n}')
+        return ''.join(chunks)
+
+    def to_json_snapshot(self):
+        """ Build everything needed to write a snapshot of this list (see
+            write_snapshot()), as (jsondata, offsets, jsonobj).
+            Keys that changed are marked as stale for the search index.
+        """
+        offsets = {}
+        with timed('to_json'):
+            jsonobj = self.to_json_obj()
+            jsondata = self.to_json(offsets=offsets, jsonobj=jsonobj)
+        # The search index is updated when it's next used.
+        self.search_stale.update(
+            todokey.label for todokey in self.todokeys() if todokey.dirty
+        )
+        return jsondata, offsets, jsonobj
+
+    @contextmanager
+    def transaction(self):
+        """ Context manager that defers saving until the block is finished,
+            and then saves once (only if save_file() was called).
+            If an exception is raised, the list is rolled back to it's
+            state before the transaction, and nothing is saved. Raising
+            TodoList.Rollback rolls back the transaction without an error.
+            Nested transactions are saved with the outermost one, but can
+            be rolled back on their own.
+        """
+        outermost = not self.transactions
+        if outermost:
+            self.save_requested = False
+        state = self.get_state()
+        self.rollbacks.append(state)
+        self.transactions += 1
         try:
-            jsondata = json.dumps(d, indent=4, sort_keys=True)
-        except (TypeError, ValueError) as exjson:
-            errmsg = 'Unable to generate JSON from: {!r} \n{}'.format(
-                d,
-                exjson)
-            raise self.ParseError(errmsg)
-        return jsondata
+            yield self
+        except self.Rollback:
+            debug('Rolling back transaction.')
+            self.set_state(state)
+        except BaseException:
+            debug('Rolling back transaction.')
+            self.set_state(state)
+            raise
+        finally:
+            self.transactions -= 1
+            self.rollbacks.pop()
+            if not self.rollbacks:
+                # Nothing can be rolled back now.
+                del self.undo[:]
+        if outermost and self.save_requested:
+            self.save_requested = False
+            self.save_file()
+
+    @staticmethod
+    def trigrams(text):
+        """ Return the set of casefolded 3-character strings in some text,
+            for the search index.
+        """
+        text = text.casefold()
+        return {text[i:i + 3] for i in range(len(text) - 2)}
 
     def todokeys(self):
         """ Shortcut to TodoList.data.values() """
         return list(self.data.values())
 
+    def write_cache(self, filename, jsonobj, stamp=None):
+        """ Write the parsed JSON for a file to it's cache file, for the
+            file's current stamp (or `stamp`, taken before it was read).
+        """
+        # Only imported when it's needed, to keep startup fast.
+        import marshal
+        cachename = self.cache_file(filename)
+        cache = {
+            'version': self.cache_version,
+            'filename': os.path.abspath(filename),
+            'snapshot': stamp or self.snapshot_stamp(filename),
+            'data': jsonobj,
+        }
+        # The cache is only a copy, a missing cache just means parsing the
+        # file again.
+        tmpname = '{}.{}.tmp'.format(cachename, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cachename), mode=0o700, exist_ok=True)
+            with open(tmpname, 'wb') as f:
+                marshal.dump(cache, f)
+            os.replace(tmpname, cachename)
+        except (EnvironmentError, ValueError) as ex:
+            debug('Unable to write cache: {} ({})'.format(cachename, ex))
+            with suppress(FileNotFoundError):
+                os.remove(tmpname)
+            return False
+        return True
+
+    @timed('write_file')
+    def write_file(self, filename=None):
+        """ Write a full snapshot of the list to file, replacing any
+            journal that was written for the old snapshot.
+            (see write_snapshot())
+        """
+        filename = filename or self.filename
+        jsondata, offsets, jsonobj = self.to_json_snapshot()
+        return self.write_snapshot(filename, jsondata, offsets, jsonobj)
+
+    def write_index(self, filename, offsets, size=0):
+        """ Write the key offset index for a JSON file that was just
+            written. Small files don't get an index, and any old index is
+            removed.
+        """
+        indexname = self.index_file(filename)
+        if size < self.index_min:
+            with suppress(FileNotFoundError):
+                os.remove(indexname)
+            return False
+        index = {
+            'snapshot': self.snapshot_stamp(filename),
+            'keys': offsets,
+        }
+        # The index is only a cache, a bad index is just ignored.
+        tmpname = '{}.{}.tmp'.format(indexname, os.getpid())
+        try:
+            with open(tmpname, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmpname, indexname)
+        except EnvironmentError as ex:
+            debug('Unable to write index: {} ({})'.format(indexname, ex))
+            with suppress(FileNotFoundError):
+                os.remove(tmpname)
+            return False
+        return True
+
+    def write_search_index(self, searchname, labels, trigrams):
+        """ Write a search index file for this list's current snapshot.
+            `labels` is a list of key labels, and `trigrams` maps each
+            trigram to the indexes of the labels that have it.
+        """
+        index = {
+            'snapshot': self.snapshot,
+            'keys': labels,
+            'trigrams': trigrams,
+        }
+        # The index is only a cache, a bad index is just ignored.
+        tmpname = '{}.{}.tmp'.format(searchname, os.getpid())
+        try:
+            with open(tmpname, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmpname, searchname)
+        except EnvironmentError as ex:
+            debug('Unable to write search index: {} ({})'.format(
+                searchname,
+                ex,
+            ))
+            with suppress(FileNotFoundError):
+                os.remove(tmpname)
+            return False
+        return True
+
+    def write_snapshot(self, filename, jsondata, offsets, jsonobj):
+        """ Write a snapshot from to_json_snapshot() to file, replacing any
+            journal that was written for the old snapshot.
+            The snapshot is written to a temporary file and then renamed
+            over the old one, so a failed save never leaves a half-written
+            todo.lst behind.
+            Nothing here reads the list's keys or items, so it can run in
+            another thread while the list changes. (see compact_journal())
+        """
+        # Only imported when it's needed, to keep startup fast.
+        import tempfile
+        # Symlinked todo.lst files are replaced at their target.
+        realname = os.path.realpath(filename)
+        dirname, basename = os.path.split(realname)
+        # Backup any existing todo.lst.
+        self.backup_file(filename=realname)
+
+        # write to file.
+        tmpname = None
+        try:
+            with timed('write'):
+                fd, tmpname = tempfile.mkstemp(
+                    prefix='.{}.'.format(basename),
+                    suffix='.tmp',
+                    dir=dirname,
+                )
+                with open(fd, 'w') as f:
+                    f.write(jsondata)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmpname, file_mode(realname))
+                os.replace(tmpname, realname)
+                fsync_dir(dirname)
+        except EnvironmentError as exwrite:
+            if tmpname is not None:
+                with suppress(FileNotFoundError):
+                    os.remove(tmpname)
+            errmsg = 'Unable to write to file: {}'.format(filename)
+            raise self.SaveError(errmsg) from exwrite
+        if filename == self.filename:
+            self.snapshot = self.snapshot_stamp(filename)
+        with timed('write indexes'):
+            self.write_index(filename, offsets, size=len(jsondata))
+            if self.cache:
+                # The next load can skip parsing the file that was just
+                # written.
+                self.write_cache(filename, jsonobj)
+
+        # The journal was written for the old snapshot.
+        with suppress(FileNotFoundError):
+            os.remove(self.journal_file(filename))
+        self.journal_stale = False
+        return True
+
+
+class TodoQuery(object):
+
+    """ A parsed find/search query, which is an item index or a regex
+        pattern/text. Queries are parsed once, and used for every key.
+        Plain text (without regex characters) is matched with a
+        case-insensitive substring search, instead of a regex.
+        TodoQuery.parse() reuses recently parsed queries.
+    """
+    # Characters that make a query a regex pattern, instead of plain text.
+    regex_chars = frozenset('.^$*+?{}[]\\|()')
+    # Recently parsed queries, by query, with the most recent last.
+    cache = OrderedDict()
+    cache_max = 128
+
+    def __init__(self, query):
+        """ Parse a query. Possibly raises TodoList.BadQueryError. """
+        if (query is None) or (query == ''):
+            raise TodoList.BadQueryError('Empty query!')
+        self.query = query
+        # Only one of these is set, depending on the query type.
+        self.index = None
+        self.text = None
+        self.pattern = None
+        try:
+            self.index = int(query)
+        except (TypeError, ValueError):
+            if isinstance(query, str) and not (self.regex_chars & set(query)):
+                self.text = query.casefold()
+            else:
+                self.pattern = self.get_pattern()
+
+    def __repr__(self):
+        return 'TodoQuery({!r})'.format(self.query)
+
+    def get_pattern(self):
+        """ Return a compiled regex pattern for this query.
+            Possibly raises TodoList.BadQueryError.
+        """
+        if self.pattern is not None:
+            return self.pattern
+        try:
+            return re.compile(self.query, re.IGNORECASE)
+        except (re.error, TypeError) as exreg:
+            errmsg = 'Invalid query: {}\n{}'.format(self.query, exreg)
+            raise TodoList.BadQueryError(errmsg)
+
+    def match_text(self, text):
+        """ Returns True if an item's text matches this text/regex query.
+            Index queries never match text.
+        """
+        if self.text is not None:
+            return self.text in text.casefold()
+        if self.pattern is not None:
+            return self.pattern.search(text) is not None
+        return False
+
+    @classmethod
+    def parse(cls, query):
+        """ Return a TodoQuery for a query, reusing one that was recently
+            parsed if possible. TodoQuerys are returned as-is.
+            Possibly raises TodoList.BadQueryError.
+        """
+        if isinstance(query, cls):
+            return query
+        try:
+            parsed = cls.cache.pop(query)
+        except KeyError:
+            parsed = cls(query)
+        except TypeError:
+            # Unhashable query, it can't be cached.
+            return cls(query)
+        cls.cache[query] = parsed
+        if len(cls.cache) > cls.cache_max:
+            cls.cache.popitem(last=False)
+        return parsed
+
+
+class TodoSQLite(object):
+
+    """ SQLite storage for a TodoList.
+        All keys are loaded with the list, but a key's items are only
+        loaded when that key is used. Changes are saved as targeted
+        queries, in one transaction per save.
+        sqlite3 is only imported by the methods that use it, to keep
+        startup fast.
+    """
+    # File extensions that are SQLite files by default.
+    extensions = ('.db', '.sqlite', '.sqlite3')
+    # The first bytes of every SQLite 3 database.
+    magic = b'SQLite format 3\x00'
+    # Connections can't be shared between threads.
+    parallel = False
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS keys (
+            id INTEGER PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE,
+            important INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY,
+            key_id INTEGER NOT NULL REFERENCES keys(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            important INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS items_position
+            ON items(key_id, position);
+        CREATE INDEX IF NOT EXISTS items_important
+            ON items(key_id, position) WHERE important;
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = None
+        # TodoKeys that were loaded from this database, by key id.
+        self.todokeys = {}
+
+    def apply_change(self, conn, change):
+        """ Apply a single change from a TodoList's change log.
+            Possibly raises TodoList.ParseError for unknown changes.
+        """
+        action, args = change[0], change[1:]
+        if action == 'clear':
+            conn.execute('DELETE FROM items')
+            conn.execute('DELETE FROM keys')
+            return None
+        if action == 'key':
+            # Parse the important marker from the label.
+            todokey = TodoKey(label=args[0])
+            keyid = self.get_key_id(conn, todokey.label, create=True)
+            conn.execute(
+                'UPDATE keys SET important = ? WHERE id = ?',
+                (todokey.important, keyid),
+            )
+            conn.execute('DELETE FROM items WHERE key_id = ?', (keyid, ))
+            self.insert_items(conn, keyid, args[1])
+            return None
+
+        keyid = self.get_key_id(conn, args[0], create=(action == 'add'))
+        if action == 'add':
+            position = conn.execute(
+                """
+                SELECT COALESCE(MAX(position) + 1, 0) FROM items
+                WHERE key_id = ?
+                """,
+                (keyid, ),
+            ).fetchone()[0]
+            self.insert_items(conn, keyid, args[1:2], start=position)
+        elif action == 'delkey':
+            conn.execute('DELETE FROM items WHERE key_id = ?', (keyid, ))
+            conn.execute('DELETE FROM keys WHERE id = ?', (keyid, ))
+        elif action == 'rename':
+            conn.execute(
+                'UPDATE keys SET label = ? WHERE id = ?',
+                (args[1], keyid),
+            )
+        elif action == 'important':
+            conn.execute(
+                """
+                UPDATE items SET important = ?
+                WHERE key_id = ? AND position = ?
+                """,
+                (args[2], keyid, args[1]),
+            )
+        elif action == 'item':
+            item = TodoItem(text=args[2])
+            conn.execute(
+                """
+                UPDATE items SET text = ?, important = ?
+                WHERE key_id = ? AND position = ?
+                """,
+                (item.text, item.important, keyid, args[1]),
+            )
+        elif action == 'keyimportant':
+            conn.execute(
+                'UPDATE keys SET important = ? WHERE id = ?',
+                (args[1], keyid),
+            )
+        elif action == 'move':
+            self.move_item(conn, keyid, args[1], args[2])
+        elif action == 'remove':
+            conn.execute(
+                'DELETE FROM items WHERE key_id = ? AND position = ?',
+                (keyid, args[1]),
+            )
+            conn.execute(
+                """
+                UPDATE items SET position = position - 1
+                WHERE key_id = ? AND position > ?
+                """,
+                (keyid, args[1]),
+            )
+        else:
+            raise TodoList.ParseError('Unknown action: {!r}'.format(action))
+        return None
+
+    def close(self):
+        """ Close the database connection, if it is open. """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def connect(self):
+        """ Return a connection to the database, creating the tables if
+            needed. Possibly raises TodoList.LoadError.
+        """
+        if self.conn is not None:
+            return self.conn
+        # Only imported when it's needed, to keep startup fast.
+        import sqlite3
+        try:
+            conn = sqlite3.connect(self.filename)
+            conn.executescript(self.schema)
+        except sqlite3.Error as ex:
+            errmsg = 'Unable to open database: {}'.format(self.filename)
+            raise TodoList.LoadError(errmsg) from ex
+        self.conn = conn
+        return self.conn
+
+    @staticmethod
+    def get_key_id(conn, label, create=False):
+        """ Return the id for a key label. If `create` is True, missing keys
+            are created. Otherwise, TodoList.BadKeyError is raised.
+        """
+        row = conn.execute(
+            'SELECT id FROM keys WHERE label = ?',
+            (label, ),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            raise TodoList.BadKeyError('No key in database:', label)
+        return conn.execute(
+            'INSERT INTO keys (label) VALUES (?)',
+            (label, ),
+        ).lastrowid
+
+    @staticmethod
+    def insert_items(conn, keyid, items, start=0):
+        """ Insert TodoItems (or their JSON strings) into a key, starting at
+            position `start`.
+        """
+        rows = []
+        for position, item in enumerate(items, start=start):
+            if not isinstance(item, TodoItem):
+                item = TodoItem(text=item)
+            rows.append((keyid, position, item.text, item.important))
+        conn.executemany(
+            """
+            INSERT INTO items (key_id, position, text, important)
+            VALUES (?, ?, ?, ?)
+            """,
+            rows,
+        )
+
+    def load(self, todolist):
+        """ Load all keys into a TodoList, as lazy keys.
+            Returns the number of keys loaded.
+        """
+        import sqlite3
+        conn = self.connect()
+        try:
+            counts = dict(conn.execute(
+                'SELECT key_id, COUNT(*) FROM items GROUP BY key_id'
+            ))
+            importants = dict(conn.execute(
+                """
+                SELECT key_id, COUNT(*) FROM items
+                WHERE important GROUP BY key_id
+                """
+            ))
+            rows = conn.execute('SELECT id, label, important FROM keys')
+            for keyid, label, important in rows:
+                todokey = TodoKey(
+                    label=label,
+                    important=bool(important),
+                    loader=functools.partial(self.load_items, keyid),
+                    size=counts.get(keyid, 0),
+                )
+                todokey.important_count = importants.get(keyid, 0)
+                todokey.changes = todolist.changes
+                todokey.todolist = todolist
+                todolist.data[todokey.label] = todokey
+                self.todokeys[keyid] = todokey
+        except sqlite3.Error as ex:
+            errmsg = 'Unable to load keys from: {}'.format(self.filename)
+            raise TodoList.LoadError(errmsg) from ex
+        return len(self.todokeys)
+
+    def load_items(self, keyid, window=None):
+        """ Load all items for a single key, in order.
+            If a `window` slice is given, only those items are loaded.
+            Returns a list of TodoItems.
+        """
+        import sqlite3
+        if window is None:
+            window = slice(0, None)
+        try:
+            rows = self.connect().execute(
+                """
+                SELECT text, important FROM items
+                WHERE key_id = ? AND position >= ? AND position < ?
+                ORDER BY position
+                """,
+                (
+                    keyid,
+                    window.start or 0,
+                    sys.maxsize if window.stop is None else window.stop,
+                ),
+            )
+            return [
+                TodoItem(text=text, important=bool(important))
+                for text, important in rows
+            ]
+        except sqlite3.Error as ex:
+            errmsg = 'Unable to load items from: {}'.format(self.filename)
+            raise TodoList.LoadError(errmsg) from ex
+
+    @staticmethod
+    def move_item(conn, keyid, index, newindex):
+        """ Move an item from one position to another in a key, shifting
+            the items in between.
+        """
+        conn.execute(
+            'UPDATE items SET position = -1 WHERE key_id = ? AND position = ?',
+            (keyid, index),
+        )
+        if newindex > index:
+            conn.execute(
+                """
+                UPDATE items SET position = position - 1
+                WHERE key_id = ? AND position > ? AND position <= ?
+                """,
+                (keyid, index, newindex),
+            )
+        else:
+            conn.execute(
+                """
+                UPDATE items SET position = position + 1
+                WHERE key_id = ? AND position >= ? AND position < ?
+                """,
+                (keyid, newindex, index),
+            )
+        conn.execute(
+            'UPDATE items SET position = ? WHERE key_id = ? AND position = -1',
+            (newindex, keyid),
+        )
+
+    def save(self, todolist):
+        """ Save the changes recorded by a TodoList in one transaction.
+            Possibly raises TodoList.SaveError.
+        """
+        import sqlite3
+        conn = self.connect()
+        try:
+            with conn:
+                for change in todolist.changes:
+                    self.apply_change(conn, change)
+        except (sqlite3.Error, TodoList.BadKeyError) as ex:
+            errmsg = 'Unable to save to: {}'.format(self.filename)
+            raise TodoList.SaveError(errmsg) from ex
+        # Items added to unloaded keys are in the database now, and will be
+        # loaded with the rest of the key's items.
+        for todokey in todolist.todokeys():
+            if todokey.pending and (not todokey.is_loaded()):
+                todokey.size += len(todokey.pending)
+                todokey.pending = []
+        return len(todolist.changes)
+
+    def search_keys(self, query):
+        """ Return the loaded TodoKeys that have saved items matching a
+            query (an index, or regex pattern/text).
+        """
+        query = TodoQuery.parse(query)
+        conn = self.connect()
+        if query.index is not None:
+            rows = conn.execute(
+                'SELECT DISTINCT key_id FROM items WHERE position = ?',
+                (query.index, ),
+            )
+        else:
+            conn.create_function('todo_match', 1, query.match_text)
+            rows = conn.execute(
+                'SELECT DISTINCT key_id FROM items WHERE todo_match(text)'
+            )
+        return [
+            self.todokeys[keyid]
+            for keyid, in rows
+            if keyid in self.todokeys
+        ]
+
+    def write(self, todolist):
+        """ Replace everything in the database with a TodoList's keys and
+            items. Possibly raises TodoList.SaveError.
+        """
+        import sqlite3
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM items')
+                conn.execute('DELETE FROM keys')
+                for todokey in todolist.todokeys():
+                    keyid = conn.execute(
+                        'INSERT INTO keys (label, important) VALUES (?, ?)',
+                        (todokey.label, todokey.important),
+                    ).lastrowid
+                    self.insert_items(conn, keyid, todokey.data)
+        except sqlite3.Error as ex:
+            errmsg = 'Unable to write to: {}'.format(self.filename)
+            raise TodoList.SaveError(errmsg) from ex
+        return todolist.get_count()
+
+
+class TodoShards(object):
+
+    """ Sharded storage for a TodoList. The list is a directory with one
+        JSON file per key, and a manifest with the key names.
+        Keys are loaded lazily, and only keys with changed items are
+        written when saving. Renaming, removing, or marking a key only
+        changes the manifest.
+    """
+    # Extensions for new sharded lists. Existing directories are always
+    # sharded lists.
+    extensions = ('.d', )
+    manifest_name = 'manifest.json'
+    # Shard files can be loaded in separate threads.
+    parallel = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Shard file names for keys that were loaded or saved,
+        # as {id(TodoKey): (TodoKey, shardname)}.
+        self.shards = {}
+        # Number used for the next shard file name.
+        self.nextshard = 0
+
+    def close(self):
+        """ Nothing to close for sharded lists. """
+        return None
+
+    def load(self, todolist):
+        """ Load all keys from the manifest into a TodoList, as lazy keys.
+            Returns the number of keys loaded.
+        """
+        manifest = self.load_manifest()
+        try:
+            for entry in manifest['keys']:
+                todokey = TodoKey(
+                    label=entry['label'],
+                    important=entry['important'],
+                    loader=functools.partial(self.load_shard, entry['file']),
+                    size=entry['count'],
+                )
+                todokey.changes = todolist.changes
+                todokey.todolist = todolist
+                todolist.data[todokey.label] = todokey
+                self.shards[id(todokey)] = (todokey, entry['file'])
+        except (KeyError, TypeError) as ex:
+            errmsg = 'Invalid manifest in: {}'.format(self.filename)
+            raise TodoList.ParseError(errmsg) from ex
+        return len(manifest['keys'])
+
+    def load_manifest(self):
+        """ Load the manifest for this list, or an empty one for new lists.
+        """
+        manifestname = os.path.join(self.filename, self.manifest_name)
+        try:
+            with open(manifestname, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {'next': 0, 'keys': []}
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read: {}'.format(manifestname)
+            raise TodoList.LoadError(errmsg) from exread
+        except ValueError as exparse:
+            errmsg = 'Unable to parse JSON from: {}'.format(manifestname)
+            raise TodoList.ParseError(errmsg) from exparse
+        self.nextshard = max(self.nextshard, manifest.get('next', 0))
+        return manifest
+
+    def load_shard(self, shardname, window=None):
+        """ Load all items from a single shard file.
+            If a `window` slice is given, only those items are returned.
+            Returns a list of TodoItems.
+        """
+        shardpath = os.path.join(self.filename, shardname)
+        try:
+            with open(shardpath, 'r') as f:
+                keyitems = json.load(f)
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read: {}'.format(shardpath)
+            raise TodoList.LoadError(errmsg) from exread
+        except ValueError as exparse:
+            errmsg = 'Unable to parse JSON from: {}'.format(shardpath)
+            raise TodoList.ParseError(errmsg) from exparse
+        if window is not None:
+            keyitems = keyitems[window]
+        return [TodoItem(text=text) for text in keyitems]
+
+    def save(self, todolist):
+        """ Write shards for keys with changed items, and the manifest. """
+        return self.write(todolist, changedonly=True)
+
+    def search_keys(self, query):
+        """ Shards can't be searched without loading them, so every loaded
+            key is a candidate.
+        """
+        return [todokey for todokey, _ in self.shards.values()]
+
+    def write(self, todolist, changedonly=False):
+        """ Write shards for a TodoList's keys, and then the manifest.
+            Shards are never rewritten. Changed keys get a new shard file,
+            and the old one is removed after the new manifest is in place.
+            Possibly raises TodoList.SaveError.
+        """
+        try:
+            os.makedirs(self.filename, exist_ok=True)
+        except EnvironmentError as ex:
+            errmsg = 'Unable to create directory: {}'.format(self.filename)
+            raise TodoList.SaveError(errmsg) from ex
+
+        shards = {}
+        entries = []
+        for todokey in todolist.todokeys():
+            known = self.shards.get(id(todokey), None)
+            if changedonly and (known is not None) and (not todokey.dirty):
+                shardname = known[1]
+            else:
+                shardname = self.write_shard(todokey)
+            shards[id(todokey)] = (todokey, shardname)
+            entries.append({
+                'label': todokey.label,
+                'important': todokey.important,
+                'count': todokey.get_count(),
+                'file': shardname,
+            })
+        entries.sort(key=lambda entry: entry['label'])
+        manifest = {'next': self.nextshard, 'keys': entries}
+        write_json_file(
+            os.path.join(self.filename, self.manifest_name),
+            manifest,
+        )
+        fsync_dir(self.filename)
+
+        # Remove shards that the new manifest doesn't use.
+        used = {shardname for _, shardname in shards.values()}
+        for _, shardname in self.shards.values():
+            if shardname not in used:
+                debug('Removing old shard: {}'.format(shardname))
+                with suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.filename, shardname))
+        self.shards = shards
+        return todolist.get_count()
+
+    def write_shard(self, todokey):
+        """ Write a key's items to a new shard file.
+            Returns the new shard file name.
+        """
+        shardname = '{:08d}.json'.format(self.nextshard)
+        self.nextshard += 1
+        debug('Writing shard for {}: {}'.format(todokey.label, shardname))
+        write_json_file(
+            os.path.join(self.filename, shardname),
+            [item.to_json() for item in todokey.data],
+        )
+        return shardname
+
+
+class TodoStream(object):
+
+    """ Reads a JSON todo list from a memory-mapped file, one item at a
+        time, without parsing the whole file or building every TodoItem.
+        Used for commands that only read big lists (see TodoList.stream).
+        Only the brackets are checked while scanning, items are decoded
+        when they are read.
+    """
+    # A JSON string, bracket, or other value (number, true, null), after
+    # any commas, colons, and whitespace.
+    token_pat = re.compile(
+        rb'[\s,:]*("[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]|[^\s,:\[\]{}"]+)',
+        flags=re.DOTALL,
+    )
+    # Runs of JSON strings, so lists of items can be counted a piece at a
+    # time instead of one item at a time.
+    strings_pat = re.compile(
+        rb'(?:[\s,]*"[^"\\]*(?:\\.[^"\\]*)*"){1,10000}',
+        flags=re.DOTALL,
+    )
+    escape_pat = re.compile(rb'\\.', flags=re.DOTALL)
+    # Trailing commas, colons, and whitespace.
+    end_pat = re.compile(rb'[\s,:]*\Z')
+    opening = (b'[', b'{')
+    closing = (b']', b'}')
+
+    def __init__(self, filename):
+        # Only imported when it's needed, to keep startup fast.
+        import mmap
+        self.filename = filename
+        try:
+            with open(filename, 'rb') as f:
+                # Stamp for the mapped file, like TodoList.snapshot_stamp().
+                self.stamp = TodoList.snapshot_stamp(f.fileno())
+                if self.stamp[1]:
+                    self.mm = mmap.mmap(
+                        f.fileno(),
+                        0,
+                        access=mmap.ACCESS_READ,
+                    )
+                else:
+                    # Empty files can't be mapped.
+                    self.mm = b''
+        except EnvironmentError as exread:
+            errmsg = 'Unable to read: {}'.format(filename)
+            raise TodoList.LoadError(errmsg) from exread
+
+    def close(self):
+        """ Close the memory-mapped file. """
+        if not isinstance(self.mm, bytes):
+            self.mm.close()
+
+    def count_strings(self, text):
+        """ Count the JSON strings in a run of strings from strings_pat. """
+        quotes = text.count(b'"')
+        if b'\\' in text:
+            # Escaped quotes are part of a string.
+            quotes -= self.escape_pat.findall(text).count(b'\\"')
+        return quotes // 2
+
+    @staticmethod
+    def decode(token):
+        """ Decode a JSON string, or other value, from a token. """
+        if token.startswith(b'"') and (b'\\' not in token):
+            # Plain strings don't need the JSON decoder.
+            return token[1:-1].decode('utf-8')
+        return json.loads(token.decode('utf-8'))
+
+    @staticmethod
+    def decode_strings(text):
+        """ Decode a run of JSON strings from strings_pat, as a list. """
+        return json.loads(
+            b''.join((b'[', text.lstrip(b' \t\n\r,'), b']')).decode('utf-8')
+        )
+
+    def iter_items(self, start, end, window=None):
+        """ Yields TodoItems for a single key, from the `start` and `end`
+            offsets of it's JSON value (see keys()).
+            If a `window` slice is given, only those items are built.
+        """
+        texts = self.iter_texts(start, end)
+        if window is not None:
+            texts = itertools.islice(texts, window.start, window.stop)
+        try:
+            for text in texts:
+                yield TodoItem(text=str(text))
+        except ValueError as exparse:
+            errmsg = 'Unable to parse key from: {}'.format(self.filename)
+            raise TodoList.ParseError(errmsg) from exparse
+
+    def iter_texts(self, start, end):
+        """ Yields decoded JSON values for a single key's items, from the
+            `start` and `end` offsets of it's JSON value.
+            Keys in the old {index: item} format are sorted by index first,
+            like TodoList.load_data() does.
+        """
+        first = self.token_pat.match(self.mm, start, end)
+        if (first is None) or (first.group(1) not in self.opening):
+            # Not a list of items.
+            return
+        olddict = first.group(1) == b'{'
+        values = []
+        pos = first.end()
+        while True:
+            if not olddict:
+                strings = self.strings_pat.match(self.mm, pos, end)
+                if strings is not None:
+                    # Runs of items are decoded all at once.
+                    yield from self.decode_strings(strings.group())
+                    pos = strings.end()
+                    continue
+            match = self.token_pat.match(self.mm, pos, end)
+            if match is None:
+                raise ValueError('Expecting {!r}.'.format(
+                    '}' if olddict else ']'
+                ))
+            token = match.group(1)
+            if token in self.closing:
+                break
+            if token in self.opening:
+                # Nested values are decoded whole.
+                valuestart, pos, _ = self.skip_value(match.start(1))
+                value = json.loads(self.mm[valuestart:pos].decode('utf-8'))
+            else:
+                value = self.decode(token)
+                pos = match.end()
+            if olddict:
+                values.append(value)
+            else:
+                yield value
+        if olddict:
+            keyitems = dict(zip(values[::2], values[1::2]))
+            for itemkey in sorted(keyitems):
+                yield keyitems[itemkey]
+
+    def keys(self):
+        """ Scan the file for keys, without decoding any items.
+            Returns {jsonkey: [start, end, count]}, like
+            TodoList.load_index().
+            Possibly raises TodoList.ParseError.
+        """
+        keys = {}
+        try:
+            first = self.next_token(0)
+            if first is None:
+                # Empty files are just empty lists.
+                return keys
+            if first.group(1) == b'[':
+                # Old todo data, a single list of items.
+                start, pos, count = self.skip_value(0)
+                keys[TodoKey.null] = [start, pos, count]
+            elif first.group(1) == b'{':
+                pos = first.end()
+                while True:
+                    match = self.next_token(pos)
+                    if match is None:
+                        raise ValueError('Expecting \'}\'.')
+                    token = match.group(1)
+                    pos = match.end()
+                    if token == b'}':
+                        break
+                    if not token.startswith(b'"'):
+                        raise ValueError('Expecting a key name.')
+                    start, pos, count = self.skip_value(pos)
+                    keys[self.decode(token)] = [start, pos, count]
+            else:
+                raise ValueError('Expecting \'{\' or \'[\'.')
+            if self.next_token(pos) is not None:
+                raise ValueError('Extra data after the list.')
+        except ValueError as exparse:
+            errmsg = 'Unable to parse JSON from: {}'.format(self.filename)
+            raise TodoList.ParseError(errmsg) from exparse
+        return keys
+
+    def load_items(self, start, end, window=None):
+        """ Loader for streamed TodoKeys.
+            Returns a list of all items, or an iterator over the items in a
+            `window` slice, so they are read one at a time.
+        """
+        items = self.iter_items(start, end, window=window)
+        return list(items) if window is None else items
+
+    def next_token(self, pos):
+        """ Return the token match at `pos`, or None at the end of the file.
+            Possibly raises ValueError.
+        """
+        match = self.token_pat.match(self.mm, pos)
+        if (match is None) and (self.end_pat.match(self.mm, pos) is None):
+            raise ValueError('Invalid JSON at: {}'.format(pos))
+        return match
+
+    def skip_value(self, pos):
+        """ Skip over the JSON value at `pos`, without decoding it.
+            Returns (start, end, count), where count is the number of items
+            in a list or dict (or 0 for other values).
+            Possibly raises ValueError.
+        """
+        first = self.next_token(pos)
+        if first is None:
+            raise ValueError('Expecting a value.')
+        token = first.group(1)
+        if token in self.closing:
+            raise ValueError('Unexpected {!r}.'.format(token.decode()))
+        if token not in self.opening:
+            return first.start(1), first.end(), 0
+        olddict = token == b'{'
+        depth = 1
+        count = 0
+        pos = first.end()
+        while True:
+            if (depth == 1) and (not olddict):
+                strings = self.strings_pat.match(self.mm, pos)
+                if strings is not None:
+                    count += self.count_strings(strings.group())
+                    pos = strings.end()
+                    continue
+            match = self.next_token(pos)
+            if match is None:
+                raise ValueError('Expecting {!r}.'.format(
+                    '}' if olddict else ']'
+                ))
+            token = match.group(1)
+            pos = match.end()
+            if token in self.opening:
+                if depth == 1:
+                    count += 1
+                depth += 1
+            elif token in self.closing:
+                depth -= 1
+                if depth == 0:
+                    if olddict:
+                        # Indexes in the old {index: item} format were
+                        # counted too.
+                        count //= 2
+                    return first.start(1), pos, count
+            elif depth == 1:
+                count += 1
+
 
 # Start of script ---------------------------------------------------
 if __name__ == '__main__':
+    # Parts of the run are timed, for debug mode and --timings.
+    TIMINGS = []
+    starttime = time.perf_counter()
     # Disable colors when piping output.
     colr_auto_disable()
 
-    mainret = main(docopt(USAGESTR, version=VERSIONSTR, script=SCRIPT))
+    # Send the command to a running server, when one is configured.
+    if os.environ.get('TODO_SOCKET', None) and ('--server' not in sys.argv):
+        mainret = run_client(sys.argv[1:], os.environ['TODO_SOCKET'])
+        if mainret is not NOSERVER:
+            sys.exit(mainret)
+
+    # Common commands skip docopt.
+    with timed('parse args'):
+        argd = parse_fast_args(sys.argv[1:])
+        if argd is None:
+            argd = docopt(get_usage(), version=VERSIONSTR, script=SCRIPT)
+    mainret = main(argd)
+    if DEBUG or argd['--timings']:
+        printtimings(
+            time.perf_counter() - starttime,
+            argd,
+            table=DEBUG,
+            filename=argd['--timings'],
+        )
     sys.exit(mainret)